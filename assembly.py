@@ -1,3 +1,23 @@
+import argparse
+import bisect
+import glob
+import os
+import json
+import re
+import shutil
+import sys
+import time
+from array import array
+from collections import Counter, deque
+from enum import IntEnum
+
+from parse_tables import (DECLARATION_LIST_PRIME, EXPRESSION_PRIME, FACTOR, FUNCTION_DEFINITIONS_PRIME, IDS_PRIME, IF_TAIL,
+                          OPT_DECLARATION_LIST, OPT_FUNCTION_DEFINITIONS, OPT_PARAMETER_LIST, PARAMETER_LIST_PRIME, PRIMARY,
+                          PRIMARY_TAIL, QUALIFIER, RELOP, RETURN_TAIL, STATEMENT, TERM_PRIME)
+
+# Changes whenever the generated code does, so cached output is not reused
+COMPILER_VERSION = '1.4'
+
 # Define token types
 KEYWORD = 'keyword'
 IDENTIFIER = 'identifier'
@@ -12,16 +32,180 @@ INVALID = 'invalid'
 keywords = {'integer', 'bool', 'if', 'ret', 'while', 'else', 'endif', 'get', 'true', 'false', 'real', 'put'}
 operators = {'<', '>', '=', '!', '+', '-', '*', '/'}
 long_operators = {'<=', '==', '!=', '=>', '+-'}
-relational_operators = {'<=', '==', '!=', '=>', '<', '>'}
 separators = {'#', '{', '}', ';', ',', '(', ')'}
 
+# Binary operators of <Expression> and <Term>, by precedence
+binary_operator_precedence = {'+': 1, '-': 1, '*': 2, '/': 2}
+
+# Lexer engines. 'fsm' walks the source one character at a time, 'regex' runs a
+# single precompiled master pattern and classifies each lexeme with a table
+# lookup, and 'compact' runs the same pattern but keeps the tokens in a
+# TokenStore. All produce identical token streams, so they can be A/B tested.
+LEXER_ENGINES = ('compact', 'fsm', 'regex')
+DEFAULT_LEXER_ENGINE = 'regex'
+
+def build_lexer_pattern(space, alpha, digit, alnum):
+    # The arguments are character class bodies. Whitespace and comments are
+    # swallowed by an atomic prefix so each match is exactly one lexeme, and the
+    # alternatives are listed in the same order lexer_fsm checks them. A comment
+    # that is never closed comes out as a lexeme starting with '[*'.
+    number = digit + alpha
+    return re.compile(
+        r'(?>(?:[' + space + r']+|\[\*.*?\*\])*)('
+        r'\[\*.*'
+        r'|<=|==|!=|=>|\+-|[<>=!+\-*/#{};,()]'
+        r'|[' + alpha + r'][' + alnum + r']*'
+        r'|[' + digit + r'][' + number + r']*(?:\.[' + number + r']*)?'
+        r'|\.[' + digit + r'.]*'
+        r'|.|\Z)',
+        re.DOTALL)
+
+# str.isspace() also accepts the ASCII separator controls \x1c-\x1f
+ascii_lexer_pattern = build_lexer_pattern(r' \t\n\r\x0b\x0c\x1c-\x1f', 'A-Za-z', '0-9', 'A-Za-z0-9')
+unicode_lexer_pattern = None
+
+def get_unicode_lexer_pattern():
+    # Character classes matching str.isspace/isalpha/isdigit/isalnum exactly.
+    # Scanning every code point takes a moment, so it only happens the first
+    # time a non-ASCII source is tokenized.
+    global unicode_lexer_pattern
+    if unicode_lexer_pattern is None:
+        predicates = (str.isspace, str.isalpha, str.isdigit, str.isalnum)
+        ranges = [[] for _ in predicates]
+        for code_point in range(0x110000):
+            char = chr(code_point)
+            for predicate, spans in zip(predicates, ranges):
+                if predicate(char):
+                    if spans and spans[-1][1] == code_point - 1:
+                        spans[-1][1] = code_point
+                    else:
+                        spans.append([code_point, code_point])
+        classes = []
+        for spans in ranges:
+            parts = []
+            for first, last in spans:
+                parts.append(re.escape(chr(first)))
+                if last != first:
+                    parts.append('-' + re.escape(chr(last)))
+            classes.append(''.join(parts))
+        unicode_lexer_pattern = build_lexer_pattern(*classes)
+    return unicode_lexer_pattern
+
+def select_lexer_pattern(input_string):
+    if input_string.isascii():
+        return ascii_lexer_pattern
+    return get_unicode_lexer_pattern()
+
+# Lexemes whose token never depends on context
+fixed_lexeme_tokens = {lexeme: (KEYWORD, lexeme) for lexeme in keywords}
+fixed_lexeme_tokens.update({lexeme: (OPERATOR, lexeme) for lexeme in operators | long_operators})
+fixed_lexeme_tokens.update({lexeme: (SEPARATOR, lexeme) for lexeme in separators})
+
+def classify_lexeme(lexeme):
+    # Token type of a lexeme matched by the master pattern that is not a
+    # keyword, operator or separator, following the branches of lexer_fsm
+    first = lexeme[0]
+    if first.isalpha():
+        return INVALID if lexeme[-1].isdigit() else IDENTIFIER
+    if not lexeme.isascii():
+        # Only 0-9 make a number; int() cannot read digits such as superscripts
+        return INVALID
+    if lexeme.isdigit():
+        return INTEGER
+    if first.isdigit() and lexeme[-1] != '.' and lexeme.replace('.', '', 1).isdigit():
+        return REAL
+    return INVALID
+
+# Streaming mode reads the source in chunks of this many characters
+STREAM_CHUNK_SIZE = 1 << 16
+# Distinct lexemes remembered by the streaming lexer before its cache is reset
+STREAM_LEXEME_CACHE_SIZE = 1 << 14
+
+EOF_TOKEN = ('EOF', 'EOF')
+
+# Token codes for compact storage: one code per fixed lexeme, whose token can be
+# rebuilt from the code alone, then one per open-ended token type
+token_code_tuples = sorted(fixed_lexeme_tokens.values())
+token_code_types = [token[0] for token in token_code_tuples]
+fixed_token_codes = {token[1]: code for code, token in enumerate(token_code_tuples)}
+open_token_types = (IDENTIFIER, INTEGER, REAL, INVALID)
+open_token_codes = {token_type: len(token_code_tuples) + offset for offset, token_type in enumerate(open_token_types)}
+token_code_tuples.extend(None for _ in open_token_types)
+token_code_types.extend(open_token_types)
+
+class TokenStore:
+    # Compact token list: a type code per token in an array('B') and the token's
+    # start/end offsets into the source in array('I'), about 9 bytes a token
+    # whatever the tokens are. Indexing rebuilds the (type, lexeme) tuple, so it
+    # stands in for a list of tokens; identifier lexemes are interned as they
+    # are handed out. The regex engine's list shares one tuple per distinct
+    # lexeme, which costs about the same on typical sources and parses faster,
+    # so this only pays off on sources with many distinct lexemes.
+
+    def __init__(self, input_string):
+        self.source = input_string
+        self.codes = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+
+        add_code = self.codes.append
+        add_start = self.starts.append
+        add_end = self.ends.append
+        # Lexemes already classified, reset like the streaming lexer's cache so
+        # it does not grow with the number of distinct lexemes
+        codes = dict(fixed_token_codes)
+        for match in select_lexer_pattern(input_string).finditer(input_string):
+            lexeme = match.group(1)
+            code = codes.get(lexeme)
+            if code is None:
+                if not lexeme or lexeme.startswith('[*'):
+                    continue  # End of input or an unterminated comment
+                if len(codes) > STREAM_LEXEME_CACHE_SIZE:
+                    codes = dict(fixed_token_codes)
+                code = codes[lexeme] = open_token_codes[classify_lexeme(lexeme)]
+            start, end = match.span(1)
+            add_code(code)
+            add_start(start)
+            add_end(end)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.codes)))]
+        code = self.codes[index]
+        token = token_code_tuples[code]
+        if token is None:
+            token_type = token_code_types[code]
+            lexeme = self.source[self.starts[index]:self.ends[index]]
+            if token_type == IDENTIFIER:
+                lexeme = sys.intern(lexeme)
+            token = (token_type, lexeme)
+        return token
+
+    def __iter__(self):
+        for index in range(len(self.codes)):
+            yield self[index]
+
 class Lexer:
 
     
 
-    def __init__(self):
+    def __init__(self, engine=DEFAULT_LEXER_ENGINE, positions=False):
+        # With positions, tokenize also fills offsets with the source offset of
+        # each token, which the parser needs to say where errors are
+        if engine not in LEXER_ENGINES:
+            raise Exception(f"Unknown lexer engine: {engine}")
+        if positions and engine == 'fsm':
+            raise Exception("Token positions require the regex or compact lexer engine")
+        self.engine = engine
+        self.positions = positions
         self.tokens = []
+        self.offsets = None
         self.index = -1
+        self.stream = None
+        self.lookahead = deque()
 
     def lexer_fsm(self, input_string):
         tokens = []
@@ -93,7 +277,7 @@ class Lexer:
                         in_number = False
                     current_token += input_string[i]
                     i += 1
-                if not in_number or (in_real and current_token.endswith('.')):
+                if not in_number or not current_token.isascii() or (in_real and current_token.endswith('.')):
                     tokens.append((INVALID, current_token))
                 elif in_real:
                     tokens.append((REAL, current_token))
@@ -116,74 +300,666 @@ class Lexer:
 
         self.tokens = tokens
 
+    def lexer_regex(self, input_string):
+        pattern = select_lexer_pattern(input_string)
+        if self.positions:
+            lexemes = []
+            offsets = array('I')
+            for match in pattern.finditer(input_string):
+                lexemes.append(match.group(1))
+                offsets.append(match.start(1))
+        else:
+            lexemes = pattern.findall(input_string)
+        while lexemes and not lexemes[-1]:
+            lexemes.pop()  # Empty matches at the end of the input
+        if lexemes and lexemes[-1].startswith('[*'):
+            lexemes.pop()  # Unterminated comment
+        if self.positions:
+            del offsets[len(lexemes):]
+            self.offsets = offsets
+
+        # Repeated lexemes share one token tuple
+        known_tokens = dict(fixed_lexeme_tokens)
+        get_token = known_tokens.get
+        tokens = []
+        append = tokens.append
+        for lexeme in lexemes:
+            token = get_token(lexeme)
+            if token is None:
+                token = known_tokens[lexeme] = (classify_lexeme(lexeme), lexeme)
+            append(token)
+
+        self.tokens = tokens
+
+    def stream_tokens(self, input_file, chunk_size):
+        # Generator over the tokens of a text file read chunk by chunk. Each
+        # buffer is cut after its last whitespace character: no token spans
+        # whitespace, so everything before the cut lexes exactly as it would in
+        # the whole file, except a comment that is still open at the cut.
+        pattern = ascii_lexer_pattern
+        known_tokens = dict(fixed_lexeme_tokens)
+        carry = ''
+        at_end = False
+
+        while not at_end:
+            chunk = input_file.read(chunk_size)
+            at_end = not chunk
+            if not chunk.isascii():
+                pattern = get_unicode_lexer_pattern()
+            buffer = carry + chunk if carry else chunk
+            carry = ''
+            if not at_end:
+                cut = max(buffer.rfind('\n'), buffer.rfind(' '), buffer.rfind('\t')) + 1
+                if not cut:
+                    carry = buffer
+                    continue
+                carry = buffer[cut:]
+                buffer = buffer[:cut]
+
+            lexemes = pattern.findall(buffer)
+            while lexemes and not lexemes[-1]:
+                lexemes.pop()
+            if lexemes and lexemes[-1].startswith('[*'):
+                # Keep the comment open without holding on to its text
+                lexemes.pop()
+                carry = '[*' + carry
+
+            if len(known_tokens) > STREAM_LEXEME_CACHE_SIZE:
+                known_tokens = dict(fixed_lexeme_tokens)
+            get_token = known_tokens.get
+            tokens = []
+            append = tokens.append
+            for lexeme in lexemes:
+                token = get_token(lexeme)
+                if token is None:
+                    token = known_tokens[lexeme] = (classify_lexeme(lexeme), lexeme)
+                append(token)
+            yield from tokens
+
+    def tokenize_stream(self, input_file, chunk_size=STREAM_CHUNK_SIZE):
+        # Streaming mode: tokens are produced on demand by next_token/peek and
+        # only the lookahead buffer is kept, so memory does not grow with the
+        # size of the file. Uses the regex engine's master pattern.
+        if self.engine != 'regex':
+            raise Exception("Streaming requires the regex lexer engine")
+        self.tokens = []
+        self.index = -1
+        self.lookahead.clear()
+        self.stream = self.stream_tokens(input_file, chunk_size)
+
     def tokenize(self, input_string):
         # Clears previous tokens and processes the new input string
         self.tokens = []  # Clear any existing tokens
         self.index = -1   # Reset index
-        self.lexer_fsm(input_string)  # Process the input string to tokenize it
+        self.stream = None
+        self.offsets = None
+        self.lookahead.clear()
+        # Process the input string to tokenize it
+        if self.engine == 'compact':
+            self.tokens = TokenStore(input_string)
+            if self.positions:
+                self.offsets = self.tokens.starts
+        elif self.engine == 'fsm':
+            self.lexer_fsm(input_string)
+        else:
+            self.lexer_regex(input_string)
+
+    def use_tokens(self, tokens, offsets=None):
+        # Hands the lexer an already tokenized stream, e.g. part of a file
+        self.tokens = tokens
+        self.offsets = offsets
+        self.index = -1
+        self.stream = None
+        self.lookahead.clear()
 
     def next_token(self):
         self.index += 1
+        if self.stream is not None:
+            if self.lookahead:
+                return self.lookahead.popleft()
+            return next(self.stream, EOF_TOKEN)
         if self.index < len(self.tokens):
             return self.tokens[self.index]
         else:
-            return ('EOF', 'EOF')  # End of file/token stream
+            return EOF_TOKEN  # End of file/token stream
 
     def peek(self):
+        if self.stream is not None:
+            if not self.lookahead:
+                self.lookahead.append(next(self.stream, EOF_TOKEN))
+            return self.lookahead[0]
         next_index = self.index + 1
         if next_index < len(self.tokens):
             return self.tokens[next_index]
         else:
-            return ('EOF', 'EOF')  # End of file/token stream
+            return EOF_TOKEN  # End of file/token stream
         
 
+class CompileError(Exception):
+    # An error found in the source, with the 1-based line and column it is at
+    def __init__(self, message, line, column):
+        super().__init__(message)
+        self.message = message
+        self.line = line
+        self.column = column
+
+    def __str__(self):
+        return f"line {self.line}, column {self.column}: {self.message}"
+
+class CompileErrors(Exception):
+    # Every error a recovering parse found, in source order
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} errors")
+        self.errors = errors
+
+    def __str__(self):
+        return '\n'.join(str(error) for error in self.errors)
+
+class SymbolError(Exception):
+    pass
+
+class SyntaxRecovery(Exception):
+    # Unwinds a recovering parser to the nearest point it can resynchronize at
+    pass
+
+# Lexemes a recovering parser skips ahead to after a syntax error
+synchronizing_lexemes = {';', '}', 'endif', '#'}
+
+# First memory address handed out to a variable
+MEMORY_BASE = 7000
+
 class SymbolTableEntry:
-    def __init__(self, lexeme, memory_address):
+    __slots__ = ('lexeme', 'memory_address', 'type')
+
+    def __init__(self, lexeme, memory_address, type=None):
         self.lexeme = lexeme
         self.memory_address = memory_address
+        self.type = type  # 'integer', 'bool' or 'real'; None until its qualifier is seen
 
 class SymbolTable:
+    # Nested scopes over one name -> entry stack map, so a lookup is a single
+    # dict access however deep the scopes go. The outermost scope holds the
+    # globals; each function gets a scope of its own whose addresses form a
+    # frame starting at the next free global address. Frames are handed out
+    # again once their function ends, and globals declared after a function
+    # start above the highest address any frame used.
     def __init__(self):
-        self.table = {}
-        self.memory_address = 7000
-        
-
-    def add_identifier(self, lexeme):
-        if lexeme in self.table:
-            raise Exception(f"Duplicate identifier declared: {lexeme}")
-        self.table[lexeme] = SymbolTableEntry(lexeme, self.memory_address)
+        self.bindings = {}      # Name -> entries visible under it, innermost last
+        self.scopes = [{}]      # Name -> entry for each open scope, innermost last
+        self.frames = []        # Global next address saved by each open function scope
+        self.entries = []       # Every entry ever declared, in declaration order
+        self.memory_address = MEMORY_BASE
+        self.high_water = MEMORY_BASE
+        self.lookups = 0  # For profiling; bumped by check_identifier and lookup
+
+    @property
+    def table(self):
+        # Names visible in the current scope
+        return {lexeme: entries[-1] for lexeme, entries in self.bindings.items()}
+
+    def enter_function(self):
+        self.frames.append(self.memory_address)
+        self.scopes.append({})
+
+    def exit_function(self):
+        for lexeme in self.scopes.pop():
+            entries = self.bindings[lexeme]
+            entries.pop()
+            if not entries:
+                del self.bindings[lexeme]
+        self.high_water = max(self.high_water, self.memory_address)
+        self.memory_address = self.frames.pop()
+
+    def add_identifier(self, lexeme, type=None):
+        scope = self.scopes[-1]
+        if lexeme in scope:
+            raise SymbolError(f"Duplicate identifier declared: {lexeme}")
+        if not self.frames:
+            self.memory_address = max(self.memory_address, self.high_water)
+        lexeme = sys.intern(lexeme)
+        entry = SymbolTableEntry(lexeme, self.memory_address, type)
         self.memory_address += 1
+        scope[lexeme] = entry
+        self.bindings.setdefault(lexeme, []).append(entry)
+        self.entries.append(entry)
+        return entry
+
+    def temporary(self, count=1):
+        # The first of count consecutive addresses no identifier is given, for
+        # values the generated code keeps aside; in a function they are part
+        # of its frame
+        if not self.frames:
+            self.memory_address = max(self.memory_address, self.high_water)
+        address = self.memory_address
+        self.memory_address += count
+        return address
 
     def check_identifier(self, lexeme):
-        if lexeme not in self.table:
-            raise Exception(f"Undeclared identifier used: {lexeme}")
+        self.lookups += 1
+        if lexeme not in self.bindings:
+            raise SymbolError(f"Undeclared identifier used: {lexeme}")
+
+    def lookup(self, lexeme):
+        self.lookups += 1
+        entries = self.bindings.get(lexeme)
+        if entries is None:
+            raise SymbolError(f"Undeclared identifier used: {lexeme}")
+        return entries[-1]
+
+    def address_of(self, lexeme):
+        return self.lookup(lexeme).memory_address
         
     def print_symbol_table(self):
         print("Symbol Table Contents:")
-        for lexeme, entry in self.table.items():
-            print(f"Identifier: {lexeme}, Memory Address: {entry.memory_address}")
+        for entry in self.entries:
+            print(f"Identifier: {entry.lexeme}, Memory Address: {entry.memory_address}")
+
+
+
+# Instruction set of the generated stack machine code
+class Op(IntEnum):
+    PUSHI = 1
+    PUSHM = 2
+    POPM = 3
+    STDOUT = 4
+    STDIN = 5
+    ADD = 6
+    SUB = 7
+    MUL = 8
+    DIV = 9
+    GRT = 10
+    LES = 11
+    EQU = 12
+    NEQ = 13
+    GEQ = 14
+    LEQ = 15
+    JUMPZ = 16
+    JUMP = 17
+    LABEL = 18
+    CALL = 19
+    RET = 20
+
+opcode_names = {op.value: op.name for op in Op}
+operand_opcodes = {Op.PUSHI, Op.PUSHM, Op.POPM, Op.JUMPZ, Op.JUMP, Op.CALL}
+# Instructions whose operand is an instruction index
+jump_opcodes = {Op.JUMPZ, Op.JUMP, Op.CALL}
+memory_opcodes = {Op.PUSHM, Op.POPM}
+# (values popped, values pushed) by each instruction
+stack_effects = {
+    Op.PUSHI: (0, 1), Op.PUSHM: (0, 1), Op.POPM: (1, 0), Op.STDOUT: (1, 0), Op.STDIN: (0, 1),
+    Op.ADD: (2, 1), Op.SUB: (2, 1), Op.MUL: (2, 1), Op.DIV: (2, 1),
+    Op.GRT: (2, 1), Op.LES: (2, 1), Op.EQU: (2, 1), Op.NEQ: (2, 1), Op.GEQ: (2, 1), Op.LEQ: (2, 1),
+    Op.JUMPZ: (1, 0), Op.JUMP: (0, 0), Op.LABEL: (0, 0),
+    # The value a function leaves is counted as pushed by its CALL
+    Op.CALL: (0, 1), Op.RET: (0, 0),
+}
+
+binary_operator_opcodes = {'+': Op.ADD, '-': Op.SUB, '*': Op.MUL, '/': Op.DIV}
+relational_operator_opcodes = {'==': Op.EQU, '!=': Op.NEQ, '>': Op.GRT, '<': Op.LES, '<=': Op.LEQ, '=>': Op.GEQ}
+
+class Label:
+    # A jump target; address is the instruction index it was bound to
+    __slots__ = ('address',)
+
+    def __init__(self):
+        self.address = None
+
+# Largest operand an instruction can hold, and so the largest integer literal
+MAX_OPERAND = (1 << 63) - 1
+
+class Code:
+    # Generated instructions as parallel arrays of opcodes and integer operands
+    # (0 for instructions without one). A jump to a label that is not bound yet
+    # is recorded as a fixup, and resolve() patches every fixup in one pass.
+    def __init__(self):
+        self.opcodes = array('B')
+        self.operands = array('q')
+        self.fixups = []
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    def emit(self, opcode, operand=0):
+        self.opcodes.append(opcode)
+        self.operands.append(operand)
+        return len(self.opcodes) - 1
+
+    def emit_jump(self, opcode, label):
+        index = self.emit(opcode, 0 if label.address is None else label.address)
+        if label.address is None:
+            self.fixups.append((index, label))
+        return index
+
+    def bind(self, label):
+        label.address = len(self.opcodes)
+
+    def resolve(self):
+        for index, label in self.fixups:
+            if label.address is None:
+                raise Exception(f"Unbound jump target at instruction {index}")
+            self.operands[index] = label.address
+        self.fixups = []
+
+    def hold(self, index, limit=0):
+        # Everything is kept here; see StreamingCode.hold
+        pass
+
+    def tail(self, start):
+        # Copies of the opcodes and operands from instruction start on, the
+        # jumps among them to labels bound by now patched
+        operands = self.operands[start:]
+        for index, label in reversed(self.fixups):  # in instruction order
+            if index < start:
+                break
+            if label.address is not None:
+                operands[index - start] = label.address
+        return self.opcodes[start:], operands
+
+    def format_instruction(self, index):
+        return instruction_text(self.opcodes[index], self.operands[index])
+
+    def listing(self):
+        # The text assembly format: one "index: OPCODE operand" line per instruction
+        for index in range(len(self.opcodes)):
+            yield f"{index}: {self.format_instruction(index)}"
+
+def instruction_text(opcode, operand):
+    if opcode in operand_opcodes:
+        return f"{opcode_names[opcode]} {operand}"
+    return opcode_names[opcode]
+
+# Instructions StreamingCode holds before it tries to write them out
+STREAM_FLUSH_INSTRUCTIONS = 4096
+
+class StreamingCode(Code):
+    # Code that hands instructions to a writer (ListingWriter below, or
+    # objfile.ObjectWriter) while the program is still being parsed. Only the
+    # instructions not written yet are held, from index base on, so there is
+    # no listing to read back afterwards.
+    #
+    # A jump to a label that is not bound yet stays in fixups until bind()
+    # patches it: in place while it is still held, and through the writer once
+    # it has been written. The writer is told which of the instructions it is
+    # given are such open jumps, so it can leave room to patch them; only
+    # those, one or two per enclosing if or while, are kept here.
+    def __init__(self, writer):
+        super().__init__()
+        self.writer = writer
+        self.base = 0
+        self.flush_at = STREAM_FLUSH_INSTRUCTIONS
+        self.held = None
+        self.hold_limit = 0
+
+    def __len__(self):
+        return self.base + len(self.opcodes)
+
+    def emit(self, opcode, operand=0):
+        # Flushing before the append means a jump is in fixups by the next flush
+        if len(self.opcodes) >= self.flush_at:
+            self.flush()
+        self.opcodes.append(opcode)
+        self.operands.append(operand)
+        return self.base + len(self.opcodes) - 1
+
+    def bind(self, label):
+        label.address = len(self)
+        if self.fixups:
+            pending = []
+            for index, target in self.fixups:
+                if target is not label:
+                    pending.append((index, target))
+                elif index >= self.base:
+                    self.operands[index - self.base] = label.address
+                else:
+                    self.writer.patch(index, label.address)
+            self.fixups = pending
+
+    def flush(self):
+        # Writes out everything hold() does not keep back
+        end = len(self.opcodes)
+        if self.held is not None:
+            if len(self) - self.held > self.hold_limit:
+                self.held = None
+            else:
+                end = min(end, self.held - self.base)
+        if end:
+            open_jumps = [index for index, _ in self.fixups if index < self.base + end]
+            self.writer.write(self.opcodes[:end], self.operands[:end], open_jumps)
+            del self.opcodes[:end]
+            del self.operands[:end]
+            self.base += end
+        self.flush_at = len(self.opcodes) + STREAM_FLUSH_INSTRUCTIONS
+
+    def resolve(self):
+        # bind() has patched every jump to a bound label already
+        for index, label in self.fixups:
+            raise Exception(f"Unbound jump target at instruction {index}")
+        self.flush()
+
+    def hold(self, index, limit=0):
+        # Keeps the instructions from index on for tail() as long as there are
+        # no more than limit of them; hold(None) lets them go
+        self.held = index
+        self.hold_limit = limit
+
+    def tail(self, start):
+        return self.opcodes[start - self.base:], self.operands[start - self.base:]
+
+# Rule trace levels. With TRACE_OFF the grammar methods skip output_rule
+# entirely; TRACE_TOKENS also records the token each rule was applied at.
+TRACE_OFF = 0
+TRACE_RULES = 1
+TRACE_TOKENS = 2
+TRACE_LEVELS = {'off': TRACE_OFF, 'rules': TRACE_RULES, 'tokens': TRACE_TOKENS}
+
+class TraceSink:
+    # Receives trace lines and writes them to a text stream in batches
+    def __init__(self, stream, batch_lines=4096):
+        self.stream = stream
+        self.batch_lines = batch_lines
+        self.lines = []
+
+    def write(self, line):
+        self.lines.append(line)
+        if len(self.lines) >= self.batch_lines:
+            self.flush()
+
+    def flush(self):
+        if self.lines:
+            self.lines.append('')
+            self.stream.write('\n'.join(self.lines))
+            self.lines = []
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+
+class FileTraceSink(TraceSink):
+    def __init__(self, path, batch_lines=4096):
+        super().__init__(open(path, 'w', encoding='utf-8'), batch_lines)
+
+    def close(self):
+        self.flush()
+        self.stream.close()
+
+class ListTraceSink:
+    # Keeps every trace line in memory
+    def __init__(self):
+        self.lines = []
 
+    def write(self, line):
+        self.lines.append(line)
 
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+# Calls to a function of at most this many instructions that makes no calls
+# itself are replaced by its code
+DEFAULT_INLINE_THRESHOLD = 16
+
+class Function:
+    # What the parser knows of a function definition: where its code starts,
+    # the addresses of its parameters and of its whole frame, and, if it is
+    # small enough to inline, a copy of its code with jump operands relative
+    # to its first instruction
+    __slots__ = ('name', 'label', 'parameters', 'frame', 'frame_start', 'frame_end', 'calls', 'result',
+                 'inline_frames', 'template')
+
+    def __init__(self, name, parameters, frame, frame_start):
+        self.name = name
+        self.label = Label()
+        self.parameters = parameters    # Addresses, in order
+        self.frame = frame              # Addresses of the parameters and locals
+        self.frame_start = frame_start
+        self.frame_end = frame_start    # Past the last address it uses, temporaries included
+        self.calls = False              # Whether its code has a CALL in it
+        self.result = None              # Where a call's value waits while the frame is restored
+        self.inline_frames = {}         # Name -> where that function's frame is when inlined here
+        self.template = None            # (opcodes, operands)
 
 class Parser:
-    def __init__(self, lexer, output_file):
+    # With recover, errors are collected in self.errors instead of raised: a
+    # syntax error skips ahead to the next synchronizing lexeme, symbol errors
+    # are just recorded, and invalid tokens are reported and dropped up front.
+    # The lexer must then have been created with positions=True.
+    def __init__(self, lexer, output_file, trace_level=TRACE_OFF, trace_sink=None, recover=False, code=None,
+                 inline_threshold=DEFAULT_INLINE_THRESHOLD):
         self.lexer = lexer
         self.current_token = None
-        self.output = []
-        self.lexer.index = 0
-        self.printing_rules = True
+        self.trace_level = trace_level
+        self.printing_rules = trace_level != TRACE_OFF
+        if self.printing_rules and trace_sink is None:
+            trace_sink = TraceSink(sys.stdout)
+        self.trace_sink = trace_sink
         self.output_file = output_file
         self.last_token = ''
         self.symbol_table = SymbolTable()
         self.is_declaration_context = False
-        self.assembly_code = []
-        self.instruction_count = 0
-
+        self.declaration_type = None
+        self.code = Code() if code is None else code
+        self.recover = recover
+        self.errors = []
+        self.source = None
+        self.line_starts = None
+        self.last_syntax_error = None
+        self.inline_threshold = inline_threshold
+        self.functions = {}             # Name -> Function of each function defined so far
+        self.current_function = None    # The Function whose body is being parsed
+        self.main_label = None
+        # Whether the next instruction can be reached, as far as knowing if a
+        # function can run off the end of its body needs
+        self.reachable = True
+        self.calls = []                 # (index, function name) of every CALL, for linker.py
+        self.callees = set()            # Names of the functions called or inlined
+
+
+    @property
+    def instruction_count(self):
+        return len(self.code)
+
+    @property
+    def assembly_code(self):
+        # (index, "OPCODE operand") pairs, as the text listing shows them
+        return [(index, self.code.format_instruction(index)) for index in range(len(self.code))]
+
+    def emit(self, opcode, operand=0):
+        return self.code.emit(opcode, operand)
 
     def parse(self, input_string):
-        # Pass the input string to the lexer's tokenize method
-        self.current_token = self.lexer.tokens[self.lexer.index]
+        if self.recover:
+            self.parse_recovering(input_string)
+            return
+        # Tokens are pulled from the lexer on demand, starting with the first one
+        self.current_token = self.lexer.next_token()
         self.rat23f()
+        self.code.resolve()
+        if self.trace_sink is not None:
+            self.trace_sink.flush()
+
+    def parse_recovering(self, input_string):
+        if self.lexer.offsets is None:
+            raise Exception("Error recovery needs a lexer created with positions=True")
+        self.source = input_string
+        self.drop_invalid_tokens()
+        self.current_token = self.lexer.next_token()
+        try:
+            self.rat23f()
+        except SyntaxRecovery:
+            pass  # Nothing left to resynchronize on
+        self.errors.sort(key=lambda error: (error.line, error.column))
+        if not self.errors:
+            self.code.resolve()
+        if self.trace_sink is not None:
+            self.trace_sink.flush()
+
+    def drop_invalid_tokens(self):
+        # Reports every invalid token and leaves the rest for the parser
+        lexer = self.lexer
+        tokens = []
+        offsets = array('I')
+        for token, offset in zip(lexer.tokens, lexer.offsets):
+            if token[0] == INVALID:
+                self.report(f"Invalid token: {token[1]}", offset)
+            else:
+                tokens.append(token)
+                offsets.append(offset)
+        lexer.tokens = tokens
+        lexer.offsets = offsets
+
+    def current_offset(self):
+        index = self.lexer.index
+        if index < len(self.lexer.offsets):
+            return self.lexer.offsets[index]
+        return len(self.source)
+
+    def report(self, message, offset=None):
+        if offset is None:
+            offset = self.current_offset()
+        if self.line_starts is None:
+            self.line_starts = array('I', [0])
+            self.line_starts.extend(match.end() for match in re.finditer('\n', self.source))
+        line = bisect.bisect_right(self.line_starts, offset)
+        self.errors.append(CompileError(message, line, offset - self.line_starts[line - 1] + 1))
+
+    def synchronize(self):
+        # Skips to the next synchronizing lexeme, consuming it if it is a ';'
+        while self.current_token[1] not in synchronizing_lexemes and self.current_token is not EOF_TOKEN:
+            self.current_token = self.lexer.next_token()
+        if self.current_token[1] == ';':
+            self.current_token = self.lexer.next_token()
+
+    def declare(self, lexeme):
+        try:
+            return self.symbol_table.add_identifier(lexeme, self.declaration_type)
+        except SymbolError as e:
+            if not self.recover:
+                raise
+            self.report(str(e))
+
+    def address_of(self, lexeme):
+        try:
+            return self.symbol_table.address_of(lexeme)
+        except SymbolError as e:
+            if not self.recover:
+                raise
+            self.report(str(e))
+            return 0
+
+    def symbol_error(self, message):
+        if not self.recover:
+            raise SymbolError(message)
+        self.report(message)
+
+    def predict(self, table):
+        # The alternative a table from parse_tables.py picks for the current
+        # token, or None if it picks none; see grammar.py. The tables listed in
+        # grammar.LEXEME_DECISIONS are looked up by lexeme alone, table[0].
+        lexemes, types = table
+        token = self.current_token
+        return types[token[0]] or lexemes.get(token[1])
 
     def match(self, token_type):
         if self.current_token is None:
@@ -201,25 +977,57 @@ class Parser:
         else:
             self.error(f"Expected {token_type}, got {self.current_token[0]}")
 
+    def advance(self):
+        # Consumes the current token unchecked, for a terminal the parse table
+        # prediction just made has already checked
+        self.current_token = self.lexer.next_token()
+
+    def bind(self, label):
+        # Code after a label can be jumped to even if nothing runs into it
+        self.code.bind(label)
+        self.reachable = True
+
     def rat23f(self):
         # R1. <Rat23F> ::= <Opt Function Definitions> # <Opt Declaration List> <Statement List> #
         if self.printing_rules:
             self.output_rule("<Rat23F> ::= <Opt Function Definitions> # <Opt Declaration List> <Statement List> #")
 
         self.opt_function_definitions()
+        self.main_section()
+
+    def main_section(self):
+        # The rest of <Rat23F> after the function definitions, which the
+        # incremental compiler also parses on its own
         self.match('#')
+        if self.main_label is not None:
+            self.code.bind(self.main_label)
         self.opt_declaration_list()
         self.statement_list()
+        if self.recover:
+            # Whatever stopped the statement list early is reported and skipped
+            while self.current_token[1] != '#' and self.current_token is not EOF_TOKEN:
+                self.error_and_skip(f"Unexpected {self.current_token[1]}")
+                if self.predict(STATEMENT) is not None:
+                    self.statement_list()
         self.match('#')
 
+    def error_and_skip(self, message):
+        try:
+            self.error(message)
+        except SyntaxRecovery:
+            self.current_token = self.lexer.next_token()
+
     # You will need to define methods for each non-terminal in the grammar.
     # For example:
     def opt_function_definitions(self):
         # R2. <Opt Function Definitions> ::= <Function Definitions> | <Empty>
-        if self.current_token[1] == 'function':
+        if self.predict(OPT_FUNCTION_DEFINITIONS) == 'function_definitions':
             if self.printing_rules:
                 self.output_rule("<Opt Function Definitions> ::= <Function Definitions>")
 
+            # The functions' code comes first, so the program starts by jumping past it
+            self.main_label = Label()
+            self.code.emit_jump(Op.JUMP, self.main_label)
             self.function_definitions()
         else:
             self.empty()
@@ -229,8 +1037,13 @@ class Parser:
         if self.printing_rules:
                 self.output_rule("<Function Definitions> ::= <Function> | <Function> <Function Definitions>")
 
-        self.function()
-        if self.current_token[1] == 'function':
+        try:
+            self.function()
+        except SyntaxRecovery:
+            self.synchronize()
+            if self.current_token[1] == '}':
+                self.current_token = self.lexer.next_token()  # Most likely the end of its body
+        if self.predict(FUNCTION_DEFINITIONS_PRIME) == 'function_definitions':
             self.function_definitions()
 
     def function(self):
@@ -239,18 +1052,54 @@ class Parser:
                 self.output_rule("<Function> ::= function <Identifier> ( <Opt Parameter List> ) <Opt Declaration List> <Body>")
 
         self.match('function')
+        name = self.current_token[1]
         self.match_type('identifier')  # Function name
         self.match('(')
-        self.is_declaration_context = True   # Set context for parameter declaration
-        self.opt_parameter_list()
-        self.is_declaration_context = False  # Reset context after parameters
-        self.match(')')
-        self.opt_declaration_list()
-        self.body()
+        # Parameters and locals live in the function's own scope and frame
+        symbol_table = self.symbol_table
+        symbol_table.enter_function()
+        try:
+            first = len(symbol_table.entries)
+            self.is_declaration_context = True   # Set context for parameter declaration
+            self.opt_parameter_list()
+            self.is_declaration_context = False  # Reset context after parameters
+            parameters = [entry.memory_address for entry in symbol_table.entries[first:]]
+            self.match(')')
+            self.opt_declaration_list()
+
+            # Defined before its body is parsed, so the body can call it
+            function = Function(name, parameters, [entry.memory_address for entry in symbol_table.entries[first:]],
+                                symbol_table.frames[-1])
+            if name in self.functions:
+                self.symbol_error(f"Duplicate function defined: {name}")
+            self.functions[name] = function
+            self.current_function = function
+            self.bind(function.label)
+            self.code.hold(function.label.address, self.inline_threshold)
+            self.body()
+            if self.reachable:
+                # Running off the end returns 0
+                self.emit(Op.PUSHI, 0)
+                self.emit(Op.RET)
+
+            function.frame_end = symbol_table.memory_address
+            entry = function.label.address
+            if not function.calls and len(self.code) - entry <= self.inline_threshold:
+                opcodes, operands = self.code.tail(entry)
+                for index in range(len(opcodes)):
+                    if opcodes[index] in jump_opcodes:
+                        operands[index] -= entry
+                function.template = (opcodes, operands)
+            return function
+        finally:
+            self.code.hold(None)
+            self.current_function = None
+            self.is_declaration_context = False
+            symbol_table.exit_function()
 
     def opt_parameter_list(self):
         # R5. <Opt Parameter List> ::= <Parameter List> | <Empty>
-        if self.current_token[0] == IDENTIFIER:
+        if self.predict(OPT_PARAMETER_LIST) == 'parameter_list':
             if self.printing_rules:
                 self.output_rule("<Opt Parameter List> ::= <Parameter List>")
 
@@ -264,7 +1113,7 @@ class Parser:
                 self.output_rule("<Parameter List> ::= <Parameter> | <Parameter> , <Parameter List>")
 
         self.parameter()
-        while self.current_token[0] == SEPARATOR and self.current_token[1] == ',':
+        while self.predict(PARAMETER_LIST_PRIME) == 'more':
             self.match_type(SEPARATOR)  # Match comma
             self.parameter()  # Process next parameter
 
@@ -273,16 +1122,22 @@ class Parser:
         if self.printing_rules:
                 self.output_rule("<Parameter> ::= <IDs > <Qualifier>")
 
-        self.ids()
-        self.qualifier()
+        # The qualifier follows the names, so their type is filled in afterwards
+        entries = self.ids()
+        qualifier = self.qualifier()
+        for entry in entries:
+            if entry is not None:
+                entry.type = qualifier
 
     def qualifier(self):
         # R8. <Qualifier> ::= integer | bool | real
         if self.printing_rules:
                 self.output_rule("<Qualifier> ::= integer | bool | real")
 
-        if self.current_token[1] in keywords and self.current_token[1] in {'integer', 'bool', 'real'}:
+        qualifier = self.predict(QUALIFIER)
+        if qualifier is not None:
             self.match_type(KEYWORD)  # Match the keyword which is a qualifier
+            return qualifier
         else:
             self.error("Expected qualifier")
 
@@ -297,7 +1152,7 @@ class Parser:
 
     def opt_declaration_list(self):
         # R10. <Opt Declaration List> ::= <Declaration List> | <Empty>
-        if self.current_token[1] in {'integer', 'bool', 'real'}:
+        if self.predict(OPT_DECLARATION_LIST) == 'declaration_list':
             if self.printing_rules:
                 self.output_rule("<Opt Declaration List> ::= <Declaration List>")
 
@@ -310,9 +1165,12 @@ class Parser:
         if self.printing_rules:
             self.output_rule("<Declaration List> ::= <Declaration> ; <Declaration List>")
 
-        self.declaration()
-        self.match_type(SEPARATOR)
-        if self.current_token[1] in {'integer', 'bool', 'real'}:
+        try:
+            self.declaration()
+            self.match_type(SEPARATOR)
+        except SyntaxRecovery:
+            self.synchronize()
+        if self.predict(DECLARATION_LIST_PRIME) == 'declaration_list':
             self.declaration_list()
 
     def declaration(self):
@@ -321,100 +1179,129 @@ class Parser:
         if self.printing_rules:
             self.output_rule("<Declaration> ::= <Qualifier > <IDs>")
 
-        self.qualifier()
-        self.ids()
-        self.is_declaration_context = False
+        try:
+            self.declaration_type = self.qualifier()
+            self.ids()
+        finally:
+            self.declaration_type = None
+            self.is_declaration_context = False
 
     def ids(self):
         # R13. <IDs> ::= <Identifier> | <Identifier>, <IDs>
         if self.printing_rules:
             self.output_rule("<IDs> ::= <Identifier> | <Identifier>, <IDs>")
 
+        # Returns the entries declared, if this is a declaration, and the
+        # addresses of the identifiers otherwise
+        declared = []
         while True:
             if self.current_token[0] != IDENTIFIER:
                 break
 
             identifier = self.current_token[1]
             if self.is_declaration_context:
-                self.symbol_table.add_identifier(identifier)
+                declared.append(self.declare(identifier))
             else:
-                self.symbol_table.check_identifier(identifier)
+                declared.append(self.address_of(identifier))
 
             self.match_type(IDENTIFIER)
 
-            if self.current_token[1] == ',':
+            if IDS_PRIME[0].get(self.current_token[1]) == 'more':
                 self.match_type(SEPARATOR)
             else:
                 break
+        return declared
+
 
 
 
+    # Statements that contain other statements (<Statement List>, <Compound>,
+    # <If>, <While>) are generators: they yield a generator for each nested
+    # statement and run_statements drives them with an explicit stack, so neither
+    # long statement lists nor deep nesting are bounded by the recursion limit.
+    def run_statements(self, steps):
+        stack = [steps]
+        while stack:
+            try:
+                nested = next(stack[-1], None)
+            except SyntaxRecovery:
+                # The statement that failed is abandoned and its parent carries
+                # on from the next synchronizing lexeme
+                stack.pop()
+                self.synchronize()
+                continue
+            if nested is None:
+                stack.pop()
+            else:
+                stack.append(nested)
 
     def statement_list(self):
+        self.run_statements(self.statement_list_steps())
+
+    def statement_list_steps(self):
         # R14. <Statement List> ::= <Statement> <Statement List Prime>
         if self.printing_rules:
             self.output_rule("<Statement List> ::= <Statement> <Statement List Prime>")
 
-        self.statement()
-        self.statement_list_prime()
+        yield self.statement_steps()
+        yield self.statement_list_prime_steps()
 
     def statement_list_prime(self):
+        self.run_statements(self.statement_list_prime_steps())
+
+    def statement_list_prime_steps(self):
         # R14_Prime. <Statement List Prime> ::= <Statement> <Statement List Prime> | ε
-        if (self.current_token[1] in {'{', 'if', 'ret', 'put', 'get', 'while'} or self.current_token[0] == 'identifier'):
+        # Each application of the rule is one iteration of the loop. It applies
+        # exactly where <Statement> predicts an alternative, so that one lookup
+        # decides both.
+        alternative = self.predict(STATEMENT)
+        while alternative is not None:
             if self.printing_rules:
                 self.output_rule("<Statement List Prime> ::= <Statement> <Statement List Prime>")
 
-        while (self.current_token[1] in {'{', 'if', 'ret', 'put', 'get', 'while'} or self.current_token[0] == 'identifier'):
-            self.statement()
-            self.statement_list_prime()
+            rule, parse, nested = statement_alternatives[alternative]
+            if nested:
+                yield self.statement_steps(alternative)
+            else:
+                # A statement without statements inside is parsed right here
+                # instead of in a generator of its own, recovering from a
+                # syntax error in it the way run_statements would
+                if self.printing_rules:
+                    self.output_rule(rule)
+                try:
+                    parse(self)
+                except SyntaxRecovery:
+                    self.synchronize()
+            alternative = self.predict(STATEMENT)
 
     def statement(self):
-        # R15. <Statement> ::= <Compound> | <Assign> | <If> | <Return> | <Print> | <Scan> | <While>
-        if self.current_token[0] == SEPARATOR and self.current_token[1] == '{':
-            if self.printing_rules:
-                self.output_rule("<Statement> ::= <Compound>")
-
-            self.parse_compound()
-        elif self.current_token[0] == IDENTIFIER:
-            if self.printing_rules:
-                self.output_rule("<Statement> ::= <Assign>")
-
-            self.parse_assign()
-        elif self.current_token[1] == 'if':
-            if self.printing_rules:
-                self.output_rule("<Statement> ::= <If>")
-
-            self.parse_if()
-        elif self.current_token[1] == 'ret':
-            if self.printing_rules:
-                self.output_rule("<Statement> ::= <Return>")
+        self.run_statements(self.statement_steps())
 
-            self.parse_return()
-        elif self.current_token[1] == 'put':
-            if self.printing_rules:
-                self.output_rule("<Statement> ::= <Print>")
-
-            self.parse_print()
-        elif self.current_token[1] == 'get':
-            if self.printing_rules:
-                self.output_rule("<Statement> ::= <Scan>")
-
-            self.parse_scan()
-        elif self.current_token[1] == 'while':
-            if self.printing_rules:
-                self.output_rule("<Statement> ::= <While>")
+    def statement_steps(self, alternative=None):
+        # R15. <Statement> ::= <Compound> | <Assign> | <If> | <Return> | <Print> | <Scan> | <While>
+        if alternative is None:
+            alternative = self.predict(STATEMENT)
+        if alternative is None:
+            self.error("Expected statement")
+        rule, parse, nested = statement_alternatives[alternative]
+        if self.printing_rules:
+            self.output_rule(rule)
 
-            self.parse_while()
+        if nested:
+            yield parse(self)
         else:
-            self.error("Expected statement")
+            parse(self)
 
     # R16. <Compound> ::= { <Statement List> }
     def parse_compound(self):
+        self.run_statements(self.compound_steps())
+
+    def compound_steps(self):
         if self.printing_rules:
             self.output_rule("<Compound> ::= { <Statement List> }")
 
         self.match('{')
-        self.statement_list()
+        yield self.statement_list_steps()
         self.match('}')
 
 
@@ -426,7 +1313,7 @@ class Parser:
         # Get the identifier's name and its memory location
         variable_name = self.current_token[1]
         self.match_type(IDENTIFIER)
-        variable_memory_location = self.symbol_table.table[variable_name].memory_address
+        variable_memory_location = self.address_of(variable_name)
 
         self.match('=')
 
@@ -436,14 +1323,16 @@ class Parser:
 
         # After the expression is evaluated, the result will be on top of the stack
         # Generate a POPM instruction to store the result in the variable's location
-        self.assembly_code.append((self.instruction_count, f"POPM {variable_memory_location}"))
-        self.instruction_count += 1
+        self.emit(Op.POPM, variable_memory_location)
 
         self.match(';')
 
 
     # R18. <If> ::= if ( <Condition> ) <Statement> endif | if ( <Condition> ) <Statement> else <Statement> endif
     def parse_if(self):
+        self.run_statements(self.if_steps())
+
+    def if_steps(self):
         if self.printing_rules:
             self.output_rule("<If> ::= if ( <Condition> ) <Statement> endif | if ( <Condition> ) <Statement> else <Statement> endif")
 
@@ -452,34 +1341,25 @@ class Parser:
         self.condition()  # Generates the comparison assembly instructions
         self.match(')')
 
-        # Append a JUMPZ placeholder and remember its index
-        jumpz_instruction_index = self.instruction_count
-        self.assembly_code.append((self.instruction_count, "JUMPZ placeholder"))
-        self.instruction_count += 1
+        # Jump past the then-part when the condition is false
+        else_label = Label()
+        self.code.emit_jump(Op.JUMPZ, else_label)
 
-        self.statement()
+        yield self.statement_steps()
 
-        has_else = self.current_token[1] == 'else'
+        has_else = IF_TAIL[0].get(self.current_token[1]) == 'else'
         if has_else:
-            # Append a JUMP placeholder to skip the else part and remember its index
-            jump_instruction_index = self.instruction_count
-            self.assembly_code.append((self.instruction_count, "JUMP placeholder"))
-            self.instruction_count += 1
-
-            # Update the JUMPZ instruction with the correct destination (start of the else part)
-            jumpz_destination = self.instruction_count
-            self.assembly_code[jumpz_instruction_index] = (jumpz_instruction_index, f"JUMPZ {jumpz_destination}")
+            # Skip the else part once the then-part has run
+            end_label = Label()
+            self.code.emit_jump(Op.JUMP, end_label)
+            self.bind(else_label)
 
             self.match('else')
-            self.statement()
+            yield self.statement_steps()
 
-            # Update the JUMP instruction with the correct destination (after the else part)
-            jump_destination = self.instruction_count
-            self.assembly_code[jump_instruction_index] = (jump_instruction_index, f"JUMP {jump_destination}")
+            self.bind(end_label)
         else:
-            # Update the JUMPZ instruction to jump after the if statement if there's no else
-            jumpz_destination = self.instruction_count
-            self.assembly_code[jumpz_instruction_index] = (jumpz_instruction_index, f"JUMPZ {jumpz_destination}")
+            self.bind(else_label)
 
         self.match('endif')
 
@@ -495,11 +1375,15 @@ class Parser:
             self.output_rule("<Return> ::= ret ; | ret <Expression> ;")
 
         self.match('ret')
-        if self.current_token[1] != ';':
+        if self.predict(RETURN_TAIL) == 'expression':
             self.parse_expression()  # Generate assembly for the expression
+        elif self.current_function is not None:
+            self.emit(Op.PUSHI, 0)  # A call always has a value
         self.match(';')
 
-        # Generate return-related assembly code here (if needed)
+        # Back to the caller, or from the main section to the end of the program
+        self.emit(Op.RET)
+        self.reachable = False
 
 
     # R20. <Print> ::= put ( <Expression> );
@@ -513,8 +1397,7 @@ class Parser:
         self.match(')')
 
         # Add STDOUT instruction to print the value
-        self.assembly_code.append((self.instruction_count, "STDOUT"))
-        self.instruction_count += 1
+        self.emit(Op.STDOUT)
 
         self.match(';')
 
@@ -533,17 +1416,15 @@ class Parser:
                 break
 
             identifier = self.current_token[1]
-            memory_location = self.symbol_table.table[identifier].memory_address
+            memory_location = self.address_of(identifier)
             
             # Generate STDIN and POPM instructions for each identifier
-            self.assembly_code.append((self.instruction_count, "STDIN"))
-            self.instruction_count += 1
-            self.assembly_code.append((self.instruction_count, f"POPM {memory_location}"))
-            self.instruction_count += 1
+            self.emit(Op.STDIN)
+            self.emit(Op.POPM, memory_location)
 
             self.match_type(IDENTIFIER)
 
-            if self.current_token[1] == ',':
+            if IDS_PRIME[0].get(self.current_token[1]) == 'more':
                 self.match_type(SEPARATOR)
             else:
                 break
@@ -553,13 +1434,17 @@ class Parser:
 
 
 
+    # R22. <While> ::= while ( <Condition> ) <Statement>
     def parse_while(self):
+        self.run_statements(self.while_steps())
+
+    def while_steps(self):
         if self.printing_rules:
             self.output_rule("<While> ::= while ( <Condition> ) <Statement>")
 
-        start_label = self.instruction_count
-        self.assembly_code.append((self.instruction_count, "LABEL"))
-        self.instruction_count += 1
+        start_label = Label()
+        self.bind(start_label)
+        self.emit(Op.LABEL)
 
         self.match('while')
         self.match('(')
@@ -567,19 +1452,17 @@ class Parser:
         self.match(')')
 
         # Generate JUMPZ for conditional exit
-        exit_label = self.instruction_count + 2  # Placeholder for the jump destination
-        self.assembly_code.append((self.instruction_count, f"JUMPZ {exit_label}"))
-        self.instruction_count += 1
+        exit_label = Label()
+        self.code.emit_jump(Op.JUMPZ, exit_label)
 
-        self.statement()
+        yield self.statement_steps()
 
         # Jump back to the start of the loop
-        self.assembly_code.append((self.instruction_count, f"JUMP {start_label}"))
-        self.instruction_count += 1
+        self.code.emit_jump(Op.JUMP, start_label)
 
         # Label for loop exit
-        self.assembly_code.append((self.instruction_count, f"LABEL {exit_label}"))
-        self.instruction_count += 1
+        self.bind(exit_label)
+        self.emit(Op.LABEL)
 
 
     def condition(self):
@@ -590,58 +1473,100 @@ class Parser:
         self.relop()
         self.parse_expression()
 
-        # Add assembly code for the relational operation based on self.relop_op
-        # Assuming self.relop_op is set in the relop() method to the operation type
-        if self.relop_op == "==":
-            self.assembly_code.append((self.instruction_count, "EQU"))
-        elif self.relop_op == "<":
-            self.assembly_code.append((self.instruction_count, "LES"))
-        # ... handle other relational operators ...
-        self.instruction_count += 1
+        # Compare the two values; self.relop_op is set by relop()
+        self.emit(relational_operator_opcodes[self.relop_op])
 
 
     def relop(self):
         if self.printing_rules:
             self.output_rule("<Relop> ::= == | != | > | < | <= | =>")
 
-        relop_instruction_map = {
-            '==': 'EQU', '!=': 'NEQ', '>': 'GRT', '<': 'LES',
-            '<=': 'LEQ', '>=': 'GEQ'
-        }
-
-        if self.current_token[1] in relational_operators:
-            self.relop_op = self.current_token[1]  # Set the operation type
-            self.match(self.current_token[1])
+        relop = RELOP[0].get(self.current_token[1])
+        if relop is not None:
+            self.relop_op = relop  # Set the operation type
+            self.advance()
         else:
             self.error("Expected relational operator")
 
 
     def parse_expression(self):
-        if self.printing_rules:
-            self.output_rule("<Expression> ::= <Term> <Expression Prime>")
+        if not self.printing_rules:
+            self.expression_fast()
+            return
+
+        self.output_rule("<Expression> ::= <Term> <Expression Prime>")
 
         self.term()
         self.expression_prime()
 
+    def expression_fast(self):
+        # Precedence climbing over R25-R28, used when no rule trace is wanted.
+        # Pending operators and open parentheses are kept on an explicit stack,
+        # so this emits the same postfix code as term/factor/primary in time
+        # linear in the expression length, with no recursion.
+        pending = []
+        open_parentheses = 0
+        precedence = binary_operator_precedence
+        primary_lexemes, primary_types = PRIMARY
+        while True:
+            # <Factor> ::= - <Primary> | <Primary>
+            token = self.current_token
+            alternative = primary_types[token[0]] or primary_lexemes.get(token[1])
+            if alternative is None and FACTOR[0].get(token[1]) == 'negate':
+                self.advance()
+                alternative = self.predict(PRIMARY)
+            if alternative == 'parenthesized':
+                self.advance()
+                pending.append('(')
+                open_parentheses += 1
+                continue
+            self.primary(alternative)
+
+            # A binary operator, or the ')' closing a parenthesized <Expression>
+            while True:
+                op = self.current_token[1]
+                if op in precedence:
+                    level = precedence[op]
+                    while pending and pending[-1] != '(' and precedence[pending[-1]] >= level:
+                        self.emit_binary_operator(pending.pop())
+                    pending.append(op)
+                    self.advance()
+                    break
+                if op == ')' and open_parentheses:
+                    while pending[-1] != '(':
+                        self.emit_binary_operator(pending.pop())
+                    pending.pop()
+                    open_parentheses -= 1
+                    self.advance()
+                    continue
+                if open_parentheses:
+                    self.error(f"Expected ), got {op}")
+                while pending:
+                    self.emit_binary_operator(pending.pop())
+                return
+
+    def emit_binary_operator(self, op):
+        self.emit(binary_operator_opcodes[op])
+
     def expression(self):
         # R25. <Expression> ::= <Term> <Expression Prime>
-        if self.printing_rules:
-            self.output_rule("<Expression> ::= <Term> <Expression Prime>")
+        if not self.printing_rules:
+            self.expression_fast()
+            return
+
+        self.output_rule("<Expression> ::= <Term> <Expression Prime>")
 
         self.term()
         self.expression_prime()
 
     def expression_prime(self):
         # R25_Prime. <Expression Prime> ::= + <Term> <Expression Prime> | - <Term> <Expression Prime> | <Empty>
-        while self.current_token[1] in {'+', '-'}:
-            op = self.current_token[1]
-            self.match(op)
+        op = self.predict(EXPRESSION_PRIME)
+        while op != 'empty':
+            self.advance()
             self.term()
-            if op == '+':
-                self.assembly_code.append((self.instruction_count, "ADD"))
-            elif op == '-':
-                self.assembly_code.append((self.instruction_count, "SUB"))
-            self.instruction_count += 1
+            self.emit_binary_operator(op)
+            op = self.predict(EXPRESSION_PRIME)
 
     def term(self):
         # R26. <Term> ::= <Factor> <Term Prime>
@@ -656,20 +1581,18 @@ class Parser:
         if self.printing_rules:
             self.output_rule("<Term Prime> ::= * <Factor> <Term Prime> | / <Factor> <Term Prime>")
 
-        while self.current_token[1] in {'*', '/'}:
-            op = self.current_token[1]
-            self.match(op)
+        op = self.predict(TERM_PRIME)
+        while op != 'empty':
+            self.advance()
             self.factor()
 
             # Generate the appropriate assembly code based on the operator
-            if op == '*':
-                self.assembly_code.append((self.instruction_count, "MUL"))
-            elif op == '/':
-                self.assembly_code.append((self.instruction_count, "DIV"))
-            self.instruction_count += 1
+            self.emit_binary_operator(op)
 
-            # Call term_prime recursively to handle potential consecutive multiplication/division operations
-            self.term_prime()
+            # Each further multiplication/division applies <Term Prime> again
+            if self.printing_rules:
+                self.output_rule("<Term Prime> ::= * <Factor> <Term Prime> | / <Factor> <Term Prime>")
+            op = self.predict(TERM_PRIME)
 
 
     def factor(self):
@@ -677,79 +1600,668 @@ class Parser:
         if self.printing_rules:
             self.output_rule("<Factor> ::= - <Primary> | <Primary>")
 
-        if self.current_token[1] == '-':  # Check if there's a unary minus
-            self.match('-')
+        if FACTOR[0].get(self.current_token[1]) == 'negate':  # Check if there's a unary minus
+            self.advance()
         self.primary()
 
-    def primary(self):
+    def primary(self, alternative=None):
         # R28. <Primary> ::= <Identifier> | <Integer> | <Identifier> (<IDs>) | (<Expression>) | true | false
-        if self.current_token[0] == IDENTIFIER:
+        # alternative is the one already predicted for the current token, if any
+        if alternative is None:
+            alternative = self.predict(PRIMARY)
+        if alternative == 'identifier':
             if self.printing_rules:
                 self.output_rule("<Primary> ::= <Identifier> | <Identifier> (<IDs>)")
 
             # Save the identifier to check if it's followed by '('
             saved_identifier = self.current_token
-            self.match_type(IDENTIFIER)
+            self.advance()
             
             # If the identifier is followed by '(', it's a function call
-            if self.current_token[1] == '(':
-                self.match('(')
-                self.ids()  # Process the function arguments
+            if PRIMARY_TAIL[0].get(self.current_token[1]) == 'call':
+                self.advance()
+                arguments = self.ids()  # Process the function arguments
                 self.match(')')
-                # Add assembly code for function call here (if applicable)
+                self.call(saved_identifier[1], arguments)
             else:
                 # Regular identifier - generate PUSHM instruction
-                memory_location = self.symbol_table.table[saved_identifier[1]].memory_address
-                self.assembly_code.append((self.instruction_count, f"PUSHM {memory_location}"))
-                self.instruction_count += 1
-        elif self.current_token[0] == INTEGER:
+                memory_location = self.address_of(saved_identifier[1])
+                self.emit(Op.PUSHM, memory_location)
+        elif alternative == 'integer':
             if self.printing_rules:
                 self.output_rule("<Primary> ::= <Integer>")
 
             # Integer literal - generate PUSHI instruction
-            self.assembly_code.append((self.instruction_count, f"PUSHI {self.current_token[1]}"))
-            self.instruction_count += 1
-            self.match_type(INTEGER)
-        elif self.current_token[1] == '(':
+            value = int(self.current_token[1])
+            if value > MAX_OPERAND:
+                self.error(f"Integer literal out of range: {self.current_token[1]}")
+            self.emit(Op.PUSHI, value)
+            self.advance()
+        elif alternative == 'parenthesized':
             if self.printing_rules:
                 self.output_rule("<Primary> ::= (<Expression>)")
 
-            self.match('(')
+            self.advance()
             self.expression()  # Process the expression inside the parentheses
             self.match(')')
-        elif self.current_token[1] in {'true', 'false'}:
+        elif alternative is not None:
             if self.printing_rules:
                 self.output_rule("<Primary> ::= true | false")
 
             # Boolean literal - convert to integer and push
-            bool_value = 1 if self.current_token[1] == 'true' else 0
-            self.assembly_code.append((self.instruction_count, f"PUSHI {bool_value}"))
-            self.instruction_count += 1
-            self.match(KEYWORD)
+            bool_value = 1 if alternative == 'true' else 0
+            self.emit(Op.PUSHI, bool_value)
+            self.advance()
         else:
             self.error(f"Invalid primary token: {self.current_token}")
 
 
+    def call(self, name, arguments):
+        # Stores the values at the argument addresses into the parameters and
+        # calls the function, leaving its value on the stack
+        function = self.functions.get(name)
+        if function is None:
+            self.symbol_error(f"Undeclared function called: {name}")
+        elif len(arguments) != len(function.parameters):
+            self.symbol_error(f"Function {name} takes {len(function.parameters)} arguments, got {len(arguments)}")
+        else:
+            self.callees.add(name)
+            if function.template is not None:
+                self.inline(function, arguments)
+                return
+            # Every frame starts at the same address, so a function calling
+            # another keeps its own frame on the stack during the call
+            caller = self.current_function
+            saved = caller.frame if caller is not None else ()
+            for address in saved:
+                self.emit(Op.PUSHM, address)
+            for address in arguments:
+                self.emit(Op.PUSHM, address)
+            for address in reversed(function.parameters):
+                self.emit(Op.POPM, address)
+            self.calls.append((self.code.emit_jump(Op.CALL, function.label), name))
+            if caller is not None:
+                caller.calls = True
+            if saved:
+                # The value goes aside while the frame is restored from under it
+                if caller.result is None:
+                    caller.result = self.symbol_table.temporary()
+                self.emit(Op.POPM, caller.result)
+                for address in reversed(saved):
+                    self.emit(Op.POPM, address)
+                self.emit(Op.PUSHM, caller.result)
+            return
+        self.emit(Op.PUSHI, 0)  # Recovering; the code is not used
+
+    def inline(self, function, arguments):
+        # The function's code in place of a call to it. A ret jumps to the end
+        # of that code instead, which leaves the value on the stack all the same.
+        delta = 0
+        caller = self.current_function
+        if caller is not None:
+            # Its frame would overlap the caller's, so it moves to addresses
+            # that are the caller's own
+            start = caller.inline_frames.get(function.name)
+            if start is None:
+                start = self.symbol_table.temporary(function.frame_end - function.frame_start)
+                caller.inline_frames[function.name] = start
+            delta = start - function.frame_start
+        emit = self.code.emit
+        for address in arguments:
+            emit(Op.PUSHM, address)
+        for address in reversed(function.parameters):
+            emit(Op.POPM, address + delta)
+        opcodes, operands = function.template
+        start = len(self.code)
+        end = start + len(opcodes) - (opcodes[-1] == Op.RET)
+        for index in range(len(opcodes)):
+            opcode = opcodes[index]
+            if opcode == Op.RET:
+                if index + 1 < len(opcodes):
+                    emit(Op.JUMP, end)
+            elif opcode in jump_opcodes:
+                emit(opcode, start + operands[index])
+            elif opcode in memory_opcodes:
+                emit(opcode, operands[index] + delta)
+            else:
+                emit(opcode, operands[index])
+
     def empty(self):
         # R29. <Empty> ::= epsilon
         # No action is needed for the empty production, as it just signifies the end of the recursion
         pass
 
     def error(self, message):
-        raise Exception(message)
+        if not self.recover:
+            raise Exception(message)
+        # One report per position: the errors that follow from the first one
+        # while resynchronizing are not worth reading
+        offset = self.current_offset()
+        if offset != self.last_syntax_error:
+            self.last_syntax_error = offset
+            self.report(message, offset)
+        raise SyntaxRecovery()
 
     def output_rule(self, rule):
-        print(f"Token: {self.current_token[0]}    Lexeme: {self.current_token[1]}")
-        print(rule)
-
-        if self.last_token != self.current_token:
-            self.output.append(f"Token: {self.current_token[0]},    Lexeme: {self.current_token[1]}")
+        if self.trace_level == TRACE_TOKENS and self.last_token != self.current_token:
+            self.trace_sink.write(f"Token: {self.current_token[0]},    Lexeme: {self.current_token[1]}")
             self.last_token = self.current_token
 
-        self.output.append(f"  {rule}")
+        self.trace_sink.write(f"  {rule}")
+
+# <Statement> alternatives by the name parse_tables.STATEMENT gives them: the
+# rule traced, the method that parses it and whether that method is a
+# generator for run_statements
+statement_alternatives = {
+    'compound': ("<Statement> ::= <Compound>", Parser.compound_steps, True),
+    'assign': ("<Statement> ::= <Assign>", Parser.parse_assign, False),
+    'if': ("<Statement> ::= <If>", Parser.if_steps, True),
+    'return': ("<Statement> ::= <Return>", Parser.parse_return, False),
+    'print': ("<Statement> ::= <Print>", Parser.parse_print, False),
+    'scan': ("<Statement> ::= <Scan>", Parser.parse_scan, False),
+    'while': ("<Statement> ::= <While>", Parser.while_steps, True),
+}
+
+# Batch compilation
+
+BATCH_OUTPUT_SUFFIX = '.asm.txt'
+OUTPUT_FORMATS = ('text', 'object')
+# Suffix of the file compile_stream writes before renaming it into place
+STREAM_PARTIAL_SUFFIX = '.partial'
+
+
+def symbol_addresses(symbol_table):
+    # Every identifier declared, functions' locals included, in declaration order
+    return [(entry.lexeme, entry.memory_address) for entry in symbol_table.entries]
+
+
+def listing_lines(code, symbols):
+    # The assembly code and symbol table as they are written to an output file;
+    # symbols is a list of (lexeme, memory address) pairs
+    yield "Assembly Code:"
+    yield from code.listing()
+    yield ""
+    yield from symbol_lines(symbols)
+
+
+def symbol_lines(symbols):
+    yield "Symbol Table:"
+    for lexeme, memory_address in symbols:
+        yield f"Identifier: {lexeme}, Memory Address: {memory_address}"
+
+
+# Characters left for the operand of a jump written before its target is
+# known; the target is patched in over them, padded with spaces
+OPEN_JUMP_WIDTH = 10
+
+
+class ListingWriter:
+    # Writes the text listing for a StreamingCode as it hands instructions
+    # over, to output_f opened in binary so the byte offset of every open
+    # jump's operand is known. Lines are ended as a file opened in text mode
+    # would end them. An open jump's operand is written as OPEN_JUMP_WIDTH
+    # spaces and patched in place, so the lines of jumps whose target came
+    # after them end in spaces; otherwise the listing is the one
+    # write_listing writes.
+    def __init__(self, output_f):
+        self.output_f = output_f
+        self.count = 0
+        self.offset = 0
+        self.open_jumps = {}  # Instruction -> offset of its operand
+        self.write_text("Assembly Code:\n")
+
+    def write_text(self, text):
+        data = text.replace('\n', os.linesep).encode('utf-8')
+        self.output_f.write(data)
+        self.offset += len(data)
+
+    def write(self, opcodes, operands, open_jumps=()):
+        lines = []
+        open_jumps = set(open_jumps)
+        first = self.count
+        offset = self.offset
+        for index in range(first, first + len(opcodes)):
+            opcode = opcodes[index - first]
+            if index in open_jumps:
+                line = f"{index}: {opcode_names[opcode]} "
+                self.open_jumps[index] = offset + len(line)
+                line += ' ' * OPEN_JUMP_WIDTH
+            else:
+                line = f"{index}: {instruction_text(opcode, operands[index - first])}"
+            offset += len(line) + len(os.linesep)
+            lines.append(line + "\n")
+        self.count += len(opcodes)
+        self.write_text(''.join(lines))
+
+    def patch(self, index, operand):
+        text = str(operand)
+        if len(text) > OPEN_JUMP_WIDTH:
+            raise Exception(f"Jump target {operand} does not fit in a streamed listing")
+        self.output_f.seek(self.open_jumps.pop(index))
+        self.output_f.write(text.ljust(OPEN_JUMP_WIDTH).encode('ascii'))
+        self.output_f.seek(self.offset)
+
+    def finish(self, count, symbols):
+        self.write_text("\n" + ''.join(line + "\n" for line in symbol_lines(symbols)))
+
+    def close(self):
+        pass
+
+
+# Profiling
+
+class RuleCountSink:
+    # Trace sink that counts applications of each grammar rule by its left side
+    def __init__(self):
+        self.counts = Counter()
+
+    def write(self, line):
+        if line.startswith('  <'):
+            self.counts[line[2:line.index('>') + 1]] += 1
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class Profile:
+    # Wall and CPU seconds per compile phase, and counters of what each phase
+    # did. compile_source fills one in when it is passed; without one nothing
+    # is timed or counted.
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+
+    def time(self, phase, function, *arguments):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        result = function(*arguments)
+        self.add_phase(phase, time.perf_counter() - wall, time.process_time() - cpu)
+        return result
+
+    def add_phase(self, phase, wall, cpu, calls=1):
+        totals = self.phases.setdefault(phase, {'wall': 0.0, 'cpu': 0.0, 'calls': 0})
+        totals['wall'] += wall
+        totals['cpu'] += cpu
+        totals['calls'] += calls
+
+    def count(self, group, counts):
+        totals = self.counters.setdefault(group, {})
+        for key, count in counts.items():
+            totals[key] = totals.get(key, 0) + count
+
+    def merge(self, profile):
+        # Adds in another Profile or the dict from as_dict()
+        if isinstance(profile, Profile):
+            profile = profile.as_dict()
+        for phase, totals in profile['phases'].items():
+            self.add_phase(phase, totals['wall'], totals['cpu'], totals['calls'])
+        for group, counts in profile['counters'].items():
+            self.count(group, counts)
+
+    def as_dict(self):
+        return {'phases': self.phases, 'counters': self.counters}
+
+    def to_json(self):
+        return json.dumps(self.as_dict(), indent=2, sort_keys=True)
+
+
+def run_phase(profile, phase, function, *arguments):
+    # Calls function, timing it as phase when there is a profile
+    if profile is None:
+        return function(*arguments)
+    return profile.time(phase, function, *arguments)
+
+
+def write_profile(destination, data):
+    # destination is a file path, or '-' for stdout
+    text = json.dumps(data, indent=2, sort_keys=True)
+    if destination == '-':
+        print(text)
+    else:
+        with open(destination, "w", encoding='utf-8') as profile_f:
+            profile_f.write(text + "\n")
+
+
+def count_compile(profile, lexer, parser, source):
+    # Adds the counters of a finished compile whose lexer still holds its tokens
+    profile.count('tokens', Counter(token[0] for token in lexer.tokens))
+    profile.count('instructions', {opcode_names[opcode]: count for opcode, count in Counter(parser.code.opcodes).items()})
+    profile.count('symbol_table', {'declarations': len(parser.symbol_table.entries), 'lookups': parser.symbol_table.lookups})
+    # The untraced parser skips the rule methods of expressions, so the rules
+    # are counted by a second, traced parse over the same tokens. Tracing makes
+    # that parse several times slower than the real one, so it is kept out of
+    # the 'parse' phase and timed as a 'count_rules' phase of its own.
+    rule_counter = RuleCountSink()
+    lexer.index = -1
+    profile.time('count_rules', Parser(lexer, None, TRACE_RULES, rule_counter).parse, source)
+    profile.count('rules', rule_counter.counts)
+
+
+def profile_compile(source, optimization_level, profile, recover=False, inline_threshold=DEFAULT_INLINE_THRESHOLD,
+                    lexer_engine=DEFAULT_LEXER_ENGINE):
+    lexer = Lexer(lexer_engine, positions=recover)
+    profile.time('tokenize', lexer.tokenize, source)
+    parser = Parser(lexer, None, recover=recover, inline_threshold=inline_threshold)
+    profile.time('parse', parser.parse, source)
+    if parser.errors:
+        raise CompileErrors(parser.errors)
+    if optimization_level:
+        import optimizer
+        profile.time('optimize', optimizer.optimize, parser.code, optimization_level, parser.symbol_table)
+    count_compile(profile, lexer, parser, source)
+    return parser.code, symbol_addresses(parser.symbol_table)
+
+
+# CompileCache instances of this process, by directory
+open_caches = {}
+
+
+def get_cache(cache_dir, cache_size=None):
+    if cache_dir not in open_caches:
+        import cache
+        open_caches[cache_dir] = cache.CompileCache(cache_dir, cache_size or cache.DEFAULT_CACHE_SIZE)
+    return open_caches[cache_dir]
+
+
+def compile_source(source, optimization_level=0, profile=None, recover=False, inline_threshold=DEFAULT_INLINE_THRESHOLD,
+                   lexer_engine=DEFAULT_LEXER_ENGINE):
+    # Returns (code, symbols) for a whole program given as a string. Pass a
+    # Profile to have the phases timed and counted into it. With recover, every
+    # error in the source is raised together as CompileErrors. lexer_engine is
+    # one of LEXER_ENGINES; recover cannot use 'fsm'.
+    if profile is not None:
+        return profile_compile(source, optimization_level, profile, recover, inline_threshold, lexer_engine)
+    lexer = Lexer(lexer_engine, positions=recover)
+    lexer.tokenize(source)
+    parser = Parser(lexer, None, recover=recover, inline_threshold=inline_threshold)
+    parser.parse(source)
+    if parser.errors:
+        raise CompileErrors(parser.errors)
+    if optimization_level:
+        import optimizer
+        optimizer.optimize(parser.code, optimization_level, parser.symbol_table)
+    return parser.code, symbol_addresses(parser.symbol_table)
+
+
+def write_listing(output_path, code, symbols, echo=False):
+    text = "\n".join(listing_lines(code, symbols)) + "\n"
+    if echo:
+        print(text, end='')
+    with open(output_path, "w", encoding='utf-8') as output_f:
+        output_f.write(text)
+
+
+def compile_stream(input_f, output_path, output_format='text', echo=False, trace_level=TRACE_OFF, trace_sink=None,
+                   inline_threshold=DEFAULT_INLINE_THRESHOLD):
+    # Compiles the source file open as input_f into output_path, writing the
+    # output while the file is still being read so that memory does not grow
+    # with the length of the program (see StreamingCode). It is written to a
+    # .partial file beside output_path that only replaces it once the whole
+    # compile has succeeded. With echo a text listing is then copied to
+    # stdout, since its lines can change after they are written. Returns
+    # (instruction count, symbols).
+    partial_path = output_path + STREAM_PARTIAL_SUFFIX
+    try:
+        if output_format == 'object':
+            import objfile
+        with open(partial_path, 'wb') as output_f:
+            writer = objfile.ObjectWriter(output_f) if output_format == 'object' else ListingWriter(output_f)
+            try:
+                lexer = Lexer()
+                lexer.tokenize_stream(input_f)
+                parser = Parser(lexer, output_path, trace_level, trace_sink, code=StreamingCode(writer),
+                                inline_threshold=inline_threshold)
+                parser.parse(input_f)
+                symbols = symbol_addresses(parser.symbol_table)
+                writer.finish(len(parser.code), symbols)
+            finally:
+                writer.close()
+        os.replace(partial_path, output_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+    if echo and output_format != 'object':
+        with open(output_path, "r", encoding='utf-8') as output_f:
+            shutil.copyfileobj(output_f, sys.stdout)
+    return len(parser.code), symbols
+
+
+def write_output(output_path, code, symbols, output_format='text', echo=False):
+    # The text listing, or with output_format 'object' a binary object file
+    if output_format == 'object':
+        import objfile
+        objfile.write_object(output_path, code, symbols)
+    else:
+        write_listing(output_path, code, symbols, echo)
+
+
+def compile_file(input_path, output_path, optimization_level=0, cache_dir=None, cache_size=None, profiling=False,
+                 recover=False, function_jobs=None, output_format='text', stream=False,
+                 inline_threshold=DEFAULT_INLINE_THRESHOLD, lexer_engine=DEFAULT_LEXER_ENGINE):
+    # Compiles one file with its own Lexer and Parser and writes the listing.
+    # With a cache_dir an unchanged source is not lexed or parsed again, and
+    # with recover the error message lists every error, one per line. With
+    # function_jobs the function definitions are compiled over that many
+    # worker processes and linked. output_format is as for write_output. With
+    # stream the output is written as it is generated (compile_stream), unless
+    # one of the other options needs the whole program first. inline_threshold
+    # is as for Parser and lexer_engine as for compile_source; stream and
+    # function_jobs always lex with the regex engine.
+    # Returns (input_path, instruction count, symbol count, error message or None,
+    # whether the result came from the cache, Profile.as_dict() or None)
+    cached = False
+    profile = Profile() if profiling else None
+    try:
+        if cache_dir is None and profile is None and not recover and function_jobs is None:
+            if stream and not optimization_level:
+                with open(input_path, "r", encoding='utf-8-sig') as input_f:
+                    instructions, symbols = compile_stream(input_f, output_path, output_format,
+                                                           inline_threshold=inline_threshold)
+                return input_path, instructions, len(symbols), None, False, None
+            lexer = Lexer(lexer_engine)
+            with open(input_path, "r", encoding='utf-8-sig') as input_f:
+                if lexer_engine == 'regex':
+                    lexer.tokenize_stream(input_f)
+                else:
+                    # Only the regex engine can lex the file as it is read
+                    lexer.tokenize(input_f.read())
+                parser = Parser(lexer, output_path, inline_threshold=inline_threshold)
+                parser.parse(input_f)
+            if optimization_level:
+                import optimizer
+                optimizer.optimize(parser.code, optimization_level, parser.symbol_table)
+            code, symbols = parser.code, symbol_addresses(parser.symbol_table)
+        else:
+            with open(input_path, "rb") as input_f:
+                source_bytes = run_phase(profile, 'read', input_f.read)
+            entry = None
+            if cache_dir is not None:
+                import cache
+                compile_cache = get_cache(cache_dir, cache_size)
+                key = cache.cache_key(source_bytes, {'optimize': optimization_level, 'inline': inline_threshold})
+                entry = run_phase(profile, 'cache', compile_cache.get, key)
+            cached = entry is not None
+            if cached:
+                code, symbols = entry
+            elif function_jobs is not None and profile is None and not recover:
+                import linker
+                code, symbols = linker.compile_parallel(source_bytes.decode('utf-8-sig'), function_jobs, optimization_level,
+                                                        inline_threshold=inline_threshold)
+                if cache_dir is not None:
+                    compile_cache.put(key, code, symbols)
+            else:
+                code, symbols = compile_source(source_bytes.decode('utf-8-sig'), optimization_level, profile, recover,
+                                               inline_threshold, lexer_engine)
+                if cache_dir is not None:
+                    run_phase(profile, 'cache', compile_cache.put, key, code, symbols)
+        run_phase(profile, 'write', write_output, output_path, code, symbols, output_format)
+    except Exception as e:
+        return input_path, 0, 0, str(e), cached, None
+    return input_path, len(code), len(symbols), None, cached, profile.as_dict() if profile is not None else None
+
+
+def expand_inputs(patterns):
+    # Paths matched by each pattern in order, without repeats; a pattern that
+    # matches nothing is kept so it is reported as a failure
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) or [pattern]
+        for path in matches:
+            if path not in seen and not os.path.isdir(path):
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+def batch_output_path(input_path, output_dir, output_format='text'):
+    stem = os.path.splitext(os.path.basename(input_path))[0]
+    if output_format == 'object':
+        import objfile
+        return os.path.join(output_dir, stem + objfile.OBJECT_SUFFIX)
+    return os.path.join(output_dir, stem + BATCH_OUTPUT_SUFFIX)
+
+
+def batch_compile(input_paths, output_paths, jobs=None, optimization_level=0, cache_dir=None, cache_size=None,
+                  profiling=False, recover=False, function_jobs=None, output_format='text', stream=False,
+                  inline_threshold=DEFAULT_INLINE_THRESHOLD, lexer_engine=DEFAULT_LEXER_ENGINE):
+    # Yields compile_file results in input order, spread over a process pool
+    jobs = jobs or os.cpu_count() or 1
+    count = len(input_paths)
+    options = ([optimization_level] * count, [cache_dir] * count, [cache_size] * count, [profiling] * count,
+               [recover] * count, [function_jobs] * count, [output_format] * count, [stream] * count,
+               [inline_threshold] * count, [lexer_engine] * count)
+    if jobs == 1 or count <= 1:
+        yield from map(compile_file, input_paths, output_paths, *options)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    # Several files per task so small sources do not pay a round trip each
+    chunksize = max(1, count // (jobs * 8))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(compile_file, input_paths, output_paths, *options, chunksize=chunksize)
+
+
+def run_batch(arguments):
+    # Compiles every input into the output directory; returns the exit status
+    input_paths = expand_inputs(arguments.inputs)
+    output_paths = [batch_output_path(path, arguments.output_dir, arguments.format) for path in input_paths]
+    by_output = {}
+    for input_path, output_path in zip(input_paths, output_paths):
+        if output_path in by_output:
+            print(f"{input_path}: error: output {output_path} would overwrite the one for {by_output[output_path]}")
+            return 2
+        by_output[output_path] = input_path
+    os.makedirs(arguments.output_dir, exist_ok=True)
+
+    failures = 0
+    hits = 0
+    profiles = {}
+    total_profile = Profile()
+    cache_size = arguments.cache_size << 20 if arguments.cache_size else None
+    results = batch_compile(input_paths, output_paths, arguments.jobs, arguments.optimize, arguments.cache_dir, cache_size,
+                            arguments.profile is not None, arguments.all_errors, arguments.function_jobs,
+                            arguments.format, arguments.stream, arguments.inline, arguments.lexer)
+    for (input_path, instructions, symbols, error, cached, profile), output_path in zip(results, output_paths):
+        hits += cached
+        if profile is not None:
+            profiles[input_path] = profile
+            total_profile.merge(profile)
+        if error is None:
+            print(f"{input_path}: {instructions} instructions, {symbols} identifiers -> {output_path}{' (cached)' if cached else ''}")
+        else:
+            failures += 1
+            for line in error.splitlines():
+                print(f"{input_path}: error: {line}")
+    print(f"Compiled {len(input_paths) - failures} of {len(input_paths)} files")
+    if arguments.cache_dir:
+        print(f"Cache: {hits} hits, {len(input_paths) - hits} misses")
+    if arguments.profile is not None:
+        write_profile(arguments.profile, {'files': profiles, 'total': total_profile.as_dict()})
+    return 1 if failures else 0
+
 
 # Main program logic
 if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()
+
+    argument_parser = argparse.ArgumentParser(description="Rat23F compiler; asks for files interactively unless inputs are given")
+    argument_parser.add_argument('inputs', nargs='*', help="source files or glob patterns to compile in one batch")
+    argument_parser.add_argument('-o', '--output-dir', default='.', help="directory for batch output files (default: .)")
+    argument_parser.add_argument('-j', '--jobs', type=int, help="worker processes for batch mode (default: one per CPU)")
+    argument_parser.add_argument('--function-jobs', type=int, metavar='N',
+                                 help="compile the function definitions of each file over N worker processes")
+    argument_parser.add_argument('--format', choices=OUTPUT_FORMATS, default='text',
+                                 help="write the text listing, or a binary object file that objfile.py reads")
+    argument_parser.add_argument('--stream', action='store_true',
+                                 help="write the output while the source is still being parsed, in memory that does not "
+                                      "grow with the program's length")
+    argument_parser.add_argument('--cache-dir', help="reuse batch output for unchanged sources from this directory")
+    argument_parser.add_argument('--cache-size', type=int, help="cache size limit in MiB (default: 64)")
+    argument_parser.add_argument('--trace', choices=TRACE_LEVELS, default='off',
+                                 help="print the grammar rules applied (and the tokens they were applied at); not with "
+                                      "batch inputs")
+    argument_parser.add_argument('--trace-file', help="write the rule trace to this file instead of stdout")
+    argument_parser.add_argument('--run', action='store_true',
+                                 help="run each compiled program, reading integers from stdin; not with batch inputs")
+    argument_parser.add_argument('--backend', choices=('vm', 'python'), default='vm',
+                                 help="what --run runs programs on: the VM, or Python translated from the program")
+    argument_parser.add_argument('--profile', nargs='?', const='-', metavar='FILE',
+                                 help="time each compile phase and count tokens, rules, instructions and symbol "
+                                      "lookups, writing JSON to FILE (default: stdout)")
+    argument_parser.add_argument('--all-errors', action='store_true',
+                                 help="keep going after an error and report every error with its line and column")
+    argument_parser.add_argument('-O', dest='optimize', type=int, choices=(0, 1, 2), default=0,
+                                 help="optimization level; 1 runs the peephole optimizer over the generated code, 2 "
+                                      "also folds constant branches, removes unreachable blocks, reorders blocks, "
+                                      "moves loop-invariant expressions out of loops and reuses repeated expressions")
+    argument_parser.add_argument('--inline', type=int, default=DEFAULT_INLINE_THRESHOLD, metavar='N',
+                                 help="replace calls to functions of at most N instructions that call no others by "
+                                      f"their code (default: {DEFAULT_INLINE_THRESHOLD}; 0 never inlines)")
+    argument_parser.add_argument('--lexer', choices=LEXER_ENGINES, default=DEFAULT_LEXER_ENGINE,
+                                 help="lex with one precompiled regular expression, with the same expression into "
+                                      "compact token storage of about 9 bytes a token, or with a character-by-character "
+                                      f"state machine (default: {DEFAULT_LEXER_ENGINE})")
+    arguments = argument_parser.parse_args()
+
+    if arguments.lexer != 'regex':
+        # Only the regex engine lexes a file as it is read, and the fsm one
+        # records no token positions
+        conflicts = [option for option, used in (('--stream', arguments.stream),
+                                                 ('--all-errors', arguments.all_errors and arguments.lexer == 'fsm'),
+                                                 ('--function-jobs', arguments.function_jobs and arguments.inputs)) if used]
+        if conflicts:
+            argument_parser.error(f"--lexer {arguments.lexer} cannot be combined with {', '.join(conflicts)}")
+
+    if arguments.stream:
+        # Each of these needs the whole program before anything is written
+        conflicts = [option for option, used in ((f'-O{arguments.optimize}', arguments.optimize), ('--profile', arguments.profile is not None),
+                                                 ('--all-errors', arguments.all_errors),
+                                                 ('--cache-dir', arguments.cache_dir and arguments.inputs),
+                                                 ('--function-jobs', arguments.function_jobs and arguments.inputs),
+                                                 ('--run', arguments.run and not arguments.inputs)) if used]
+        if conflicts:
+            argument_parser.error(f"--stream cannot be combined with {', '.join(conflicts)}")
+
+    if arguments.inputs:
+        # A batch only writes output files; running and tracing programs is
+        # done one file at a time in the interactive mode
+        conflicts = [option for option, used in (('--run', arguments.run),
+                                                 ('--backend', arguments.backend != 'vm'),
+                                                 ('--trace', arguments.trace != 'off'),
+                                                 ('--trace-file', arguments.trace_file is not None)) if used]
+        if conflicts:
+            argument_parser.error(f"{', '.join(conflicts)} cannot be combined with batch inputs")
+        sys.exit(run_batch(arguments))
+
+    trace_level = TRACE_LEVELS[arguments.trace]
+    trace_sink = None
+    if trace_level != TRACE_OFF:
+        trace_sink = FileTraceSink(arguments.trace_file) if arguments.trace_file else TraceSink(sys.stdout)
+
     program_running = True
 
     while program_running:
@@ -761,39 +2273,75 @@ if __name__ == "__main__":
         output_file = input("Input the name of the file to write the assembly code and symbol table to: ")
         print("\n")
 
-        lexer_instance = Lexer()
+        lexer_instance = Lexer(arguments.lexer, positions=arguments.all_errors)
+        profile = Profile() if arguments.profile is not None else None
 
         try:
+            if arguments.stream:
+                with open(input_file, "r", encoding='utf-8-sig') as input_f:
+                    print()
+                    compile_stream(input_f, output_file, arguments.format, True, trace_level, trace_sink, arguments.inline)
+                continue
+
             with open(input_file, "r", encoding='utf-8-sig') as input_f:
-                # Read the input from the file
-                input_string = input_f.read()
-                
-                # Tokenize the input string using the lexer
-                lexer_instance.tokenize(input_string)
-                
                 # Create a parser instance with the lexer instance
-                parser = Parser(lexer_instance, output_file)
+                parser = Parser(lexer_instance, output_file, trace_level, trace_sink, arguments.all_errors,
+                                inline_threshold=arguments.inline)
+
+                if profile is None and not arguments.all_errors and arguments.lexer == 'regex':
+                    # Stream tokens from the file as the parser asks for them
+                    lexer_instance.tokenize_stream(input_f)
                 
-                # Start parsing by passing the input string to the parse method
-                parser.parse(input_string)
+                    # Start parsing; the lexer reads the file as it goes
+                    parser.parse(input_f)
+                else:
+                    # Tokenize up front so lexing and parsing are timed apart,
+                    # so errors can be placed in the source, and for the lexer
+                    # engines that cannot lex a file as it is read
+                    source = run_phase(profile, 'read', input_f.read)
+                    run_phase(profile, 'tokenize', lexer_instance.tokenize, source)
+                    run_phase(profile, 'parse', parser.parse, source)
+
+                if parser.errors:
+                    for error in parser.errors:
+                        print(f"{input_file}: error: {error}")
+                    continue
+
+                if arguments.optimize:
+                    import optimizer
+                    stats = run_phase(profile, 'optimize', optimizer.optimize, parser.code, arguments.optimize,
+                                      parser.symbol_table)
+                    print(f"Optimizer removed {stats['removed']} instructions "
+                          f"({stats['folded']} folded, {stats['stores']} redundant stores, "
+                          f"{stats['threaded']} jumps threaded, {stats['labels']} labels)")
+                    if 'blocks' in stats:
+                        print(f"Control flow: {stats['blocks']} blocks, {stats['edges']} edges; "
+                              f"{stats['unreachable']} unreachable blocks removed, "
+                              f"{stats['branches']} constant branches folded, "
+                              f"{stats['laid_out']} jumps removed by block layout")
+                        print(f"Expressions: {stats['hoisted']} hoisted out of loops, "
+                              f"{stats['reused']} reused instead of computed again")
 
                 # Print and write assembly code and symbol table to the output file
-                with open(output_file, "w", encoding='utf-8') as output_f:
-                    # Assembly code
-                    output_f.write("Assembly Code:\n")
-                    print("\nAssembly Code:")
-                    for instruction in parser.assembly_code:
-                        line = f"{instruction[0]}: {instruction[1]}"
-                        print(line)
-                        output_f.write(line + "\n")
-
-                    # Symbol table
-                    output_f.write("\nSymbol Table:\n")
-                    print("\nSymbol Table:")
-                    for lexeme, entry in parser.symbol_table.table.items():
-                        line = f"Identifier: {lexeme}, Memory Address: {entry.memory_address}"
-                        print(line)
-                        output_f.write(line + "\n")
+                print()
+                run_phase(profile, 'write', write_output, output_file, parser.code,
+                          symbol_addresses(parser.symbol_table), arguments.format, True)
+
+                if profile is not None:
+                    count_compile(profile, lexer_instance, parser, source)
+                    write_profile(arguments.profile, profile.as_dict())
+
+                if arguments.run:
+                    print("\nRunning:")
+                    if arguments.backend == 'python':
+                        import pycodegen
+                        pycodegen.CompiledVM(parser.code).run()
+                    else:
+                        import vm
+                        vm.VM(parser.code).run()
 
         except IOError as e:
             print(f"An error occurred: {e.strerror}")
+
+    if trace_sink is not None:
+        trace_sink.close()
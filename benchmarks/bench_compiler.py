@@ -0,0 +1,211 @@
+# Lexer, parser and listing throughput on generated programs of growing size.
+#
+#   python benchmarks/bench_compiler.py --sizes 2000,4000,8000,16000 --output run.json
+#   python benchmarks/bench_compiler.py --compare run.json
+#
+# Each phase is timed on its own: Lexer.tokenize, Parser.parse (which includes
+# code generation) and writing the listing with listing_lines. Peak memory is
+# measured with tracemalloc in a separate pass so it does not slow the timed
+# runs. --lexer picks the lexer engine, so the two can be compared with
+# --output and --compare. Between consecutive sizes the growth of each phase's time is reported
+# as an exponent of the growth in tokens; anything well above 1 means that
+# phase has gone super-linear.
+#
+# rules/s is the grammar rules applied over the time of a parse that traces
+# them, counted and timed in the same run. Tracing slows the parser down, so it
+# is lower than the untraced parse speed instr/s is measured on.
+
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from assembly import (DEFAULT_LEXER_ENGINE, LEXER_ENGINES, Lexer, Parser, RuleCountSink, TRACE_RULES, listing_lines,
+                      symbol_addresses)
+from generate import generate_program
+
+PHASES = ('tokenize', 'parse', 'listing')
+# Scaling exponent above which a phase is reported as super-linear
+SUPER_LINEAR_EXPONENT = 1.3
+
+
+def tokenize(source, engine=DEFAULT_LEXER_ENGINE):
+    lexer = Lexer(engine)
+    lexer.tokenize(source)
+    return lexer
+
+
+def parse(source, engine=DEFAULT_LEXER_ENGINE):
+    parser = Parser(tokenize(source, engine), None)
+    parser.parse(source)
+    return parser
+
+
+def write_listing(parser):
+    return sum(len(line) + 1 for line in listing_lines(parser.code, symbol_addresses(parser.symbol_table)))
+
+
+def count_rules(source, engine=DEFAULT_LEXER_ENGINE):
+    # The rules the parser applies, and the seconds the traced parse took; the
+    # lexer is made outside the timed region
+    sink = RuleCountSink()
+    parser = Parser(tokenize(source, engine), None, TRACE_RULES, sink)
+    start = time.perf_counter()
+    parser.parse(source)
+    return sum(sink.counts.values()), time.perf_counter() - start
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def peak_memory(function, setup=None):
+    # Peak traced allocation while function runs; setup() runs untraced first
+    # and its result is passed to function
+    arguments = (setup(),) if setup is not None else ()
+    tracemalloc.start()
+    try:
+        function(*arguments)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def measure(source, repeat, engine=DEFAULT_LEXER_ENGINE):
+    lexer = tokenize(source, engine)
+    parser = parse(source, engine)
+    tokens = len(lexer.tokens)
+    instructions = len(parser.code)
+    traced = [count_rules(source, engine) for _ in range(repeat)]
+    rules = traced[0][0]
+
+    def parse_only():
+        # A fresh lexer each time, tokenized outside the timed region
+        fresh = tokenize(source, engine)
+        start = time.perf_counter()
+        Parser(fresh, None).parse(source)
+        return time.perf_counter() - start
+
+    seconds = {
+        'tokenize': best_time(lambda: tokenize(source, engine), repeat),
+        'parse': min(parse_only() for _ in range(repeat)),
+        'listing': best_time(lambda: write_listing(parser), repeat),
+        'traced_parse': min(elapsed for _, elapsed in traced),
+    }
+    peaks = {
+        'tokenize': peak_memory(lambda: tokenize(source, engine)),
+        'parse': peak_memory(lambda fresh: Parser(fresh, None).parse(source), lambda: tokenize(source, engine)),
+        'listing': peak_memory(lambda: write_listing(parser)),
+    }
+    return {
+        'bytes': len(source.encode('utf-8')),
+        'tokens': tokens,
+        'rules': rules,
+        'instructions': instructions,
+        'seconds': seconds,
+        'peak_bytes': peaks,
+        'tokens_per_second': tokens / seconds['tokenize'],
+        'rules_per_second': rules / seconds['traced_parse'],
+        'instructions_per_second': instructions / seconds['parse'],
+        'listing_instructions_per_second': instructions / seconds['listing'],
+    }
+
+
+def scaling(results):
+    # Exponent k in time ~ tokens**k between each pair of consecutive sizes
+    exponents = []
+    for smaller, larger in zip(results, results[1:]):
+        growth = math.log(larger['tokens'] / smaller['tokens'])
+        exponents.append({
+            phase: math.log(larger['seconds'][phase] / smaller['seconds'][phase]) / growth
+            for phase in PHASES
+        })
+    return exponents
+
+
+def report(run):
+    print(f"{'statements':>10} {'tokens':>10} {'tokens/s':>12} {'rules/s':>12} {'instr/s':>12} "
+          f"{'listing/s':>12} {'peak MiB':>9}")
+    for result in run['results']:
+        peak = max(result['peak_bytes'].values()) / (1 << 20)
+        print(f"{result['statements']:>10,} {result['tokens']:>10,} {result['tokens_per_second']:>12,.0f} "
+              f"{result['rules_per_second']:>12,.0f} {result['instructions_per_second']:>12,.0f} "
+              f"{result['listing_instructions_per_second']:>12,.0f} {peak:>9.1f}")
+    for result, exponents in zip(run['results'][1:], run['scaling']):
+        for phase in PHASES:
+            if exponents[phase] > SUPER_LINEAR_EXPONENT:
+                print(f"warning: {phase} grows as tokens^{exponents[phase]:.2f} up to {result['statements']:,} statements")
+
+
+def compare(run, baseline):
+    # Speed of this run relative to a saved one, size by size; above 1 is faster
+    by_size = {result['statements']: result for result in baseline['results']}
+    for result in run['results']:
+        old = by_size.get(result['statements'])
+        if old is None:
+            continue
+        changes = ', '.join(f"{phase} x{old['seconds'][phase] / result['seconds'][phase]:.2f}" for phase in PHASES)
+        print(f"{result['statements']:>10,} statements: {changes}")
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description="Compiler throughput on generated programs")
+    argument_parser.add_argument('--sizes', default='2000,4000,8000,16000', help="comma separated statement counts")
+    argument_parser.add_argument('--seed', type=int, default=0)
+    argument_parser.add_argument('--identifiers', type=int, default=64)
+    argument_parser.add_argument('--expression-length', type=int, default=4)
+    argument_parser.add_argument('--nesting-depth', type=int, default=3)
+    argument_parser.add_argument('--repeat', type=int, default=3)
+    argument_parser.add_argument('--lexer', choices=LEXER_ENGINES, default=DEFAULT_LEXER_ENGINE,
+                                 help=f"lexer engine to measure (default: {DEFAULT_LEXER_ENGINE})")
+    argument_parser.add_argument('--output', help="write the results to this JSON file")
+    argument_parser.add_argument('--compare', help="JSON file of an earlier run to compare against")
+    arguments = argument_parser.parse_args()
+
+    parameters = {
+        'seed': arguments.seed,
+        'identifiers': arguments.identifiers,
+        'expression_length': arguments.expression_length,
+        'nesting_depth': arguments.nesting_depth,
+        'repeat': arguments.repeat,
+        'lexer': arguments.lexer,
+    }
+    results = []
+    for statements in (int(size) for size in arguments.sizes.split(',')):
+        source = generate_program(arguments.seed, statements, arguments.identifiers,
+                                  arguments.expression_length, arguments.nesting_depth)
+        result = measure(source, arguments.repeat, arguments.lexer)
+        result['statements'] = statements
+        results.append(result)
+    run = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'parameters': parameters,
+        'results': results,
+        'scaling': scaling(results),
+    }
+    report(run)
+
+    if arguments.compare:
+        with open(arguments.compare, encoding='utf-8') as baseline_file:
+            compare(run, json.load(baseline_file))
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as output_file:
+            json.dump(run, output_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# Parser throughput at each rule trace level.
+#
+#   python benchmarks/bench_trace.py --statements 50000
+#
+# The rules and tokens levels write through a FileTraceSink to a temporary file
+# so the numbers measure the tracing itself rather than a terminal.
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assembly import Lexer, Parser, FileTraceSink, TRACE_LEVELS, TRACE_OFF
+
+
+def make_program(statements):
+    # Straight-line assignments and prints over a handful of variables, with a
+    # while loop every so often
+    lines = ["#", "integer i, max, sum, x, y;"]
+    for n in range(statements):
+        if n % 50 == 49:
+            lines.append("while (i < max) { sum = sum + i * 2; i = i + 1; }")
+        elif n % 3 == 0:
+            lines.append(f"x = (x + {n}) * y - sum / 3;")
+        elif n % 3 == 1:
+            lines.append("put (x + y);")
+        else:
+            lines.append("y = x - y + i;")
+    lines.append("#")
+    return "\n".join(lines)
+
+
+def run(source, trace_level, trace_path):
+    lexer = Lexer()
+    lexer.tokenize(source)
+    trace_sink = FileTraceSink(trace_path) if trace_level != TRACE_OFF else None
+    start = time.perf_counter()
+    parser = Parser(lexer, None, trace_level, trace_sink)
+    parser.parse(source)
+    elapsed = time.perf_counter() - start
+    if trace_sink is not None:
+        trace_sink.close()
+    return len(lexer.tokens), elapsed
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description="Parser throughput at each rule trace level")
+    argument_parser.add_argument('--statements', type=int, default=50000)
+    argument_parser.add_argument('--repeat', type=int, default=3)
+    arguments = argument_parser.parse_args()
+
+    source = make_program(arguments.statements)
+    with tempfile.TemporaryDirectory() as directory:
+        trace_path = os.path.join(directory, 'trace.txt')
+        baseline = None
+        for name, trace_level in TRACE_LEVELS.items():
+            best = None
+            for _ in range(arguments.repeat):
+                token_count, elapsed = run(source, trace_level, trace_path)
+                best = elapsed if best is None else min(best, elapsed)
+            if baseline is None:
+                baseline = best
+            print(f"{name:>6}: {token_count / best:12,.0f} tokens/s  {best:8.3f} s  x{best / baseline:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+# Instructions per second of the stack machine on loop-heavy programs.
+#
+#   python benchmarks/bench_vm.py --iterations 2000
+#   python benchmarks/bench_vm.py -O2    # optimized, checked against unoptimized
+#
+# With -O each program's size is shown before and after optimizing too.
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assembly import Lexer, Parser
+from optimizer import OPTIMIZATION_LEVELS, optimize
+from vm import VM
+
+PROGRAMS = {
+    # Nested counting loops with arithmetic in the inner body
+    'nested_loops': """
+        #
+        integer i, j, n, sum;
+        get (n);
+        i = 0;
+        sum = 0;
+        while (i < n) {
+            j = 0;
+            while (j < 100) {
+                sum = sum + i * j - j / 3;
+                j = j + 1;
+            }
+            i = i + 1;
+        }
+        put (sum);
+        #
+    """,
+    # A single loop whose body branches on every iteration
+    'branchy_loop': """
+        #
+        integer i, n, odd, even, half;
+        get (n);
+        n = n * 100;
+        i = 0;
+        while (i < n) {
+            half = i / 2;
+            if (half * 2 == i)
+                even = even + 1;
+            else
+                odd = odd + 1;
+            endif
+            i = i + 1;
+        }
+        put (even);
+        put (odd);
+        #
+    """,
+    # Calls in a loop: square is small enough to be inlined, triangle
+    # calls itself and goes through CALL and RET
+    'calls': """
+        function square (x integer)
+        {
+            ret x * x;
+        }
+        function triangle (k integer)
+            integer j;
+        {
+            if (k <= 0)
+                ret 0;
+            endif
+            j = k - 1;
+            ret square(k) + triangle(j);
+        }
+        #
+        integer i, n, depth, sum;
+        get (n);
+        i = 0;
+        depth = 10;
+        sum = 0;
+        while (i < n) {
+            sum = sum + triangle(depth) / 7 + square(i);
+            i = i + 1;
+        }
+        put (sum);
+        #
+    """,
+    # Expressions in a loop that only read variables the loop never changes
+    'invariant_loop': """
+        #
+        integer i, n, a, b, sum, big;
+        get (n);
+        a = 7;
+        b = n / 3;
+        i = 0;
+        sum = 0;
+        while (i < n * 100) {
+            sum = sum + i + (a * b + (a - b) * (a + b));
+            if (a * b > n)
+                big = big + 1;
+            endif
+            i = i + 1;
+        }
+        put (sum);
+        put (big);
+        #
+    """,
+    # The same products used again within and across statements
+    'repeated_terms': """
+        #
+        integer i, n, a, b, c, sum, half;
+        get (n);
+        i = 0;
+        c = 0;
+        sum = 0;
+        while (i < n * 100) {
+            a = i * 3;
+            b = i + 7;
+            sum = sum + (a * b) + (a * b) - c;
+            half = (a * b - c) / 2;
+            c = (a * b - c) / 3 + half;
+            i = i + 1;
+        }
+        put (sum);
+        put (c);
+        #
+    """,
+}
+
+
+def compile_program(source, level=0):
+    # Returns the code and the optimizer's stats, None at level 0
+    lexer = Lexer()
+    lexer.tokenize(source)
+    parser = Parser(lexer, None)
+    parser.parse(source)
+    stats = optimize(parser.code, level, parser.symbol_table) if level else None
+    return parser.code, stats
+
+
+def outputs(code, iterations):
+    written = []
+    VM(code, lambda: iterations, written.append).run()
+    return written
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description="Stack machine instructions per second")
+    argument_parser.add_argument('--iterations', type=int, default=1000, help="value read by each program's get()")
+    argument_parser.add_argument('--repeat', type=int, default=3)
+    argument_parser.add_argument('-O', dest='optimize', type=int, choices=OPTIMIZATION_LEVELS, default=0,
+                                 help="optimization level to run the programs at; their output is checked against "
+                                      "the unoptimized programs' first")
+    arguments = argument_parser.parse_args()
+
+    status = 0
+    for name, source in PROGRAMS.items():
+        code, stats = compile_program(source, arguments.optimize)
+        if arguments.optimize:
+            unoptimized, _ = compile_program(source)
+            expected = outputs(unoptimized, arguments.iterations)
+            got = outputs(code, arguments.iterations)
+            if got != expected:
+                print(f"{name:>14}: -O{arguments.optimize} wrote {got}, unoptimized {expected}")
+                status = 1
+                continue
+            line = f"{name:>14}: {len(unoptimized)} -> {len(code)} instructions in the program"
+            if 'reused' in stats:
+                line += f", {stats['hoisted']} expressions hoisted out of loops, {stats['reused']} reused"
+            print(line)
+        best = None
+        for _ in range(arguments.repeat):
+            machine = VM(code, lambda: arguments.iterations, lambda value: None)
+            start = time.perf_counter()
+            steps = machine.run()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{name:>14}: {steps:12,} instructions  {best:8.3f} s  {steps / best:14,.0f} instructions/s")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
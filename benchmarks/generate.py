@@ -0,0 +1,116 @@
+# Seeded generator of synthetic Rat23F programs for the benchmarks.
+#
+#   python benchmarks/generate.py --seed 1 --statements 5000 > program.txt
+#
+# The same arguments always give the same program. Every identifier is
+# declared, so the output compiles, but loops are not guaranteed to terminate
+# and the programs are only meant to be compiled.
+
+import argparse
+import random
+
+
+def identifier_names(count):
+    # va, vb, ..., vz, vba, vbb, ...: letters only, never a keyword
+    names = []
+    for n in range(count):
+        letters = ''
+        while True:
+            letters = chr(ord('a') + n % 26) + letters
+            n //= 26
+            if n == 0:
+                break
+        names.append('v' + letters)
+    return names
+
+
+class ProgramGenerator:
+    def __init__(self, seed=0, identifiers=16, expression_length=4, nesting_depth=3):
+        # expression_length is the average number of operands in an expression,
+        # nesting_depth the deepest if/while nesting generated
+        self.random = random.Random(seed)
+        self.names = identifier_names(max(1, identifiers))
+        self.expression_length = max(1, expression_length)
+        self.nesting_depth = max(0, nesting_depth)
+
+    def operand(self):
+        if self.random.random() < 0.3:
+            return str(self.random.randint(0, 999))
+        return self.random.choice(self.names)
+
+    def expression(self):
+        count = self.random.randint(1, 2 * self.expression_length - 1)
+        parts = [self.operand()]
+        for _ in range(count - 1):
+            parts.append(self.random.choice('+-*/'))
+            if self.random.random() < 0.1:
+                parts.append(f"({self.operand()} {self.random.choice('+-')} {self.operand()})")
+            else:
+                parts.append(self.operand())
+        return ' '.join(parts)
+
+    def condition(self):
+        relop = self.random.choice(('<', '>', '==', '!=', '<=', '=>'))
+        return f"{self.expression()} {relop} {self.expression()}"
+
+    def statement(self, depth, lines, indent):
+        # Appends one statement; returns the number of statements generated
+        pad = '    ' * indent
+        choice = self.random.random()
+        if depth < self.nesting_depth and choice < 0.1:
+            lines.append(f"{pad}while ({self.condition()}) {{")
+            count = 1 + self.block(depth + 1, lines, indent + 1)
+            lines.append(f"{pad}}}")
+            return count
+        if depth < self.nesting_depth and choice < 0.2:
+            lines.append(f"{pad}if ({self.condition()}) {{")
+            count = 1 + self.block(depth + 1, lines, indent + 1)
+            if self.random.random() < 0.5:
+                lines.append(f"{pad}}} else {{")
+                count += self.block(depth + 1, lines, indent + 1)
+            lines.append(f"{pad}}} endif")
+            return count
+        if choice < 0.3:
+            lines.append(f"{pad}put ({self.expression()});")
+        elif choice < 0.35:
+            lines.append(f"{pad}get ({self.random.choice(self.names)});")
+        else:
+            lines.append(f"{pad}{self.random.choice(self.names)} = {self.expression()};")
+        return 1
+
+    def block(self, depth, lines, indent):
+        count = 0
+        for _ in range(self.random.randint(1, 4)):
+            count += self.statement(depth, lines, indent)
+        return count
+
+    def program(self, statements):
+        lines = ["[* generated benchmark program *]", "#"]
+        for start in range(0, len(self.names), 16):
+            lines.append(f"integer {', '.join(self.names[start:start + 16])};")
+        count = 0
+        while count < statements:
+            count += self.statement(0, lines, 0)
+        lines.append("#")
+        return '\n'.join(lines) + '\n'
+
+
+def generate_program(seed=0, statements=1000, identifiers=16, expression_length=4, nesting_depth=3):
+    generator = ProgramGenerator(seed, identifiers, expression_length, nesting_depth)
+    return generator.program(statements)
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description="Generate a synthetic Rat23F program")
+    argument_parser.add_argument('--seed', type=int, default=0)
+    argument_parser.add_argument('--statements', type=int, default=1000)
+    argument_parser.add_argument('--identifiers', type=int, default=16)
+    argument_parser.add_argument('--expression-length', type=int, default=4)
+    argument_parser.add_argument('--nesting-depth', type=int, default=3)
+    arguments = argument_parser.parse_args()
+    print(generate_program(arguments.seed, arguments.statements, arguments.identifiers,
+                           arguments.expression_length, arguments.nesting_depth), end='')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+# On-disk cache of compiled programs, keyed on the source bytes, the compiler
+# version and the compile options.
+#
+# Each entry is one zlib-compressed file holding the code arrays and the symbol
+# table. Entries are written to a temporary file and renamed into place, so
+# several processes can share a directory: a reader sees a whole entry or none.
+# A hit touches the file, and eviction removes the least recently touched
+# entries once the directory grows past its size limit.
+
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import zlib
+from array import array
+
+from assembly import COMPILER_VERSION, Code
+
+ENTRY_SUFFIX = '.rc'
+ENTRY_MAGIC = b'R23C'
+# magic, instruction count, symbol count, length of the encoded names
+ENTRY_HEADER = struct.Struct('<4sIII')
+DEFAULT_CACHE_SIZE = 64 << 20
+# Fraction of the limit eviction brings the directory down to, so a full cache
+# is not rescanned on every store
+EVICTION_TARGET = 0.8
+
+
+def cache_key(source_bytes, options=None):
+    digest = hashlib.sha256()
+    digest.update(COMPILER_VERSION.encode())
+    digest.update(b'\0')
+    digest.update(json.dumps(options or {}, sort_keys=True).encode())
+    digest.update(b'\0')
+    digest.update(source_bytes)
+    return digest.hexdigest()
+
+
+def encode_entry(code, symbols):
+    # symbols is a list of (lexeme, memory address) pairs
+    names = '\n'.join(lexeme for lexeme, _ in symbols).encode('utf-8')
+    addresses = array('q', (address for _, address in symbols))
+    header = ENTRY_HEADER.pack(ENTRY_MAGIC, len(code), len(symbols), len(names))
+    return zlib.compress(header + code.opcodes.tobytes() + code.operands.tobytes() + addresses.tobytes() + names)
+
+
+def decode_entry(data):
+    data = zlib.decompress(data)
+    magic, count, symbol_count, names_length = ENTRY_HEADER.unpack_from(data)
+    if magic != ENTRY_MAGIC:
+        raise ValueError("Not a cache entry")
+    position = ENTRY_HEADER.size
+    code = Code()
+    code.opcodes = array('B', data[position:position + count])
+    position += count
+    code.operands = array('q', data[position:position + 8 * count])
+    position += 8 * count
+    addresses = array('q', data[position:position + 8 * symbol_count])
+    position += 8 * symbol_count
+    if len(data) != position + names_length:
+        raise ValueError("Truncated cache entry")
+    names = data[position:].decode('utf-8')
+    lexemes = names.split('\n') if symbol_count else []
+    if len(lexemes) != symbol_count:
+        raise ValueError("Truncated cache entry")
+    return code, list(zip(lexemes, addresses))
+
+
+class CompileCache:
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        # Bytes written since the directory size was last measured
+        self.unmeasured_bytes = None
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        # (code, symbols) for key, or None on a miss. A damaged entry counts as
+        # a miss and is removed.
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as entry_file:
+                data = entry_file.read()
+            entry = decode_entry(data)
+        except FileNotFoundError:
+            self.stats['misses'] += 1
+            return None
+        except (ValueError, struct.error, zlib.error):
+            self.stats['misses'] += 1
+            self.remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass  # Evicted by another process since it was read
+        self.stats['hits'] += 1
+        return entry
+
+    def put(self, key, code, symbols):
+        data = encode_entry(code, symbols)
+        handle, temporary_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as entry_file:
+                entry_file.write(data)
+            os.replace(temporary_path, self.path(key))
+        except BaseException:
+            self.remove(temporary_path)
+            raise
+        self.stats['stores'] += 1
+        if self.unmeasured_bytes is None or self.unmeasured_bytes + len(data) > self.max_bytes * (1 - EVICTION_TARGET):
+            self.evict()
+        else:
+            self.unmeasured_bytes += len(data)
+
+    def entries(self):
+        # (mtime, size, path) of every entry, oldest first
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for item in scan:
+                if item.name.endswith(ENTRY_SUFFIX):
+                    try:
+                        status = item.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((status.st_mtime, status.st_size, item.path))
+        entries.sort()
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        # Removes the least recently used entries while the directory is over
+        # its limit, down to EVICTION_TARGET of it
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_bytes:
+            target = self.max_bytes * EVICTION_TARGET
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                if self.remove(path):
+                    self.stats['evictions'] += 1
+                total -= size
+        self.unmeasured_bytes = 0
+
+    def clear(self):
+        for _, _, path in self.entries():
+            self.remove(path)
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
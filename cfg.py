@@ -0,0 +1,495 @@
+# Control-flow graph of the Code generated by assembly.Parser, and the
+# optimization passes that need one.
+#
+# A basic block starts at the first instruction, at every jump or call
+# target and after every JUMP, JUMPZ and RET, and runs up to the next start.
+# A CALL stays inside its block, since control comes back to the
+# instruction after it, but the block records the function's block in calls
+# so code only a call reaches still counts as reachable.
+#
+#   python cfg.py test1.txt test2.txt    # what -O2 does to each program
+#   python cfg.py test1.txt --blocks     # and the blocks it leaves
+#
+# Like optimizer.py, the passes mark instructions as removed and arrange()
+# then builds the new instruction arrays, in a new block order if there is one.
+# Loop-invariant code motion adds instructions instead, so it builds its own.
+
+import argparse
+import sys
+from array import array
+
+from assembly import Lexer, Op, Parser, jump_opcodes, stack_effects
+
+# Instructions after which control does not go on to the next one
+unconditional_opcodes = {Op.JUMP, Op.RET}
+# Instructions combining the top two values without touching memory
+binary_opcodes = {Op.ADD, Op.SUB, Op.MUL, Op.DIV, Op.GRT, Op.LES, Op.EQU, Op.NEQ, Op.GEQ, Op.LEQ}
+
+
+class Block:
+    __slots__ = ('index', 'start', 'end', 'successors', 'predecessors', 'calls')
+
+    def __init__(self, index, start, end):
+        self.index = index
+        self.start = start       # First instruction
+        self.end = end           # Past the last one
+        self.successors = []     # The block after it first if control can fall into it
+        self.predecessors = []
+        self.calls = []          # Blocks its CALLs go to
+
+
+def leaders(code):
+    # Where each basic block starts, in order
+    opcodes = code.opcodes
+    operands = code.operands
+    count = len(opcodes)
+    starts = {0}
+    for index in range(count):
+        opcode = opcodes[index]
+        if opcode in jump_opcodes:
+            starts.add(operands[index])
+            if opcode != Op.CALL:
+                starts.add(index + 1)
+        elif opcode == Op.RET:
+            starts.add(index + 1)
+    starts.discard(count)  # A jump to the end of the program ends it
+    return sorted(starts) if count else []
+
+
+def falls_through(code, block):
+    return code.opcodes[block.end - 1] not in unconditional_opcodes
+
+
+def build(code):
+    # The basic blocks of code in instruction order, with their edges
+    opcodes = code.opcodes
+    operands = code.operands
+    starts = leaders(code)
+    blocks = []
+    block_at = {}
+    for number, start in enumerate(starts):
+        end = starts[number + 1] if number + 1 < len(starts) else len(opcodes)
+        block = Block(number, start, end)
+        blocks.append(block)
+        block_at[start] = block
+
+    for block in blocks:
+        last = block.end - 1
+        targets = []
+        if falls_through(code, block) and block.end in block_at:
+            targets.append(block_at[block.end])
+        if opcodes[last] in (Op.JUMP, Op.JUMPZ) and operands[last] in block_at:
+            targets.append(block_at[operands[last]])
+        for successor in targets:
+            if successor not in block.successors:
+                block.successors.append(successor)
+                successor.predecessors.append(block)
+        for index in range(block.start, block.end):
+            if opcodes[index] == Op.CALL:
+                block.calls.append(block_at[operands[index]])
+    return blocks
+
+
+def reachable(blocks):
+    # The blocks control can get to from the first one, calls included
+    seen = set()
+    work = blocks[:1]
+    while work:
+        block = work.pop()
+        if block.index in seen:
+            continue
+        seen.add(block.index)
+        work.extend(block.successors)
+        work.extend(block.calls)
+    return seen
+
+
+def arrange(code, live, order=None):
+    # Keeps the live instructions, taking the blocks in order if one is
+    # given, and points each jump at where its target now is: a removed
+    # instruction's place goes to whatever comes after it in the new order.
+    # Returns the number of instructions removed.
+    opcodes = code.opcodes
+    operands = code.operands
+    spans = [(block.start, block.end) for block in order] if order is not None else [(0, len(opcodes))]
+    new_index = array('q', [0]) * (len(opcodes) + 1)
+    count = 0
+    for start, end in spans:
+        for index in range(start, end):
+            new_index[index] = count
+            if live[index]:
+                count += 1
+    new_index[len(opcodes)] = count
+
+    new_opcodes = array('B')
+    new_operands = array('q')
+    for start, end in spans:
+        for index in range(start, end):
+            if live[index]:
+                opcode = opcodes[index]
+                new_opcodes.append(opcode)
+                new_operands.append(new_index[operands[index]] if opcode in jump_opcodes else operands[index])
+    code.opcodes = new_opcodes
+    code.operands = new_operands
+    return len(opcodes) - count
+
+
+def fold_branches(code, live, stats):
+    # PUSHI c, JUMPZ t  ->  JUMP t if c is 0, and nothing otherwise. The
+    # peephole optimizer folds a constant condition such as 1 == 1 down to
+    # the PUSHI first. Nothing may jump to the JUMPZ, which would skip the
+    # PUSHI.
+    opcodes = code.opcodes
+    operands = code.operands
+    targets = {operands[index] for index in range(len(opcodes)) if opcodes[index] in jump_opcodes}
+    changed = False
+    for index in range(1, len(opcodes)):
+        if opcodes[index] == Op.JUMPZ and opcodes[index - 1] == Op.PUSHI and index not in targets:
+            live[index - 1] = False
+            if operands[index - 1] == 0:
+                opcodes[index] = Op.JUMP
+            else:
+                live[index] = False
+            stats['branches'] += 1
+            changed = True
+    return changed
+
+
+def remove_unreachable(code, live, stats):
+    # Drops the blocks nothing can get to: code after a ret or an endless
+    # loop, the branch a folded condition never takes, and functions whose
+    # every call was inlined
+    blocks = build(code)
+    seen = reachable(blocks)
+    changed = False
+    for block in blocks:
+        if block.index not in seen:
+            for index in range(block.start, block.end):
+                live[index] = False
+            stats['unreachable'] += 1
+            changed = True
+    return changed
+
+
+def layout(code, live, stats):
+    # A new block order with fewer taken jumps, or None to keep this one.
+    # Blocks that fall into the next one stay together as a chain, the first
+    # chain stays first and the one running off the end of the program stays
+    # last. Otherwise a chain ending in a JUMP is followed by the chain the
+    # JUMP goes to, and the JUMP is dropped, if everything else that jumps
+    # into that chain is placed already: no jump that went forward goes
+    # backward after that, so the code keeps the nesting of the ifs and
+    # whiles it came from.
+    opcodes = code.opcodes
+    operands = code.operands
+    blocks = build(code)
+    if not blocks:
+        return None
+    chains = []
+    chain_of = []
+    for block in blocks:
+        if block.index and falls_through(code, blocks[block.index - 1]):
+            chains[-1].append(block)
+        else:
+            chains.append([block])
+        chain_of.append(len(chains) - 1)
+    last_chain = len(chains) - 1 if falls_through(code, blocks[-1]) else None
+    chain_at = {chain[0].start: number for number, chain in enumerate(chains)}
+
+    order = [0]
+    placed = {0}
+    following = 1  # The first chain in the old order not placed yet, or not checked
+    dropped = False
+    while len(order) < len(chains):
+        last = chains[order[-1]][-1].end - 1
+        number = chain_at.get(operands[last]) if opcodes[last] == Op.JUMP else None
+        if (number is None or number in placed or (number == last_chain and len(order) < len(chains) - 1)
+                or any(chain_of[predecessor.index] not in placed and chain_of[predecessor.index] != number
+                       for block in chains[number] for predecessor in block.predecessors)):
+            while following in placed or (following == last_chain and len(order) < len(chains) - 1):
+                following += 1
+            number = following
+        if opcodes[last] == Op.JUMP and chains[number][0].start == operands[last]:
+            live[last] = False
+            stats['laid_out'] += 1
+            dropped = True
+        order.append(number)
+        placed.add(number)
+    if not dropped:
+        return None
+    return [block for number in order for block in chains[number]]
+
+
+def dominators(blocks):
+    # Immediate dominator of each block by index, following calls as well as
+    # edges from the first block, which is its own; None for blocks control
+    # cannot reach. The iterative algorithm of Cooper, Harvey and Kennedy.
+    count = len(blocks)
+    idom = [None] * count
+    if not count:
+        return idom
+    entering = [[] for _ in range(count)]
+    postorder = []
+    visited = bytearray(count)
+    visited[0] = 1
+    stack = [(blocks[0], iter(blocks[0].successors + blocks[0].calls))]
+    while stack:
+        block, following = stack[-1]
+        for successor in following:
+            entering[successor.index].append(block.index)
+            if not visited[successor.index]:
+                visited[successor.index] = 1
+                stack.append((successor, iter(successor.successors + successor.calls)))
+                break
+        else:
+            stack.pop()
+            postorder.append(block.index)
+    number = [0] * count
+    for position, index in enumerate(postorder):
+        number[index] = position
+
+    idom[0] = 0
+    changed = True
+    while changed:
+        changed = False
+        for index in reversed(postorder):
+            if index == 0:
+                continue
+            new = None
+            for predecessor in entering[index]:
+                if idom[predecessor] is None:
+                    continue
+                if new is None:
+                    new = predecessor
+                    continue
+                # Walk both up the tree to where they meet
+                other = predecessor
+                while other != new:
+                    while number[other] < number[new]:
+                        other = idom[other]
+                    while number[new] < number[other]:
+                        new = idom[new]
+            if idom[index] != new:
+                idom[index] = new
+                changed = True
+    return idom
+
+
+def dominates(idom, dominator, index):
+    while index != dominator and index != 0:
+        index = idom[index]
+    return index == dominator
+
+
+def natural_loops(blocks, idom):
+    # Header block index -> indices of the blocks in its loop: those that can
+    # get to an edge back to the header without going through it. A while
+    # loop's JUMP to its LABEL is such an edge, and so is the JUMPZ block
+    # layout can turn it into.
+    loops = {}
+    for block in blocks:
+        if idom[block.index] is None:
+            continue
+        for successor in block.successors:
+            if not dominates(idom, successor.index, block.index):
+                continue
+            body = loops.setdefault(successor.index, {successor.index})
+            work = [block]
+            while work:
+                member = work.pop()
+                if member.index not in body:
+                    body.add(member.index)
+                    work.extend(predecessor for predecessor in member.predecessors
+                                if idom[predecessor.index] is not None)
+    return loops
+
+
+def invariant_expressions(code, block, written):
+    # (first, end) of each longest run of instructions in block that computes
+    # one value from constants and addresses not in written, with at least
+    # one operator in it. A DIV only counts when it divides by a nonzero
+    # constant: the hoisted copy runs even if the loop body never would have.
+    opcodes = code.opcodes
+    operands = code.operands
+    stack = []  # (first, end, has an operator) for each value pushed, or None if it can vary
+    found = []
+    for index in range(block.start, block.end):
+        opcode = opcodes[index]
+        if opcode == Op.PUSHI or (opcode == Op.PUSHM and operands[index] not in written):
+            stack.append((index, index + 1, False))
+            continue
+        pops, pushes = stack_effects[opcode]
+        values = [stack.pop() if stack else None for _ in range(pops)]
+        values.reverse()
+        # The operands have to come right before the operator: an inlined
+        # function's body can sit between a value and its use
+        if opcode in binary_opcodes and None not in values and values[0][1] == values[1][0] and values[1][1] == index:
+            right = values[1]
+            if opcode != Op.DIV or (right[1] - right[0] == 1 and opcodes[right[0]] == Op.PUSHI and operands[right[0]]):
+                stack.append((values[0][0], index + 1, True))
+                continue
+        found.extend((value[0], value[1]) for value in values if value is not None and value[2])
+        stack.extend([None] * pushes)
+    found.extend((value[0], value[1]) for value in stack if value is not None and value[2])
+    return found
+
+
+def hoist_invariants(code, symbol_table, stats):
+    # Loop-invariant code motion: an expression in a loop that only reads
+    # addresses the loop never stores to is worked out once in a preheader
+    # before the loop, kept at an address symbol_table.temporary() hands out,
+    # and read from there inside it. Jumps into the loop from outside go to
+    # the preheader instead of the header. Loops with a CALL in them are left
+    # alone, since the function may store anywhere, or call back into the
+    # loop's own function and use the same temporary. Outer loops go first,
+    # so an expression leaves every loop it does not depend on at once.
+    # Returns whether anything was hoisted.
+    opcodes = code.opcodes
+    operands = code.operands
+    blocks = build(code)
+    idom = dominators(blocks)
+    claimed = bytearray(len(opcodes))  # Instructions already part of a hoisted expression
+    preheaders = {}                    # Header instruction -> (instructions to run first, loop body)
+    replaced = {}                      # First instruction of a hoisted expression -> (end, temporary)
+    for header, body in sorted(natural_loops(blocks, idom).items(), key=lambda item: -len(item[1])):
+        members = [blocks[index] for index in sorted(body)]
+        # The preheader goes right before the header, so nothing in the loop
+        # may fall into it
+        if any(block.calls for block in members) or (header and header - 1 in body and
+                                                     falls_through(code, blocks[header - 1])):
+            continue
+        written = {operands[index] for block in members for index in range(block.start, block.end)
+                   if opcodes[index] == Op.POPM}
+        temporaries = {}  # Instructions of an expression -> temporary holding its value
+        preheader = []
+        for block in members:
+            for first, end in invariant_expressions(code, block, written):
+                if any(claimed[first:end]):
+                    continue
+                key = (opcodes[first:end].tobytes(), operands[first:end].tobytes())
+                if key not in temporaries:
+                    temporaries[key] = symbol_table.temporary()
+                    preheader.extend(zip(opcodes[first:end], operands[first:end]))
+                    preheader.append((Op.POPM, temporaries[key]))
+                replaced[first] = (end, temporaries[key])
+                claimed[first:end] = b'\x01' * (end - first)
+        if preheader:
+            preheaders[blocks[header].start] = (preheader, body)
+            stats['hoisted'] += len(temporaries)
+    if not preheaders:
+        return False
+
+    block_of = array('q', [0]) * len(opcodes)
+    for block in blocks:
+        for index in range(block.start, block.end):
+            block_of[index] = block.index
+    new_index = array('q', [0]) * (len(opcodes) + 1)
+    entry = {}  # Header instruction -> where its preheader starts now
+    jumps = []  # (new index, old index) of each jump
+    new_opcodes = array('B')
+    new_operands = array('q')
+    index = 0
+    while index < len(opcodes):
+        if index in preheaders:
+            entry[index] = len(new_opcodes)
+            for opcode, operand in preheaders[index][0]:
+                new_opcodes.append(opcode)
+                new_operands.append(operand)
+        new_index[index] = len(new_opcodes)
+        if index in replaced:
+            # Only the first instruction of an expression can start a block
+            end, temporary = replaced[index]
+            new_opcodes.append(Op.PUSHM)
+            new_operands.append(temporary)
+            index = end
+            continue
+        if opcodes[index] in jump_opcodes:
+            jumps.append((len(new_opcodes), index))
+        new_opcodes.append(opcodes[index])
+        new_operands.append(operands[index])
+        index += 1
+    new_index[len(opcodes)] = len(new_opcodes)
+    for position, index in jumps:
+        target = operands[index]
+        if target in entry and block_of[index] not in preheaders[target][1]:
+            new_operands[position] = entry[target]
+        else:
+            new_operands[position] = new_index[target]
+    code.opcodes = new_opcodes
+    code.operands = new_operands
+    return True
+
+
+def count_edges(blocks):
+    return sum(len(block.successors) for block in blocks)
+
+
+def simplify(code):
+    # Folds constant branches, removes unreachable blocks and lays the rest
+    # out again until nothing changes; returns counts of what was done and
+    # the blocks and edges left
+    stats = {'branches': 0, 'unreachable': 0, 'laid_out': 0, 'removed': 0, 'blocks': 0, 'edges': 0}
+    size = len(code)
+    changed = True
+    while changed:
+        live = bytearray(b'\x01') * len(code)
+        changed = fold_branches(code, live, stats)
+        arrange(code, live)
+        live = bytearray(b'\x01') * len(code)
+        changed = remove_unreachable(code, live, stats) or changed
+        arrange(code, live)
+        live = bytearray(b'\x01') * len(code)
+        order = layout(code, live, stats)
+        if order is not None:
+            arrange(code, live, order)
+            changed = True
+    blocks = build(code)
+    stats['blocks'] = len(blocks)
+    stats['edges'] = count_edges(blocks)
+    stats['removed'] = size - len(code)
+    return stats
+
+
+def describe(code, blocks):
+    # One line per block: its instructions and where control goes next
+    for block in blocks:
+        successors = ', '.join(str(successor.index) for successor in block.successors) or 'end'
+        calls = ''.join(f", calls {callee.index}" for callee in block.calls)
+        yield f"block {block.index}: instructions {block.start}-{block.end - 1} -> {successors}{calls}"
+
+
+def main():
+    from optimizer import optimize
+
+    argument_parser = argparse.ArgumentParser(description="Control-flow graph statistics of Rat23F programs at -O2")
+    argument_parser.add_argument('inputs', nargs='+')
+    argument_parser.add_argument('--blocks', action='store_true', help="list the blocks left after optimizing")
+    arguments = argument_parser.parse_args()
+    status = 0
+    for path in arguments.inputs:
+        try:
+            with open(path, "r", encoding='utf-8-sig') as input_f:
+                source = input_f.read()
+            lexer = Lexer()
+            lexer.tokenize(source)
+            parser = Parser(lexer, None)
+            parser.parse(source)
+        except Exception as e:
+            print(f"{path}: error: {e}")
+            status = 1
+            continue
+        code = parser.code
+        before = len(code)
+        stats = optimize(code, 2, parser.symbol_table)
+        print(f"{path}: {before} -> {len(code)} instructions, {stats['blocks']} blocks, {stats['edges']} edges; "
+              f"{stats['unreachable']} unreachable blocks removed, {stats['branches']} constant branches folded, "
+              f"{stats['laid_out']} jumps removed by block layout, {stats['hoisted']} loop-invariant expressions "
+              f"hoisted, {stats['reused']} repeated expressions reused")
+        if arguments.blocks:
+            for line in describe(code, build(code)):
+                print(f"  {line}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,290 @@
+# Long-lived compile server that keeps the compiler loaded between compiles.
+#
+#   python daemon.py serve --watch src -o out      # recompile src/*.txt as they change
+#   python daemon.py compile test2.txt -o out2.txt # ask the running daemon
+#   python daemon.py stop
+#
+# The server speaks newline-delimited JSON over a Unix socket: one request
+# object per line, one response object per line. A request is
+#   {"command": "compile", "input": path, "output": path, "optimize": 0, "all_errors": false}
+# or {"command": "stats"} or {"command": "stop"}. Paths are resolved by the
+# daemon, so clients should send absolute ones; the client below does.
+#
+# Compiles run on a thread pool, so a long one does not hold up other
+# clients or the watcher; each file is compiled by one of them at a time.
+#
+# The client half only needs the standard library, so it starts quickly even
+# though the compiler itself is not imported until the server starts.
+
+import argparse
+import asyncio
+import fnmatch
+import functools
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), f"rat23f-{os.getuid() if hasattr(os, 'getuid') else 0}.sock")
+DEFAULT_POLL_INTERVAL = 0.2
+DEFAULT_PATTERN = '*.txt'
+OPTIMIZATION_LEVELS = (0, 1, 2)
+
+
+class CompileDaemon:
+    def __init__(self, socket_path=DEFAULT_SOCKET, watch_dir=None, output_dir=None, pattern=DEFAULT_PATTERN,
+                 poll_interval=DEFAULT_POLL_INTERVAL, optimization_level=0):
+        # Imported here so the client never pays for it
+        import assembly
+        self.compile_file = assembly.compile_file
+        self.batch_output_path = assembly.batch_output_path
+        self.output_suffix = assembly.BATCH_OUTPUT_SUFFIX
+        self.socket_path = socket_path
+        self.watch_dir = watch_dir
+        self.output_dir = output_dir or watch_dir
+        self.pattern = pattern
+        self.poll_interval = poll_interval
+        self.optimization_level = optimization_level
+        # Path -> (mtime_ns, size, options, output path, response) of its last compile
+        self.compiled = {}
+        self.stats = {'requests': 0, 'compiles': 0, 'unchanged': 0, 'errors': 0, 'watched': 0}
+        self.server = None
+        self.stopping = None
+        self.executor = None
+        self.locks = {}  # Input path -> asyncio.Lock held while it compiles
+
+    async def compile(self, input_path, output_path, optimization_level=0, all_errors=False):
+        # Compiles input_path unless neither it nor the options changed since
+        # it was last compiled to the same output, which must still exist
+        async with self.locks.setdefault(input_path, asyncio.Lock()):
+            try:
+                status = os.stat(input_path)
+            except OSError as e:
+                self.stats['errors'] += 1
+                return {'ok': False, 'error': f"{input_path}: {e.strerror}"}
+            options = (optimization_level, all_errors)
+            previous = self.compiled.get(input_path)
+            if (previous is not None and previous[:4] == (status.st_mtime_ns, status.st_size, options, output_path)
+                    and os.path.exists(output_path)):
+                self.stats['unchanged'] += 1
+                return dict(previous[4], unchanged=True)
+
+            start = time.perf_counter()
+            _, instructions, symbols, error, _, _ = await asyncio.get_running_loop().run_in_executor(
+                self.executor, functools.partial(self.compile_file, input_path, output_path, optimization_level,
+                                                 recover=all_errors))
+            response = {
+                'ok': error is None,
+                'input': input_path,
+                'output': output_path,
+                'instructions': instructions,
+                'symbols': symbols,
+                'seconds': time.perf_counter() - start,
+            }
+            if error is not None:
+                response['error'] = error
+                self.stats['errors'] += 1
+            self.stats['compiles'] += 1
+            self.compiled[input_path] = (status.st_mtime_ns, status.st_size, options, output_path, response)
+            return response
+
+    async def handle(self, request):
+        if not isinstance(request, dict):
+            return {'ok': False, 'error': "Bad request: expected a JSON object"}
+        command = request.get('command', 'compile')
+        if command == 'compile':
+            self.stats['requests'] += 1
+            input_path = request.get('input')
+            output_path = request.get('output')
+            optimization_level = request.get('optimize', 0)
+            all_errors = request.get('all_errors', False)
+            if not input_path:
+                return {'ok': False, 'error': "No input file given"}
+            if not isinstance(input_path, str):
+                return {'ok': False, 'error': "Bad request: input must be a string"}
+            if output_path is not None and not isinstance(output_path, str):
+                return {'ok': False, 'error': "Bad request: output must be a string"}
+            # bool is an int too, but true is not an optimization level
+            if type(optimization_level) is not int or optimization_level not in OPTIMIZATION_LEVELS:
+                return {'ok': False, 'error': f"Bad request: optimize must be one of {OPTIMIZATION_LEVELS}"}
+            if not isinstance(all_errors, bool):
+                return {'ok': False, 'error': "Bad request: all_errors must be true or false"}
+            output_path = output_path or self.batch_output_path(input_path, os.path.dirname(input_path))
+            return await self.compile(input_path, output_path, optimization_level, all_errors)
+        if command == 'stats':
+            return dict(self.stats, ok=True, files=len(self.compiled))
+        if command == 'stop':
+            self.stopping.set()
+            return {'ok': True}
+        return {'ok': False, 'error': f"Unknown command: {command}"}
+
+    async def serve_client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError as e:
+                    response = {'ok': False, 'error': f"Bad request: {e}"}
+                else:
+                    response = await self.handle(request)
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def scan(self):
+        # (path, mtime_ns, size) of every watched file. Compiled output matches
+        # the default pattern too, and is written beside the sources unless
+        # -o says otherwise, so it is never taken for a source.
+        files = []
+        with os.scandir(self.watch_dir) as entries:
+            for entry in entries:
+                if (entry.is_file() and fnmatch.fnmatch(entry.name, self.pattern)
+                        and not entry.name.endswith(self.output_suffix)):
+                    try:
+                        status = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((entry.path, status.st_mtime_ns, status.st_size))
+        return files
+
+    async def watch(self):
+        # Polls the watched directory and recompiles what changed since the
+        # last poll
+        seen = {}
+        while not self.stopping.is_set():
+            for path, mtime, size in self.scan():
+                if seen.get(path) != (mtime, size):
+                    seen[path] = (mtime, size)
+                    output_path = self.batch_output_path(path, self.output_dir)
+                    response = await self.compile(path, output_path, self.optimization_level)
+                    if not response.get('unchanged'):
+                        self.stats['watched'] += 1
+                        report(response)
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self):
+        self.stopping = asyncio.Event()
+        self.executor = ThreadPoolExecutor()
+        if os.path.exists(self.socket_path):
+            if ping(self.socket_path):
+                raise Exception(f"A daemon is already listening on {self.socket_path}")
+            os.remove(self.socket_path)  # Left behind by a daemon that died
+        self.server = await asyncio.start_unix_server(self.serve_client, path=self.socket_path)
+        tasks = []
+        if self.watch_dir is not None:
+            os.makedirs(self.output_dir, exist_ok=True)
+            tasks.append(asyncio.ensure_future(self.watch()))
+        print(f"Listening on {self.socket_path}" + (f", watching {self.watch_dir}" if self.watch_dir else ""), flush=True)
+        try:
+            await self.stopping.wait()
+        finally:
+            self.server.close()
+            await self.server.wait_closed()
+            for task in tasks:
+                await task
+            self.executor.shutdown()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+
+def report(response):
+    if response['ok']:
+        print(f"{response['input']}: {response['instructions']} instructions, {response['symbols']} identifiers "
+              f"-> {response['output']} ({response['seconds'] * 1000:.1f} ms)", flush=True)
+    else:
+        for line in response['error'].splitlines():
+            print(f"{response.get('input', '')}: error: {line}", flush=True)
+
+
+# Client
+
+def request(socket_path, message, timeout=30):
+    # Sends one request to the daemon and returns its response
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(timeout)
+        client.connect(socket_path)
+        client.sendall(json.dumps(message).encode() + b'\n')
+        data = b''
+        while not data.endswith(b'\n'):
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    return json.loads(data)
+
+
+def ping(socket_path):
+    try:
+        request(socket_path, {'command': 'stats'}, timeout=1)
+        return True
+    except OSError:
+        return False
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description="Rat23F compile daemon and its client")
+    argument_parser.add_argument('--socket', default=DEFAULT_SOCKET, help=f"Unix socket path (default: {DEFAULT_SOCKET})")
+    commands = argument_parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help="run the daemon")
+    serve.add_argument('--watch', help="directory to recompile files from as they change")
+    serve.add_argument('-o', '--output-dir', help="where watched files are compiled to (default: the watched directory)")
+    serve.add_argument('--pattern', default=DEFAULT_PATTERN, help=f"watched file names (default: {DEFAULT_PATTERN})")
+    serve.add_argument('--interval', type=float, default=DEFAULT_POLL_INTERVAL, help="seconds between polls")
+    serve.add_argument('-O', dest='optimize', type=int, choices=OPTIMIZATION_LEVELS, default=0)
+
+    compile_command = commands.add_parser('compile', help="compile a file with the running daemon")
+    compile_command.add_argument('input')
+    compile_command.add_argument('-o', '--output', help="output file (default: <input stem>.asm.txt beside it)")
+    compile_command.add_argument('-O', dest='optimize', type=int, choices=OPTIMIZATION_LEVELS, default=0)
+    compile_command.add_argument('--all-errors', action='store_true')
+
+    commands.add_parser('stats', help="print the daemon's counters")
+    commands.add_parser('stop', help="stop the daemon")
+    arguments = argument_parser.parse_args()
+
+    if not hasattr(socket, 'AF_UNIX'):
+        print("The compile daemon needs Unix domain sockets")
+        return 2
+
+    if arguments.command == 'serve':
+        daemon = CompileDaemon(arguments.socket, arguments.watch, arguments.output_dir, arguments.pattern,
+                               arguments.interval, arguments.optimize)
+        try:
+            asyncio.run(daemon.run())
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    try:
+        if arguments.command == 'compile':
+            response = request(arguments.socket, {
+                'command': 'compile',
+                'input': os.path.abspath(arguments.input),
+                'output': os.path.abspath(arguments.output) if arguments.output else None,
+                'optimize': arguments.optimize,
+                'all_errors': arguments.all_errors,
+            })
+            report(response)
+        else:
+            response = request(arguments.socket, {'command': arguments.command})
+            if arguments.command == 'stats':
+                print(json.dumps(response, indent=2, sort_keys=True))
+    except OSError as e:
+        print(f"Could not reach the daemon on {arguments.socket}: {e.strerror or e}")
+        return 2
+    return 0 if response.get('ok') else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+# The Rat23F grammar (R1-R29) in LL(1) form, and the parse tables built from it.
+#
+#   python grammar.py            # report FIRST/FOLLOW conflicts, if any
+#   python grammar.py --write    # regenerate parse_tables.py
+#   python grammar.py --check    # fail if parse_tables.py is out of date
+#
+# The rules are the ones in the assignment with the repeated prefixes factored
+# out (R3, R6, R11, R13, R18, R19 and R28 each gain a Prime or Tail rule), which
+# is also how Parser reads them. FIRST and FOLLOW sets are computed from it and
+# each nonterminal the parser has to choose an alternative for gets a table
+# from the next token to the alternative's name. The tables are written out as
+# parse_tables.py, so the parser only imports them.
+#
+# A table is a pair of dicts, lexeme -> alternative and token type ->
+# alternative, looked up type first. Identifiers and numbers are decided by
+# their type in one lookup; the types of keywords, operators and separators map
+# to None, which sends the parser on to the lexeme. A fixed lexeme is only ever
+# lexed as its own token, so the lexeme alone identifies it, and string keys
+# are cheaper to look up than (type, lexeme) tuples.
+#
+# A terminal is a quoted lexeme, or one of the token classes below. 'function'
+# is lexed as an identifier, so it matches <Identifier> wherever the grammar
+# does not ask for 'function' itself.
+
+import argparse
+import hashlib
+import os
+import pprint
+import sys
+
+from assembly import EOF_TOKEN, IDENTIFIER, INTEGER, INVALID, KEYWORD, OPERATOR, REAL, SEPARATOR, fixed_lexeme_tokens
+
+EMPTY = '<Empty>'
+END = '$'
+token_classes = {'<Identifier>': IDENTIFIER, '<Integer>': INTEGER}
+
+# nonterminal: [(alternative name, symbols), ...]. An empty symbol list is <Empty>.
+GRAMMAR = {
+    '<Rat23F>': [('rat23f', ['<Opt Function Definitions>', "'#'", '<Opt Declaration List>', '<Statement List>', "'#'"])],
+    '<Opt Function Definitions>': [('function_definitions', ['<Function Definitions>']), ('empty', [])],
+    '<Function Definitions>': [('function_definitions', ['<Function>', '<Function Definitions Prime>'])],
+    '<Function Definitions Prime>': [('function_definitions', ['<Function Definitions>']), ('empty', [])],
+    '<Function>': [('function', ["'function'", '<Identifier>', "'('", '<Opt Parameter List>', "')'",
+                                 '<Opt Declaration List>', '<Body>'])],
+    '<Opt Parameter List>': [('parameter_list', ['<Parameter List>']), ('empty', [])],
+    '<Parameter List>': [('parameter_list', ['<Parameter>', '<Parameter List Prime>'])],
+    '<Parameter List Prime>': [('more', ["','", '<Parameter List>']), ('empty', [])],
+    '<Parameter>': [('parameter', ['<IDs>', '<Qualifier>'])],
+    '<Qualifier>': [('integer', ["'integer'"]), ('bool', ["'bool'"]), ('real', ["'real'"])],
+    '<Body>': [('body', ["'{'", '<Statement List>', "'}'"])],
+    '<Opt Declaration List>': [('declaration_list', ['<Declaration List>']), ('empty', [])],
+    '<Declaration List>': [('declaration_list', ['<Declaration>', "';'", '<Declaration List Prime>'])],
+    '<Declaration List Prime>': [('declaration_list', ['<Declaration List>']), ('empty', [])],
+    '<Declaration>': [('declaration', ['<Qualifier>', '<IDs>'])],
+    '<IDs>': [('ids', ['<Identifier>', '<IDs Prime>'])],
+    '<IDs Prime>': [('more', ["','", '<IDs>']), ('empty', [])],
+    '<Statement List>': [('statement_list', ['<Statement>', '<Statement List Prime>'])],
+    '<Statement List Prime>': [('statement', ['<Statement>', '<Statement List Prime>']), ('empty', [])],
+    '<Statement>': [('compound', ['<Compound>']), ('assign', ['<Assign>']), ('if', ['<If>']),
+                    ('return', ['<Return>']), ('print', ['<Print>']), ('scan', ['<Scan>']), ('while', ['<While>'])],
+    '<Compound>': [('compound', ["'{'", '<Statement List>', "'}'"])],
+    '<Assign>': [('assign', ['<Identifier>', "'='", '<Expression>', "';'"])],
+    '<If>': [('if', ["'if'", "'('", '<Condition>', "')'", '<Statement>', '<If Tail>'])],
+    '<If Tail>': [('endif', ["'endif'"]), ('else', ["'else'", '<Statement>', "'endif'"])],
+    '<Return>': [('return', ["'ret'", '<Return Tail>'])],
+    '<Return Tail>': [('bare', ["';'"]), ('expression', ['<Expression>', "';'"])],
+    '<Print>': [('print', ["'put'", "'('", '<Expression>', "')'", "';'"])],
+    '<Scan>': [('scan', ["'get'", "'('", '<IDs>', "')'", "';'"])],
+    '<While>': [('while', ["'while'", "'('", '<Condition>', "')'", '<Statement>'])],
+    '<Condition>': [('condition', ['<Expression>', '<Relop>', '<Expression>'])],
+    '<Relop>': [(name, ["'" + lexeme + "'"]) for name, lexeme in
+                (('==', '=='), ('!=', '!='), ('>', '>'), ('<', '<'), ('<=', '<='), ('=>', '=>'))],
+    '<Expression>': [('expression', ['<Term>', '<Expression Prime>'])],
+    '<Expression Prime>': [('+', ["'+'", '<Term>', '<Expression Prime>']), ('-', ["'-'", '<Term>', '<Expression Prime>']),
+                           ('empty', [])],
+    '<Term>': [('term', ['<Factor>', '<Term Prime>'])],
+    '<Term Prime>': [('*', ["'*'", '<Factor>', '<Term Prime>']), ('/', ["'/'", '<Factor>', '<Term Prime>']),
+                     ('empty', [])],
+    '<Factor>': [('negate', ["'-'", '<Primary>']), ('primary', ['<Primary>'])],
+    '<Primary>': [('identifier', ['<Identifier>', '<Primary Tail>']), ('integer', ['<Integer>']),
+                  ('parenthesized', ["'('", '<Expression>', "')'"]), ('true', ["'true'"]), ('false', ["'false'"])],
+    '<Primary Tail>': [('call', ["'('", '<IDs>', "')'"]), ('empty', [])],
+}
+START = '<Rat23F>'
+
+# The decisions Parser makes, by table name in parse_tables.py
+DECISIONS = {
+    'OPT_FUNCTION_DEFINITIONS': '<Opt Function Definitions>',
+    'FUNCTION_DEFINITIONS_PRIME': '<Function Definitions Prime>',
+    'OPT_PARAMETER_LIST': '<Opt Parameter List>',
+    'PARAMETER_LIST_PRIME': '<Parameter List Prime>',
+    'QUALIFIER': '<Qualifier>',
+    'OPT_DECLARATION_LIST': '<Opt Declaration List>',
+    'DECLARATION_LIST_PRIME': '<Declaration List Prime>',
+    'IDS_PRIME': '<IDs Prime>',
+    'STATEMENT': '<Statement>',
+    'IF_TAIL': '<If Tail>',
+    'RETURN_TAIL': '<Return Tail>',
+    'RELOP': '<Relop>',
+    'EXPRESSION_PRIME': '<Expression Prime>',
+    'TERM_PRIME': '<Term Prime>',
+    'FACTOR': '<Factor>',
+    'PRIMARY': '<Primary>',
+    'PRIMARY_TAIL': '<Primary Tail>',
+}
+
+# The alternative taken on a token no alternative predicts. Nonterminals with
+# an <Empty> alternative take it; these ones go on with the alternative whose
+# first match then reports the error, as the hand written parser always did.
+# The rest report the error at the decision.
+FALLBACKS = {'<If Tail>': 'endif', '<Return Tail>': 'expression', '<Factor>': 'primary'}
+
+# Every token type the lexer produces, for the per-class entries of each table
+TOKEN_TYPES = (KEYWORD, IDENTIFIER, INTEGER, REAL, OPERATOR, SEPARATOR, INVALID, EOF_TOKEN[0])
+FIXED_TOKEN_TYPES = (KEYWORD, OPERATOR, SEPARATOR)
+
+# Tables Parser decides from the lexeme alone, without looking at the type:
+# only fixed lexemes may predict anything but the fallback in them
+LEXEME_DECISIONS = ('IDS_PRIME', 'IF_TAIL', 'RELOP', 'FACTOR', 'PRIMARY_TAIL')
+
+TABLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parse_tables.py')
+
+
+def is_nonterminal(symbol):
+    return symbol.startswith('<') and symbol not in token_classes
+
+
+def terminal_key(symbol):
+    # The parse table key of a terminal: the token itself for a fixed lexeme,
+    # the token type for a class of tokens or the end of input
+    if symbol == END:
+        return EOF_TOKEN[0]
+    if symbol in token_classes:
+        return token_classes[symbol]
+    lexeme = symbol[1:-1]
+    return fixed_lexeme_tokens.get(lexeme, (IDENTIFIER, lexeme))
+
+
+def first_of(symbols, first):
+    # FIRST of a sequence of symbols; contains EMPTY if they can all vanish
+    result = set()
+    for symbol in symbols:
+        if not is_nonterminal(symbol):
+            result.add(symbol)
+            return result
+        result |= first[symbol] - {EMPTY}
+        if EMPTY not in first[symbol]:
+            return result
+    result.add(EMPTY)
+    return result
+
+
+def first_sets(grammar):
+    first = {nonterminal: set() for nonterminal in grammar}
+    changed = True
+    while changed:
+        changed = False
+        for nonterminal, alternatives in grammar.items():
+            for _, symbols in alternatives:
+                new = first_of(symbols, first) - first[nonterminal]
+                if new:
+                    first[nonterminal] |= new
+                    changed = True
+    return first
+
+
+def follow_sets(grammar, first, start=START):
+    follow = {nonterminal: set() for nonterminal in grammar}
+    follow[start].add(END)
+    changed = True
+    while changed:
+        changed = False
+        for nonterminal, alternatives in grammar.items():
+            for _, symbols in alternatives:
+                for position, symbol in enumerate(symbols):
+                    if not is_nonterminal(symbol):
+                        continue
+                    rest = first_of(symbols[position + 1:], first)
+                    new = rest - {EMPTY}
+                    if EMPTY in rest:
+                        new |= follow[nonterminal]
+                    if new - follow[symbol]:
+                        follow[symbol] |= new
+                        changed = True
+    return follow
+
+
+def predict_sets(grammar, first, follow):
+    # nonterminal: [(alternative name, terminals predicting it), ...]
+    predict = {}
+    for nonterminal, alternatives in grammar.items():
+        predict[nonterminal] = []
+        for name, symbols in alternatives:
+            terminals = first_of(symbols, first)
+            if EMPTY in terminals:
+                terminals = (terminals - {EMPTY}) | follow[nonterminal]
+            predict[nonterminal].append((name, terminals))
+    return predict
+
+
+def conflicts(predict):
+    # (nonterminal, terminal, alternatives) wherever one token predicts two
+    # alternatives. 'function' also counts as <Identifier> here, since a table
+    # entry for it would take priority over the one for identifiers.
+    found = []
+    for nonterminal, alternatives in predict.items():
+        by_key = {}
+        for name, terminals in alternatives:
+            for terminal in terminals:
+                by_key.setdefault(terminal_key(terminal), set()).add(name)
+        for key, names in sorted(by_key.items(), key=repr):
+            if isinstance(key, tuple) and key[0] == IDENTIFIER:
+                names = names | by_key.get(IDENTIFIER, set())
+            if len(names) > 1:
+                found.append((nonterminal, key, sorted(names)))
+    return found
+
+
+def build_tables(grammar=GRAMMAR):
+    # Table name: ({lexeme: alternative name or None}, {token type: alternative
+    # name or None}). Every token type and every fixed lexeme has an entry. A
+    # type maps to None when its tokens have no alternative or are told apart
+    # by lexeme, so the parser's type-then-lexeme lookup gives None either way.
+    first = first_sets(grammar)
+    follow = follow_sets(grammar, first)
+    predict = predict_sets(grammar, first, follow)
+    found = conflicts(predict)
+    if found:
+        raise Exception("The grammar is not LL(1): " + '; '.join(
+            f"{nonterminal} on {key!r} could be {' or '.join(names)}" for nonterminal, key, names in found))
+    tables = {}
+    for table_name, nonterminal in DECISIONS.items():
+        if nonterminal in FALLBACKS:
+            fallback = FALLBACKS[nonterminal]
+        else:
+            fallback = next((name for name, symbols in grammar[nonterminal] if not symbols), None)
+        lexemes = {token[1]: fallback for token in fixed_lexeme_tokens.values()}
+        types = {token_type: fallback for token_type in TOKEN_TYPES}
+        by_lexeme = set(FIXED_TOKEN_TYPES)
+        for name, terminals in predict[nonterminal]:
+            for terminal in terminals:
+                key = terminal_key(terminal)
+                if isinstance(key, tuple):
+                    lexemes[key[1]] = name
+                    by_lexeme.add(key[0])
+                else:
+                    types[key] = name
+        for token_type in by_lexeme:
+            types[token_type] = None
+        if table_name in LEXEME_DECISIONS and any(types[token_type] not in (None, fallback) for token_type in TOKEN_TYPES):
+            raise Exception(f"{table_name} is decided by lexeme but a token type predicts {nonterminal}")
+        tables[table_name] = (lexemes, types)
+    return tables
+
+
+def grammar_digest():
+    text = repr((GRAMMAR, DECISIONS, FALLBACKS, TOKEN_TYPES, FIXED_TOKEN_TYPES, sorted(fixed_lexeme_tokens.items())))
+    return hashlib.sha256(text.encode()).hexdigest()[:16]
+
+
+def render_tables(tables):
+    lines = [
+        "# Generated by grammar.py from the Rat23F grammar; do not edit.",
+        "# python grammar.py --write regenerates this file.",
+        "",
+        f"GRAMMAR_DIGEST = {grammar_digest()!r}",
+    ]
+    for table_name, table in tables.items():
+        lines.append("")
+        lines.append(f"# {DECISIONS[table_name]}")
+        lines.append(f"{table_name} = " + pprint.pformat(table, width=120))
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description="Check the Rat23F grammar and generate its parse tables")
+    argument_parser.add_argument('--write', action='store_true', help="regenerate parse_tables.py")
+    argument_parser.add_argument('--check', action='store_true', help="fail if parse_tables.py is out of date")
+    arguments = argument_parser.parse_args()
+
+    first = first_sets(GRAMMAR)
+    predict = predict_sets(GRAMMAR, first, follow_sets(GRAMMAR, first))
+    found = conflicts(predict)
+    for nonterminal, key, names in found:
+        print(f"conflict: {nonterminal} on {key!r} could be {' or '.join(names)}")
+    if found:
+        return 1
+    text = render_tables(build_tables())
+    if arguments.write:
+        with open(TABLES_PATH, 'w', encoding='utf-8', newline='\r\n') as tables_file:
+            tables_file.write(text)
+        print(f"Wrote {TABLES_PATH}")
+    elif arguments.check:
+        try:
+            with open(TABLES_PATH, encoding='utf-8') as tables_file:
+                current = tables_file.read()
+        except FileNotFoundError:
+            current = None
+        if current != text:
+            print(f"{TABLES_PATH} is out of date; run python grammar.py --write")
+            return 1
+        print(f"{TABLES_PATH} is up to date")
+    else:
+        print(f"No LL(1) conflicts in {len(GRAMMAR)} nonterminals")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+# Incremental recompilation for programs edited a function at a time.
+#
+# A program is kept as the fragments of linker.py between compiles. On a new
+# version of the source only the fragments the edit touched are lexed and
+# parsed again, along with those calling a function whose interface the edit
+# changed, and the rest are relinked where they now land. Whenever the
+# edit does not split cleanly into fragments (an unclosed comment, a '#'
+# appearing inside the functions, an error) the whole program is compiled
+# instead, which also raises the same error a normal compile would.
+
+import bisect
+
+from assembly import DEFAULT_INLINE_THRESHOLD, MEMORY_BASE, compile_source
+from linker import (FUNCTION, MAIN, PREFIX, FragmentError, boundary_characters, compile_fragment, compile_fragments,
+                    globals_base, interface, link, split)
+
+COMPARE_CHUNK = 1 << 12
+
+
+def common_prefix_length(old, new):
+    limit = min(len(old), len(new))
+    length = 0
+    while length < limit and old[length:length + COMPARE_CHUNK] == new[length:length + COMPARE_CHUNK]:
+        length += COMPARE_CHUNK
+    length = min(length, limit)
+    while length < limit and old[length] == new[length]:
+        length += 1
+    return length
+
+
+def common_suffix_length(old, new, limit):
+    length = 0
+    while (length + COMPARE_CHUNK <= limit and
+           old[len(old) - length - COMPARE_CHUNK:len(old) - length] == new[len(new) - length - COMPARE_CHUNK:len(new) - length]):
+        length += COMPARE_CHUNK
+    while length < limit and old[len(old) - length - 1] == new[len(new) - length - 1]:
+        length += 1
+    return length
+
+
+def interfaces(fragments):
+    # Function name -> interface() of each function the fragments define
+    return {fragment.function.name: interface(fragment.function) for fragment in fragments if fragment.kind == FUNCTION}
+
+
+class IncrementalCompiler:
+    def __init__(self, inline_threshold=DEFAULT_INLINE_THRESHOLD):
+        self.inline_threshold = inline_threshold
+        self.source = None
+        self.fragments = []
+        # What the last compile did: whether it was a full one, how many
+        # fragments there are, how many were compiled and how much was lexed
+        self.stats = {}
+
+    def compile(self, source):
+        # Returns (code, symbols) for source, as compile_source would
+        if self.source is not None:
+            try:
+                return self.update(source)
+            except FragmentError:
+                pass
+        return self.compile_all(source)
+
+    def compile_all(self, source):
+        self.source = None
+        self.fragments = []
+        try:
+            fragments = split(source, 0, PREFIX)
+            compile_fragments(fragments, self.inline_threshold)
+        except Exception:
+            # Let a normal compile report the error, or compile what the
+            # fragments could not represent
+            self.stats = {'full': True, 'fragments': 0, 'compiled': 0, 'lexed': len(source)}
+            return compile_source(source, inline_threshold=self.inline_threshold)
+        self.source = source
+        self.fragments = fragments
+        self.stats = {'full': True, 'fragments': len(fragments), 'compiled': len(fragments), 'lexed': len(source)}
+        return link(fragments, globals_base(fragments))
+
+    def update(self, source):
+        old = self.source
+        fragments = self.fragments
+        prefix = common_prefix_length(old, source)
+        suffix = common_suffix_length(old, source, min(len(old), len(source)) - prefix)
+        if prefix == len(old) == len(source):
+            self.stats = {'full': False, 'fragments': len(fragments), 'compiled': 0, 'lexed': 0}
+            return link(fragments, globals_base(fragments))
+        delta = len(source) - len(old)
+        old_end = len(old) - suffix
+
+        # The fragments the changed text overlaps, widened while the edit
+        # touches a fragment boundary or a boundary could join two tokens
+        starts = [fragment.start for fragment in fragments]
+        first = max(0, bisect.bisect_right(starts, prefix) - 1)
+        last = max(first, bisect.bisect_right(starts, max(old_end - 1, prefix)) - 1)
+        while first > 0 and (prefix <= fragments[first].start or old[fragments[first].start - 1] not in boundary_characters):
+            first -= 1
+        while last < len(fragments) - 1 and (old_end >= fragments[last].end or
+                                             old[fragments[last].end - 1] not in boundary_characters):
+            last += 1
+        region_start = fragments[first].start
+        region_end = fragments[last].end + delta
+        if region_end < region_start:
+            raise FragmentError("Edit removed the fragment boundaries")
+
+        replaced = fragments[first:last + 1]
+        new = split(source[region_start:region_end], region_start, replaced[0].kind)
+        if new[0].kind != replaced[0].kind or (new[-1].kind == MAIN) != (replaced[-1].kind == MAIN):
+            raise FragmentError("Edit moved the start of the main section")
+        if any(fragment.kind == MAIN for fragment in new[:-1]):
+            raise FragmentError("More than one main section")
+
+        # In order, each knowing the functions before it, and the main section
+        # last since the globals base depends on every frame. The fragments
+        # after the edit that call a function whose interface changed are
+        # compiled again too.
+        after = fragments[last + 1:]
+        updated = fragments[:first] + new + after
+        functions = {fragment.function.name: fragment.function for fragment in fragments[:first]
+                     if fragment.kind == FUNCTION}
+        compiled = len(new)
+        try:
+            for fragment in new:
+                base = globals_base(updated) if fragment.kind == MAIN else MEMORY_BASE
+                compile_fragment(fragment, base, functions, self.inline_threshold)
+                if fragment.kind == FUNCTION:
+                    functions[fragment.function.name] = fragment.function
+            old_interfaces = interfaces(replaced)
+            new_interfaces = interfaces(new)
+            changed = {name for name in old_interfaces.keys() | new_interfaces.keys()
+                       if old_interfaces.get(name) != new_interfaces.get(name)}
+            for fragment in after:
+                name = fragment.function.name if fragment.kind == FUNCTION else None
+                if changed and (fragment.callees & changed or name in changed):
+                    previous = interface(fragment.function) if name is not None else None
+                    base = globals_base(updated) if fragment.kind == MAIN else MEMORY_BASE
+                    compile_fragment(fragment, base, functions, self.inline_threshold)
+                    compiled += 1
+                    if name is not None and interface(fragment.function) != previous:
+                        changed.add(name)
+                if name is not None:
+                    functions[name] = fragment.function
+        except FragmentError:
+            raise
+        except Exception as e:
+            raise FragmentError(str(e))
+
+        for fragment in after:
+            fragment.start += delta
+            fragment.end += delta
+        self.source = source
+        self.fragments = updated
+        self.stats = {'full': False, 'fragments': len(updated), 'compiled': compiled,
+                      'lexed': region_end - region_start}
+        return link(updated, globals_base(updated))
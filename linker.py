@@ -0,0 +1,275 @@
+# Compiling a program a fragment at a time and linking the fragments.
+#
+# A program is cut at token boundaries into fragments: the text before the
+# first function, each function definition and the main section from the
+# first '#' on. Each fragment is compiled on its own into code whose jumps
+# are relative to the fragment, and link() concatenates them, pointing each
+# CALL at the function it names. A function's frame starts at MEMORY_BASE
+# whatever comes before it; the main section's globals start above the
+# largest frame, so its memory operands are relocated when that moves.
+#
+# A fragment is compiled knowing the functions defined before it, since its
+# calls need their parameters and may inline their code. It only has to be
+# compiled again when one of those changes (see interface()), which
+# incremental.py relies on to keep the fragments between edits.
+# compile_parallel() compiles the functions that call no others in worker
+# processes.
+
+import os
+from array import array
+
+from assembly import (DEFAULT_INLINE_THRESHOLD, EOF_TOKEN, MEMORY_BASE, Code, Lexer, Op, Parser, SymbolTable,
+                      compile_source, jump_opcodes, memory_opcodes, symbol_addresses)
+
+PREFIX = 'prefix'
+FUNCTION = 'function'
+MAIN = 'main'
+
+# Characters a token can never continue past; a fragment that does not end
+# in one of these is relexed together with its neighbour after an edit
+boundary_characters = frozenset(' \t\r\n\x0b\x0c{};,()#]')
+
+
+class Fragment:
+    __slots__ = ('kind', 'start', 'end', 'tokens', 'offsets', 'code', 'symbols', 'jumps', 'memory', 'frame_end',
+                 'base', 'function', 'calls', 'callees')
+
+    def __init__(self, kind, start, end, tokens, offsets):
+        self.kind = kind
+        self.start = start      # Source offsets of the fragment, end exclusive
+        self.end = end
+        self.tokens = tokens
+        self.offsets = offsets  # Token offsets from the fragment start
+        self.code = Code()
+        self.symbols = []
+        self.jumps = []         # Indices of jump instructions, for relinking
+        self.memory = []        # Indices of PUSHM/POPM of globals, for relocating them
+        self.frame_end = MEMORY_BASE  # Past a function's frames, or the main section's globals
+        self.base = MEMORY_BASE
+        self.function = None    # The assembly.Function a function fragment defines
+        self.calls = []         # (index, function name) of each CALL
+        self.callees = set()    # Names of the functions it calls or inlines
+
+
+class FragmentError(Exception):
+    # The source cannot be handled fragment by fragment
+    pass
+
+
+def lex(text):
+    # Tokens and offsets of text, which must not end inside a comment
+    last_open = text.rfind('[*')
+    if last_open >= 0 and text.rfind('*]') < last_open:
+        raise FragmentError("Comment may be unclosed")
+    lexer = Lexer(positions=True)
+    lexer.tokenize(text)
+    return lexer.tokens, lexer.offsets
+
+
+def split(text, start, first_kind):
+    # Cuts text, found at offset start in the source, into fragments. The first
+    # fragment is of first_kind, and unless that is PREFIX the text must start
+    # with its first token.
+    tokens, offsets = lex(text)
+    cuts = [(first_kind, 0, 0)]
+    in_main = False
+    for index, token in enumerate(tokens):
+        if in_main:
+            break
+        if token[1] == 'function':
+            kind = FUNCTION
+        elif token[1] == '#':
+            kind = MAIN
+            in_main = True
+        else:
+            continue
+        if index == 0 and first_kind != PREFIX:
+            cuts[0] = (kind, 0, 0)
+        else:
+            cuts.append((kind, index, offsets[index]))
+    if first_kind != PREFIX and (not tokens or tokens[0][1] != ('#' if first_kind == MAIN else 'function')):
+        raise FragmentError(f"Region does not start with a {first_kind}")
+
+    fragments = []
+    for number, (kind, first_token, offset) in enumerate(cuts):
+        if number + 1 < len(cuts):
+            last_token, end = cuts[number + 1][1], cuts[number + 1][2]
+        else:
+            last_token, end = len(tokens), len(text)
+        fragment_offsets = array('I', (token_offset - offset for token_offset in offsets[first_token:last_token]))
+        fragments.append(Fragment(kind, start + offset, start + end, tokens[first_token:last_token], fragment_offsets))
+    return fragments
+
+
+def compile_fragment(fragment, base, functions, inline_threshold=DEFAULT_INLINE_THRESHOLD):
+    # functions maps the name of each function defined before the fragment to
+    # its assembly.Function
+    if fragment.kind == PREFIX:
+        if fragment.tokens:
+            raise FragmentError("Tokens before the first function")
+        return
+    lexer = Lexer()
+    lexer.use_tokens(fragment.tokens)
+    parser = Parser(lexer, None, inline_threshold=inline_threshold)
+    parser.functions.update(functions)
+    parser.current_token = lexer.next_token()
+    if fragment.kind == FUNCTION:
+        fragment.function = parser.function()
+        if parser.current_token is not EOF_TOKEN:
+            raise FragmentError("Tokens after a function definition")
+        fragment.frame_end = parser.symbol_table.high_water
+    else:
+        parser.symbol_table.memory_address = base
+        parser.symbol_table.high_water = base
+        parser.main_section()
+        fragment.base = base
+        fragment.frame_end = parser.symbol_table.memory_address
+    parser.code.resolve()
+    fragment.code = parser.code
+    fragment.symbols = symbol_addresses(parser.symbol_table)
+    fragment.calls = parser.calls
+    fragment.callees = parser.callees
+    opcodes = parser.code.opcodes
+    operands = parser.code.operands
+    fragment.jumps = [index for index in range(len(opcodes)) if opcodes[index] in jump_opcodes and opcodes[index] != Op.CALL]
+    # Inlined functions' frames stay where they are, below the globals
+    fragment.memory = [index for index in range(len(opcodes))
+                       if opcodes[index] in memory_opcodes and operands[index] >= fragment.base]
+
+
+def interface(function):
+    # What code calling the function is compiled from, apart from where it starts
+    template = function.template
+    return (function.parameters, function.frame_start, function.frame_end,
+            template and (template[0].tobytes(), template[1].tobytes()))
+
+
+def link(fragments, base):
+    # One Code and symbol list from the fragments, with jumps moved to where
+    # each fragment lands, calls pointed at the functions they name and the
+    # main section's globals moved to base. As when the whole program is
+    # compiled at once, code with functions in it starts by jumping past them.
+    code = Code()
+    symbols = []
+    offsets = []
+    entries = {}
+    has_functions = any(fragment.kind == FUNCTION for fragment in fragments)
+    offset = 0
+    if has_functions:
+        code.emit(Op.JUMP)
+        offset = 1
+    for fragment in fragments:
+        offsets.append(offset)
+        if fragment.kind == FUNCTION:
+            entries[fragment.function.name] = offset + fragment.function.label.address
+        offset += len(fragment.code)
+
+    for fragment, offset in zip(fragments, offsets):
+        if fragment.kind == MAIN and has_functions:
+            code.operands[0] = offset
+        operands = fragment.code.operands
+        delta = base - fragment.base if fragment.kind == MAIN else 0
+        if (offset and fragment.jumps) or (delta and fragment.memory) or fragment.calls:
+            operands = array('q', operands)
+            for index in fragment.jumps:
+                operands[index] += offset
+            if delta:
+                for index in fragment.memory:
+                    operands[index] += delta
+            for index, name in fragment.calls:
+                operands[index] = entries[name]
+        code.opcodes.extend(fragment.code.opcodes)
+        code.operands.extend(operands)
+        if delta:
+            symbols.extend((lexeme, address + delta) for lexeme, address in fragment.symbols)
+        else:
+            symbols.extend(fragment.symbols)
+    return code, symbols
+
+
+# Fewer functions than this are not worth starting workers for
+PARALLEL_MIN_FUNCTIONS = 32
+# Tasks per worker, so uneven function sizes still balance out
+TASKS_PER_JOB = 4
+
+
+def compile_function_texts(texts, inline_threshold):
+    # Worker side of compile_parallel: compiles each function definition as if
+    # no other function were defined and returns the fragments without their
+    # tokens, which the caller does not need. A function calling another one
+    # cannot be compiled that way and comes back as None.
+    fragments = []
+    for text in texts:
+        fragment = split(text, 0, FUNCTION)[0]
+        try:
+            compile_fragment(fragment, MEMORY_BASE, {}, inline_threshold)
+        except Exception:
+            fragments.append(None)
+            continue
+        fragment.tokens = None
+        fragment.offsets = None
+        fragments.append(fragment)
+    return fragments
+
+
+def globals_base(fragments):
+    return max([MEMORY_BASE] + [fragment.frame_end for fragment in fragments if fragment.kind == FUNCTION])
+
+
+def compile_fragments(fragments, inline_threshold=DEFAULT_INLINE_THRESHOLD):
+    # Compiles the fragments in order, each knowing the functions before it.
+    # Function fragments that have been compiled already are only checked for
+    # a name defined twice.
+    functions = {}
+    for fragment in fragments:
+        if fragment.kind == FUNCTION and fragment.function is not None:
+            if fragment.function.name in functions:
+                raise FragmentError(f"Duplicate function defined: {fragment.function.name}")
+        else:
+            compile_fragment(fragment, globals_base(fragments) if fragment.kind == MAIN else MEMORY_BASE, functions,
+                             inline_threshold)
+        if fragment.kind == FUNCTION:
+            functions[fragment.function.name] = fragment.function
+    if not fragments or fragments[-1].kind != MAIN:
+        raise FragmentError("No main section")
+
+
+def compile_parallel(source, jobs=None, optimization_level=0, min_functions=PARALLEL_MIN_FUNCTIONS,
+                     inline_threshold=DEFAULT_INLINE_THRESHOLD):
+    # Returns (code, symbols) for source, as compile_source would, compiling
+    # the function definitions over jobs worker processes. The functions that
+    # call others, and the main section, are compiled here afterwards. Errors,
+    # and anything the fragments cannot represent, go through compile_source so
+    # they are reported the same way.
+    jobs = jobs or os.cpu_count() or 1
+    try:
+        fragments = split(source, 0, PREFIX)
+        functions = [fragment for fragment in fragments if fragment.kind == FUNCTION]
+        if jobs > 1 and len(functions) >= min_functions:
+            from concurrent.futures import ProcessPoolExecutor
+            tasks = min(len(functions), jobs * TASKS_PER_JOB)
+            size = -(-len(functions) // tasks)
+            batches = [functions[start:start + size] for start in range(0, len(functions), size)]
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(compile_function_texts, [source[fragment.start:fragment.end] for fragment in batch],
+                                           inline_threshold)
+                           for batch in batches]
+                for batch, future in zip(batches, futures):
+                    for fragment, compiled in zip(batch, future.result()):
+                        if compiled is not None:
+                            for name in ('code', 'symbols', 'jumps', 'memory', 'frame_end', 'function', 'calls',
+                                         'callees'):
+                                setattr(fragment, name, getattr(compiled, name))
+        compile_fragments(fragments, inline_threshold)
+    except Exception:
+        return compile_source(source, optimization_level, inline_threshold=inline_threshold)
+    base = globals_base(fragments)
+    code, symbols = link(fragments, base)
+    if optimization_level:
+        import optimizer
+        # Temporaries go above the globals, as in compile_source
+        main = fragments[-1]
+        symbol_table = SymbolTable()
+        symbol_table.memory_address = main.frame_end + base - main.base
+        optimizer.optimize(code, optimization_level, symbol_table)
+    return code, symbols
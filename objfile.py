@@ -0,0 +1,247 @@
+# Binary object files: the compiled code and symbol table in a form tools can
+# map into memory and use without parsing.
+#
+#   python assembly.py test1.txt --format object -o out    # writes out/test1.r23o
+#   python objfile.py out/test1.r23o -o test1.asm.txt      # back to the text listing
+#
+# Layout, little-endian, every section starting on an 8 byte boundary:
+#
+#   header       OBJECT_HEADER below
+#   instructions the opcodes, one byte each, then the operands, one int64 each
+#   symbols      the memory addresses, one int64 each, then count + 1 uint32
+#                offsets into the string table; name i runs from offset i to i + 1
+#   strings      the identifiers, UTF-8, back to back
+#
+# The file is built in memory and written with a single write, or with
+# ObjectWriter a piece at a time while the compiler is still generating it.
+
+import argparse
+import mmap
+import shutil
+import struct
+import sys
+import tempfile
+from array import array
+
+from assembly import Code, opcode_names, operand_opcodes
+
+OBJECT_SUFFIX = '.r23o'
+OBJECT_MAGIC = b'R23O'
+OBJECT_VERSION = 1
+# magic, version, instruction count, symbol count, and the offsets of the
+# instruction, symbol and string sections and the string table's length
+OBJECT_HEADER = struct.Struct('<4sIIIIIII')
+OPERAND = struct.Struct('<q')
+ALIGNMENT = 8
+
+
+class ObjectFileError(Exception):
+    pass
+
+
+def padding(length):
+    return -length % ALIGNMENT
+
+
+# Where the instruction section starts, just past the header
+INSTRUCTIONS_OFFSET = OBJECT_HEADER.size + padding(OBJECT_HEADER.size)
+
+
+def little_endian(values):
+    # The bytes of an array in the file's byte order
+    if sys.byteorder != 'little':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def encode_symbols(symbols):
+    # The padded symbol section and the string table for (lexeme, memory address) symbols
+    names = [lexeme.encode('utf-8') for lexeme, _ in symbols]
+    offsets = array('I', [0])
+    for name in names:
+        offsets.append(offsets[-1] + len(name))
+    symbol_section = little_endian(array('q', (address for _, address in symbols))) + little_endian(offsets)
+    symbol_section += bytes(padding(len(symbol_section)))
+    return symbol_section, b''.join(names)
+
+
+def encode_header(count, symbol_count, symbols_offset, strings_offset, strings_length):
+    return OBJECT_HEADER.pack(OBJECT_MAGIC, OBJECT_VERSION, count, symbol_count, INSTRUCTIONS_OFFSET, symbols_offset,
+                              strings_offset, strings_length)
+
+
+def encode_object(code, symbols):
+    # The object file for code and its (lexeme, memory address) symbols
+    symbol_section, strings = encode_symbols(symbols)
+    count = len(code)
+    instructions = code.opcodes.tobytes() + bytes(padding(count)) + little_endian(code.operands)
+    symbols_offset = INSTRUCTIONS_OFFSET + len(instructions)
+    strings_offset = symbols_offset + len(symbol_section)
+    header = encode_header(count, len(symbols), symbols_offset, strings_offset, len(strings))
+    return b''.join((header, bytes(INSTRUCTIONS_OFFSET - len(header)), instructions, symbol_section, strings))
+
+
+def write_object(output_path, code, symbols):
+    data = encode_object(code, symbols)
+    with open(output_path, 'wb') as output_f:
+        output_f.write(data)
+
+
+class ObjectWriter:
+    # Writes an object file for an assembly.StreamingCode as it hands
+    # instructions over. The opcodes go straight to output_f, which must be
+    # seekable. The operands come after all of them in the file, so they wait
+    # in a temporary file, where a jump's operand is patched in place once its
+    # target is known; finish() appends them and the symbols, then goes back
+    # to fill in the header.
+    def __init__(self, output_f):
+        self.output_f = output_f
+        self.operands_f = tempfile.TemporaryFile()
+        output_f.write(bytes(INSTRUCTIONS_OFFSET))
+
+    def write(self, opcodes, operands, open_jumps=()):
+        # Every operand can be patched, so which jumps are open does not matter
+        self.output_f.write(opcodes.tobytes())
+        self.operands_f.write(little_endian(operands))
+
+    def patch(self, index, operand):
+        end = self.operands_f.tell()
+        self.operands_f.seek(OPERAND.size * index)
+        self.operands_f.write(OPERAND.pack(operand))
+        self.operands_f.seek(end)
+
+    def finish(self, count, symbols):
+        symbol_section, strings = encode_symbols(symbols)
+        self.output_f.write(bytes(padding(count)))
+        self.operands_f.seek(0)
+        shutil.copyfileobj(self.operands_f, self.output_f)
+        self.output_f.write(symbol_section)
+        self.output_f.write(strings)
+        symbols_offset = INSTRUCTIONS_OFFSET + count + padding(count) + OPERAND.size * count
+        self.output_f.seek(0)
+        self.output_f.write(encode_header(count, len(symbols), symbols_offset, symbols_offset + len(symbol_section),
+                                          len(strings)))
+
+    def close(self):
+        self.operands_f.close()
+
+
+class ObjectFile:
+    # A mapped object file. opcodes, operands and addresses are memoryviews
+    # straight onto the file on little-endian machines, so nothing is decoded
+    # until it is used; close() (or leaving a with block) unmaps it.
+    def __init__(self, path):
+        with open(path, 'rb') as object_f:
+            try:
+                self.map = mmap.mmap(object_f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise ObjectFileError(f"{path}: empty file") from None
+        try:
+            self.read_header(path)
+        except BaseException:
+            self.map.close()
+            raise
+
+    def read_header(self, path):
+        if len(self.map) < OBJECT_HEADER.size:
+            raise ObjectFileError(f"{path}: not an object file")
+        (magic, version, self.instruction_count, self.symbol_count, instructions_offset, symbols_offset,
+         strings_offset, strings_length) = OBJECT_HEADER.unpack_from(self.map)
+        if magic != OBJECT_MAGIC:
+            raise ObjectFileError(f"{path}: not an object file")
+        if version != OBJECT_VERSION:
+            raise ObjectFileError(f"{path}: object file version {version}, expected {OBJECT_VERSION}")
+        count = self.instruction_count
+        operands_offset = instructions_offset + count + padding(count)
+        offsets_offset = symbols_offset + 8 * self.symbol_count
+        if (operands_offset + 8 * count > symbols_offset or offsets_offset + 4 * (self.symbol_count + 1) > strings_offset
+                or strings_offset + strings_length > len(self.map)):
+            raise ObjectFileError(f"{path}: truncated object file")
+        view = memoryview(self.map)
+        self.opcodes = view[instructions_offset:instructions_offset + count]
+        self.operands = self.column(view[operands_offset:operands_offset + 8 * count], 'q')
+        self.addresses = self.column(view[symbols_offset:offsets_offset], 'q')
+        self.offsets = self.column(view[offsets_offset:offsets_offset + 4 * (self.symbol_count + 1)], 'I')
+        self.strings = view[strings_offset:strings_offset + strings_length]
+
+    def column(self, view, typecode):
+        if sys.byteorder == 'little':
+            return view.cast(typecode)
+        values = array(typecode, view.tobytes())
+        values.byteswap()
+        return values
+
+    def symbol(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return str(self.strings[start:end], 'utf-8'), self.addresses[index]
+
+    def symbols(self):
+        return [self.symbol(index) for index in range(self.symbol_count)]
+
+    def code(self):
+        # A Code object holding a copy of the instructions
+        code = Code()
+        code.opcodes = array('B', self.opcodes)
+        code.operands = array('q', self.operands)
+        return code
+
+    def listing(self):
+        # The text listing, exactly as assembly.write_listing writes it
+        names = [opcode_names.get(opcode, '') for opcode in range(256)]
+        with_operand = [opcode in operand_opcodes for opcode in range(256)]
+        lines = ["Assembly Code:"]
+        for index, (opcode, operand) in enumerate(zip(self.opcodes, self.operands)):
+            lines.append(f"{index}: {names[opcode]} {operand}" if with_operand[opcode] else f"{index}: {names[opcode]}")
+        lines.append("")
+        lines.append("Symbol Table:")
+        lines.extend(f"Identifier: {lexeme}, Memory Address: {address}" for lexeme, address in self.symbols())
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        # The views have to go before the map can be closed
+        for name in ('opcodes', 'operands', 'addresses', 'offsets', 'strings'):
+            value = getattr(self, name, None)
+            if isinstance(value, memoryview):
+                value.release()
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+def read_object(path):
+    # (code, symbols) from an object file
+    with ObjectFile(path) as object_file:
+        return object_file.code(), object_file.symbols()
+
+
+def to_text(object_path, text_path):
+    with ObjectFile(object_path) as object_file:
+        text = object_file.listing()
+    with open(text_path, 'w', encoding='utf-8') as text_f:
+        text_f.write(text)
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description="Convert a Rat23F object file to the text listing")
+    argument_parser.add_argument('input')
+    argument_parser.add_argument('-o', '--output', help="text file to write (default: stdout)")
+    arguments = argument_parser.parse_args()
+    try:
+        if arguments.output:
+            to_text(arguments.input, arguments.output)
+        else:
+            with ObjectFile(arguments.input) as object_file:
+                sys.stdout.write(object_file.listing())
+    except (OSError, ObjectFileError) as e:
+        print(f"error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,403 @@
+# Optimization passes over the Code generated by assembly.Parser.
+#
+# Passes mark instructions as removed instead of deleting them, so jump
+# operands keep naming original instruction indices until renumber() maps
+# every target to the first surviving instruction at or after it.
+#
+# Level 1 runs the peephole passes here. Level 2 also runs the passes of
+# cfg.py over the program's control-flow graph, alternating with the
+# peephole ones while either finds something to do. Loop-invariant code
+# motion and common-subexpression elimination need addresses to keep values
+# in, so they only run when optimize() is given the program's SymbolTable.
+#
+# Store/load forwarding only forwards constants: after PUSHI c, POPM x a
+# PUSHM x becomes PUSHI c. A general POPM x, PUSHM x is left as it is, since
+# keeping the stored value on the stack as well would need an instruction
+# that duplicates the top of the stack, and the machine has none.
+
+from array import array
+
+import cfg
+from assembly import MAX_OPERAND, Op, jump_opcodes, stack_effects
+from vm import VMError, divide
+
+OPTIMIZATION_LEVELS = (0, 1, 2)
+
+# Binary instructions whose operands can be swapped
+commutative_opcodes = {Op.ADD, Op.MUL, Op.EQU, Op.NEQ}
+
+# Pure binary instructions and how to evaluate them on constants
+binary_evaluators = {
+    Op.ADD: lambda left, right: left + right,
+    Op.SUB: lambda left, right: left - right,
+    Op.MUL: lambda left, right: left * right,
+    Op.DIV: divide,
+    Op.GRT: lambda left, right: int(left > right),
+    Op.LES: lambda left, right: int(left < right),
+    Op.EQU: lambda left, right: int(left == right),
+    Op.NEQ: lambda left, right: int(left != right),
+    Op.GEQ: lambda left, right: int(left >= right),
+    Op.LEQ: lambda left, right: int(left <= right),
+}
+
+
+def evaluate_binary(opcode, left, right):
+    # Value of a binary instruction on two constants, or None if it would fail
+    # or would not fit in an operand
+    try:
+        value = binary_evaluators[opcode](left, right)
+    except VMError:
+        return None
+    if not -MAX_OPERAND - 1 <= value <= MAX_OPERAND:
+        return None
+    return value
+
+
+def jump_targets(opcodes, operands, live):
+    return {operands[index] for index in range(len(opcodes)) if live[index] and opcodes[index] in jump_opcodes}
+
+
+def renumber(code, live):
+    # Drops removed instructions and points each jump at the first surviving
+    # instruction at or after its old target
+    opcodes = code.opcodes
+    operands = code.operands
+    new_index = array('q', [0]) * (len(opcodes) + 1)
+    count = 0
+    for index in range(len(opcodes)):
+        new_index[index] = count
+        if live[index]:
+            count += 1
+    new_index[len(opcodes)] = count
+
+    new_opcodes = array('B')
+    new_operands = array('q')
+    for index in range(len(opcodes)):
+        if live[index]:
+            opcode = opcodes[index]
+            new_opcodes.append(opcode)
+            new_operands.append(new_index[operands[index]] if opcode in jump_opcodes else operands[index])
+    code.opcodes = new_opcodes
+    code.operands = new_operands
+    return len(opcodes) - count
+
+
+def fold_and_forward(code, live, stats, fold_constants, forward_stores):
+    # One scan over each straight-line run of instructions:
+    #   PUSHI a, PUSHI b, <binary op>  ->  PUSHI (a op b)
+    #   PUSHM x after a constant was stored to x  ->  PUSHI constant
+    #   PUSHM x, POPM x (or storing the value x already holds)  ->  nothing
+    # A run restarts at every jump target, so nothing moves across a point
+    # that can be entered from elsewhere, and after every call, since the
+    # function may have stored anywhere in its frame.
+    opcodes = code.opcodes
+    operands = code.operands
+    targets = jump_targets(opcodes, operands, live)
+    constants = []   # Indices of the PUSHIs on top of the stack, innermost last
+    known = {}       # Address -> constant it is known to hold
+    previous = None  # Index of the previous live instruction in this run
+    changed = False
+
+    for index in range(len(opcodes)):
+        if not live[index]:
+            continue
+        opcode = opcodes[index]
+        if index in targets or opcode == Op.LABEL:
+            constants = []
+            known = {}
+            previous = None
+
+        if opcode == Op.PUSHM and forward_stores and operands[index] in known:
+            opcodes[index] = Op.PUSHI
+            operands[index] = known[operands[index]]
+            opcode = Op.PUSHI
+            stats['forwarded'] += 1
+            changed = True
+
+        if opcode == Op.PUSHI:
+            constants.append(index)
+        elif opcode in binary_evaluators:
+            value = None
+            if fold_constants and len(constants) >= 2 and constants[-1] not in targets and index not in targets:
+                value = evaluate_binary(opcode, operands[constants[-2]], operands[constants[-1]])
+            if value is None:
+                constants = []
+            else:
+                live[constants.pop()] = False
+                live[index] = False
+                operands[constants[-1]] = value
+                stats['folded'] += 2
+                changed = True
+                previous = constants[-1]
+                continue
+        elif opcode == Op.POPM:
+            address = operands[index]
+            stored = None
+            if previous is not None and opcodes[previous] == Op.PUSHI:
+                stored = operands[previous]
+            redundant = previous is not None and (
+                (opcodes[previous] == Op.PUSHM and operands[previous] == address)
+                or (stored is not None and known.get(address) == stored))
+            if forward_stores and redundant:
+                live[previous] = False
+                live[index] = False
+                stats['stores'] += 2
+                changed = True
+                constants = []
+                previous = None
+                continue
+            if stored is not None:
+                known[address] = stored
+            else:
+                known.pop(address, None)
+            constants = []
+        elif opcode in (Op.JUMP, Op.CALL, Op.RET):
+            constants = []
+            known = {}
+        else:
+            constants = []
+        previous = index
+
+    return changed
+
+
+def next_live(opcodes, live, target):
+    # First instruction at or after target that is live and not a LABEL
+    while target < len(opcodes) and (not live[target] or opcodes[target] == Op.LABEL):
+        target += 1
+    return target
+
+
+def thread_jumps(code, live, stats):
+    # A jump to a JUMP goes straight to that JUMP's target, and a JUMP to the
+    # instruction right after it is dropped
+    opcodes = code.opcodes
+    operands = code.operands
+    changed = False
+    for index in range(len(opcodes)):
+        if not live[index] or opcodes[index] not in jump_opcodes:
+            continue
+        original = next_live(opcodes, live, operands[index])
+        target = original
+        seen = {index}
+        while target < len(opcodes) and opcodes[target] == Op.JUMP and target not in seen:
+            seen.add(target)
+            target = next_live(opcodes, live, operands[target])
+        if opcodes[index] == Op.JUMP and target == next_live(opcodes, live, index + 1):
+            live[index] = False
+            stats['threaded'] += 1
+            changed = True
+        elif target != original:
+            operands[index] = target
+            stats['threaded'] += 1
+            changed = True
+    return changed
+
+
+def remove_labels(code, live, stats):
+    # LABEL only marks a loop head; jumps to it land on the next instruction
+    opcodes = code.opcodes
+    for index in range(len(opcodes)):
+        if live[index] and opcodes[index] == Op.LABEL:
+            live[index] = False
+            stats['labels'] += 1
+
+
+def peephole(code, fold_constants=True, forward_stores=True, thread=True, labels=True):
+    # Rewrites code in place until nothing changes and returns counts of what
+    # was done; 'removed' is the number of instructions dropped in total
+    stats = {'folded': 0, 'forwarded': 0, 'stores': 0, 'threaded': 0, 'labels': 0, 'removed': 0}
+    size = len(code)
+    changed = True
+    while changed:
+        live = bytearray(b'\x01') * len(code)
+        changed = fold_and_forward(code, live, stats, fold_constants, forward_stores)
+        if thread:
+            changed = thread_jumps(code, live, stats) or changed
+        if labels:
+            remove_labels(code, live, stats)
+        renumber(code, live)
+    stats['removed'] = size - len(code)
+    return stats
+
+
+def finish_run(value, replaced, repeated):
+    # A value on reuse_values' stack is used by something other than a longer
+    # run it could be replaced along with
+    number, first, end, found = value
+    if found is True:
+        repeated.setdefault(number, []).append((first, end))
+    elif found is not None:
+        replaced[first] = (end, found)
+
+
+def reuse_values(code, symbol_table, stats):
+    # Common-subexpression elimination by value numbering over each basic
+    # block: every value the block computes gets a number, the same for two
+    # instructions on operands with the same numbers, and an address holds
+    # the number of what was last stored to it or loaded from it. A run of
+    # instructions computing a value some address still holds becomes a PUSHM
+    # of that address. Otherwise, if the block computed the value before,
+    # the first computation is followed by POPM t, PUSHM t for a temporary t
+    # from symbol_table and the run becomes PUSHM t, unless that only trades
+    # one three-instruction run for the two added. A CALL forgets everything,
+    # since the function may store anywhere, temporaries included.
+    # Returns whether anything was replaced.
+    opcodes = code.opcodes
+    operands = code.operands
+    replaced = {}  # First instruction of a run -> (end, address to load instead)
+    repeated = {}  # Value number -> (first, end) of each run computing it again
+    computed = {}  # Value number -> where its first computation ends
+    numbers = 0
+
+    for block in cfg.build(code):
+        memory = {}       # Address -> number of the value it holds
+        holders = {}      # Number -> addresses holding it
+        expressions = {}  # (opcode, left number, right number) or constant -> number
+        # (number, first instruction of the run computing it or None if it
+        # is not one, end, address holding it or True if computed before)
+        stack = []
+        for index in range(block.start, block.end):
+            opcode = opcodes[index]
+            if opcode == Op.PUSHI:
+                key = ('constant', operands[index])
+                if key not in expressions:
+                    expressions[key] = numbers = numbers + 1
+                stack.append((expressions[key], index, index + 1, None))
+            elif opcode == Op.PUSHM:
+                address = operands[index]
+                if address not in memory:
+                    memory[address] = numbers = numbers + 1
+                    holders[numbers] = {address}
+                stack.append((memory[address], index, index + 1, None))
+            elif opcode in binary_evaluators:
+                right = stack.pop() if stack else None
+                left = stack.pop() if stack else None
+                number = None
+                if left is not None and right is not None:
+                    key = (opcode, left[0], right[0])
+                    if opcode in commutative_opcodes and left[0] > right[0]:
+                        key = (opcode, right[0], left[0])
+                    number = expressions.get(key)
+                    if number is None:
+                        expressions[key] = numbers = numbers + 1
+                        computed[numbers] = index
+                        number = numbers
+                else:
+                    number = numbers = numbers + 1
+                # The run has to be contiguous: an inlined function's body can
+                # sit between a value and its use
+                first = None
+                found = None
+                if (left is not None and right is not None and left[1] is not None and right[1] is not None
+                        and left[2] == right[1] and right[2] == index):
+                    first = left[1]
+                    if holders.get(number):
+                        found = next(iter(holders[number]))
+                    elif computed[number] != index:
+                        found = True
+                if found is None:
+                    for value in (left, right):
+                        if value is not None:
+                            finish_run(value, replaced, repeated)
+                stack.append((number, first, index + 1, found))
+            elif opcode == Op.POPM:
+                value = stack.pop() if stack else None
+                if value is not None:
+                    finish_run(value, replaced, repeated)
+                    number = value[0]
+                else:
+                    number = numbers = numbers + 1
+                address = operands[index]
+                if address in memory:
+                    holders[memory[address]].discard(address)
+                memory[address] = number
+                holders.setdefault(number, set()).add(address)
+            else:
+                pops, pushes = stack_effects[opcode]
+                for _ in range(pops):
+                    if stack:
+                        finish_run(stack.pop(), replaced, repeated)
+                if opcode == Op.CALL:
+                    memory = {}
+                    holders = {}
+                    expressions = {}
+                for _ in range(pushes):
+                    numbers += 1
+                    stack.append((numbers, None, index + 1, None))
+        for value in stack:
+            finish_run(value, replaced, repeated)
+
+    stored = {}  # Instruction -> temporary to store the value it leaves in
+    for number, runs in repeated.items():
+        if len(runs) == 1 and runs[0][1] - runs[0][0] == 3:
+            continue
+        temporary = symbol_table.temporary()
+        stored[computed[number]] = temporary
+        for first, end in runs:
+            replaced[first] = (end, temporary)
+    if not replaced:
+        return False
+
+    new_index = array('q', [0]) * (len(opcodes) + 1)
+    jumps = []  # (new index, old index) of each jump
+    new_opcodes = array('B')
+    new_operands = array('q')
+    index = 0
+    while index < len(opcodes):
+        new_index[index] = len(new_opcodes)
+        if index in replaced:
+            # A longer run can hold shorter ones, which go with it
+            end, address = replaced[index]
+            new_opcodes.append(Op.PUSHM)
+            new_operands.append(address)
+            stats['reused'] += 1
+            index = end
+            continue
+        if opcodes[index] in jump_opcodes:
+            jumps.append((len(new_opcodes), index))
+        new_opcodes.append(opcodes[index])
+        new_operands.append(operands[index])
+        if index in stored:
+            new_opcodes.extend((Op.POPM, Op.PUSHM))
+            new_operands.extend((stored[index], stored[index]))
+        index += 1
+    new_index[len(opcodes)] = len(new_opcodes)
+    for position, index in jumps:
+        new_operands[position] = new_index[operands[index]]
+    code.opcodes = new_opcodes
+    code.operands = new_operands
+    return True
+
+
+def add_stats(total, stats):
+    for key, value in stats.items():
+        total[key] = total.get(key, 0) + value
+
+
+def optimize(code, level=1, symbol_table=None):
+    # Runs the passes enabled at an optimization level and returns their stats.
+    # symbol_table is the one the program was parsed with.
+    if level not in OPTIMIZATION_LEVELS:
+        raise Exception(f"Unknown optimization level: {level}")
+    stats = {'removed': 0}
+    size = len(code)
+    if level >= 1:
+        stats = peephole(code)
+    if level >= 2:
+        stats['hoisted'] = 0
+        stats['reused'] = 0
+        while True:
+            graph_stats = cfg.simplify(code)
+            add_stats(stats, graph_stats)
+            hoisted = symbol_table is not None and cfg.hoist_invariants(code, symbol_table, stats)
+            reused = symbol_table is not None and reuse_values(code, symbol_table, stats)
+            if not graph_stats['removed'] and not hoisted and not reused:
+                break
+            add_stats(stats, peephole(code))
+        # What is left, not a sum over the rounds; the passes that keep values
+        # in temporaries add instructions
+        stats['blocks'] = graph_stats['blocks']
+        stats['edges'] = graph_stats['edges']
+        stats['removed'] = size - len(code)
+    return stats
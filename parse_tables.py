@@ -0,0 +1,720 @@
+# Generated by grammar.py from the Rat23F grammar; do not edit.
+# python grammar.py --write regenerates this file.
+
+GRAMMAR_DIGEST = '467221d58f5cbed5'
+
+# <Opt Function Definitions>
+OPT_FUNCTION_DEFINITIONS = ({'!': 'empty',
+  '!=': 'empty',
+  '#': 'empty',
+  '(': 'empty',
+  ')': 'empty',
+  '*': 'empty',
+  '+': 'empty',
+  '+-': 'empty',
+  ',': 'empty',
+  '-': 'empty',
+  '/': 'empty',
+  ';': 'empty',
+  '<': 'empty',
+  '<=': 'empty',
+  '=': 'empty',
+  '==': 'empty',
+  '=>': 'empty',
+  '>': 'empty',
+  'bool': 'empty',
+  'else': 'empty',
+  'endif': 'empty',
+  'false': 'empty',
+  'function': 'function_definitions',
+  'get': 'empty',
+  'if': 'empty',
+  'integer': 'empty',
+  'put': 'empty',
+  'real': 'empty',
+  'ret': 'empty',
+  'true': 'empty',
+  'while': 'empty',
+  '{': 'empty',
+  '}': 'empty'},
+ {'EOF': 'empty',
+  'identifier': None,
+  'integer': 'empty',
+  'invalid': 'empty',
+  'keyword': None,
+  'operator': None,
+  'real': 'empty',
+  'separator': None})
+
+# <Function Definitions Prime>
+FUNCTION_DEFINITIONS_PRIME = ({'!': 'empty',
+  '!=': 'empty',
+  '#': 'empty',
+  '(': 'empty',
+  ')': 'empty',
+  '*': 'empty',
+  '+': 'empty',
+  '+-': 'empty',
+  ',': 'empty',
+  '-': 'empty',
+  '/': 'empty',
+  ';': 'empty',
+  '<': 'empty',
+  '<=': 'empty',
+  '=': 'empty',
+  '==': 'empty',
+  '=>': 'empty',
+  '>': 'empty',
+  'bool': 'empty',
+  'else': 'empty',
+  'endif': 'empty',
+  'false': 'empty',
+  'function': 'function_definitions',
+  'get': 'empty',
+  'if': 'empty',
+  'integer': 'empty',
+  'put': 'empty',
+  'real': 'empty',
+  'ret': 'empty',
+  'true': 'empty',
+  'while': 'empty',
+  '{': 'empty',
+  '}': 'empty'},
+ {'EOF': 'empty',
+  'identifier': None,
+  'integer': 'empty',
+  'invalid': 'empty',
+  'keyword': None,
+  'operator': None,
+  'real': 'empty',
+  'separator': None})
+
+# <Opt Parameter List>
+OPT_PARAMETER_LIST = ({'!': 'empty',
+  '!=': 'empty',
+  '#': 'empty',
+  '(': 'empty',
+  ')': 'empty',
+  '*': 'empty',
+  '+': 'empty',
+  '+-': 'empty',
+  ',': 'empty',
+  '-': 'empty',
+  '/': 'empty',
+  ';': 'empty',
+  '<': 'empty',
+  '<=': 'empty',
+  '=': 'empty',
+  '==': 'empty',
+  '=>': 'empty',
+  '>': 'empty',
+  'bool': 'empty',
+  'else': 'empty',
+  'endif': 'empty',
+  'false': 'empty',
+  'get': 'empty',
+  'if': 'empty',
+  'integer': 'empty',
+  'put': 'empty',
+  'real': 'empty',
+  'ret': 'empty',
+  'true': 'empty',
+  'while': 'empty',
+  '{': 'empty',
+  '}': 'empty'},
+ {'EOF': 'empty',
+  'identifier': 'parameter_list',
+  'integer': 'empty',
+  'invalid': 'empty',
+  'keyword': None,
+  'operator': None,
+  'real': 'empty',
+  'separator': None})
+
+# <Parameter List Prime>
+PARAMETER_LIST_PRIME = ({'!': 'empty',
+  '!=': 'empty',
+  '#': 'empty',
+  '(': 'empty',
+  ')': 'empty',
+  '*': 'empty',
+  '+': 'empty',
+  '+-': 'empty',
+  ',': 'more',
+  '-': 'empty',
+  '/': 'empty',
+  ';': 'empty',
+  '<': 'empty',
+  '<=': 'empty',
+  '=': 'empty',
+  '==': 'empty',
+  '=>': 'empty',
+  '>': 'empty',
+  'bool': 'empty',
+  'else': 'empty',
+  'endif': 'empty',
+  'false': 'empty',
+  'get': 'empty',
+  'if': 'empty',
+  'integer': 'empty',
+  'put': 'empty',
+  'real': 'empty',
+  'ret': 'empty',
+  'true': 'empty',
+  'while': 'empty',
+  '{': 'empty',
+  '}': 'empty'},
+ {'EOF': 'empty',
+  'identifier': 'empty',
+  'integer': 'empty',
+  'invalid': 'empty',
+  'keyword': None,
+  'operator': None,
+  'real': 'empty',
+  'separator': None})
+
+# <Qualifier>
+QUALIFIER = ({'!': None,
+  '!=': None,
+  '#': None,
+  '(': None,
+  ')': None,
+  '*': None,
+  '+': None,
+  '+-': None,
+  ',': None,
+  '-': None,
+  '/': None,
+  ';': None,
+  '<': None,
+  '<=': None,
+  '=': None,
+  '==': None,
+  '=>': None,
+  '>': None,
+  'bool': 'bool',
+  'else': None,
+  'endif': None,
+  'false': None,
+  'get': None,
+  'if': None,
+  'integer': 'integer',
+  'put': None,
+  'real': 'real',
+  'ret': None,
+  'true': None,
+  'while': None,
+  '{': None,
+  '}': None},
+ {'EOF': None,
+  'identifier': None,
+  'integer': None,
+  'invalid': None,
+  'keyword': None,
+  'operator': None,
+  'real': None,
+  'separator': None})
+
+# <Opt Declaration List>
+OPT_DECLARATION_LIST = ({'!': 'empty',
+  '!=': 'empty',
+  '#': 'empty',
+  '(': 'empty',
+  ')': 'empty',
+  '*': 'empty',
+  '+': 'empty',
+  '+-': 'empty',
+  ',': 'empty',
+  '-': 'empty',
+  '/': 'empty',
+  ';': 'empty',
+  '<': 'empty',
+  '<=': 'empty',
+  '=': 'empty',
+  '==': 'empty',
+  '=>': 'empty',
+  '>': 'empty',
+  'bool': 'declaration_list',
+  'else': 'empty',
+  'endif': 'empty',
+  'false': 'empty',
+  'get': 'empty',
+  'if': 'empty',
+  'integer': 'declaration_list',
+  'put': 'empty',
+  'real': 'declaration_list',
+  'ret': 'empty',
+  'true': 'empty',
+  'while': 'empty',
+  '{': 'empty',
+  '}': 'empty'},
+ {'EOF': 'empty',
+  'identifier': 'empty',
+  'integer': 'empty',
+  'invalid': 'empty',
+  'keyword': None,
+  'operator': None,
+  'real': 'empty',
+  'separator': None})
+
+# <Declaration List Prime>
+DECLARATION_LIST_PRIME = ({'!': 'empty',
+  '!=': 'empty',
+  '#': 'empty',
+  '(': 'empty',
+  ')': 'empty',
+  '*': 'empty',
+  '+': 'empty',
+  '+-': 'empty',
+  ',': 'empty',
+  '-': 'empty',
+  '/': 'empty',
+  ';': 'empty',
+  '<': 'empty',
+  '<=': 'empty',
+  '=': 'empty',
+  '==': 'empty',
+  '=>': 'empty',
+  '>': 'empty',
+  'bool': 'declaration_list',
+  'else': 'empty',
+  'endif': 'empty',
+  'false': 'empty',
+  'get': 'empty',
+  'if': 'empty',
+  'integer': 'declaration_list',
+  'put': 'empty',
+  'real': 'declaration_list',
+  'ret': 'empty',
+  'true': 'empty',
+  'while': 'empty',
+  '{': 'empty',
+  '}': 'empty'},
+ {'EOF': 'empty',
+  'identifier': 'empty',
+  'integer': 'empty',
+  'invalid': 'empty',
+  'keyword': None,
+  'operator': None,
+  'real': 'empty',
+  'separator': None})
+
+# <IDs Prime>
+IDS_PRIME = ({'!': 'empty',
+  '!=': 'empty',
+  '#': 'empty',
+  '(': 'empty',
+  ')': 'empty',
+  '*': 'empty',
+  '+': 'empty',
+  '+-': 'empty',
+  ',': 'more',
+  '-': 'empty',
+  '/': 'empty',
+  ';': 'empty',
+  '<': 'empty',
+  '<=': 'empty',
+  '=': 'empty',
+  '==': 'empty',
+  '=>': 'empty',
+  '>': 'empty',
+  'bool': 'empty',
+  'else': 'empty',
+  'endif': 'empty',
+  'false': 'empty',
+  'get': 'empty',
+  'if': 'empty',
+  'integer': 'empty',
+  'put': 'empty',
+  'real': 'empty',
+  'ret': 'empty',
+  'true': 'empty',
+  'while': 'empty',
+  '{': 'empty',
+  '}': 'empty'},
+ {'EOF': 'empty',
+  'identifier': 'empty',
+  'integer': 'empty',
+  'invalid': 'empty',
+  'keyword': None,
+  'operator': None,
+  'real': 'empty',
+  'separator': None})
+
+# <Statement>
+STATEMENT = ({'!': None,
+  '!=': None,
+  '#': None,
+  '(': None,
+  ')': None,
+  '*': None,
+  '+': None,
+  '+-': None,
+  ',': None,
+  '-': None,
+  '/': None,
+  ';': None,
+  '<': None,
+  '<=': None,
+  '=': None,
+  '==': None,
+  '=>': None,
+  '>': None,
+  'bool': None,
+  'else': None,
+  'endif': None,
+  'false': None,
+  'get': 'scan',
+  'if': 'if',
+  'integer': None,
+  'put': 'print',
+  'real': None,
+  'ret': 'return',
+  'true': None,
+  'while': 'while',
+  '{': 'compound',
+  '}': None},
+ {'EOF': None,
+  'identifier': 'assign',
+  'integer': None,
+  'invalid': None,
+  'keyword': None,
+  'operator': None,
+  'real': None,
+  'separator': None})
+
+# <If Tail>
+IF_TAIL = ({'!': 'endif',
+  '!=': 'endif',
+  '#': 'endif',
+  '(': 'endif',
+  ')': 'endif',
+  '*': 'endif',
+  '+': 'endif',
+  '+-': 'endif',
+  ',': 'endif',
+  '-': 'endif',
+  '/': 'endif',
+  ';': 'endif',
+  '<': 'endif',
+  '<=': 'endif',
+  '=': 'endif',
+  '==': 'endif',
+  '=>': 'endif',
+  '>': 'endif',
+  'bool': 'endif',
+  'else': 'else',
+  'endif': 'endif',
+  'false': 'endif',
+  'get': 'endif',
+  'if': 'endif',
+  'integer': 'endif',
+  'put': 'endif',
+  'real': 'endif',
+  'ret': 'endif',
+  'true': 'endif',
+  'while': 'endif',
+  '{': 'endif',
+  '}': 'endif'},
+ {'EOF': 'endif',
+  'identifier': 'endif',
+  'integer': 'endif',
+  'invalid': 'endif',
+  'keyword': None,
+  'operator': None,
+  'real': 'endif',
+  'separator': None})
+
+# <Return Tail>
+RETURN_TAIL = ({'!': 'expression',
+  '!=': 'expression',
+  '#': 'expression',
+  '(': 'expression',
+  ')': 'expression',
+  '*': 'expression',
+  '+': 'expression',
+  '+-': 'expression',
+  ',': 'expression',
+  '-': 'expression',
+  '/': 'expression',
+  ';': 'bare',
+  '<': 'expression',
+  '<=': 'expression',
+  '=': 'expression',
+  '==': 'expression',
+  '=>': 'expression',
+  '>': 'expression',
+  'bool': 'expression',
+  'else': 'expression',
+  'endif': 'expression',
+  'false': 'expression',
+  'get': 'expression',
+  'if': 'expression',
+  'integer': 'expression',
+  'put': 'expression',
+  'real': 'expression',
+  'ret': 'expression',
+  'true': 'expression',
+  'while': 'expression',
+  '{': 'expression',
+  '}': 'expression'},
+ {'EOF': 'expression',
+  'identifier': 'expression',
+  'integer': 'expression',
+  'invalid': 'expression',
+  'keyword': None,
+  'operator': None,
+  'real': 'expression',
+  'separator': None})
+
+# <Relop>
+RELOP = ({'!': None,
+  '!=': '!=',
+  '#': None,
+  '(': None,
+  ')': None,
+  '*': None,
+  '+': None,
+  '+-': None,
+  ',': None,
+  '-': None,
+  '/': None,
+  ';': None,
+  '<': '<',
+  '<=': '<=',
+  '=': None,
+  '==': '==',
+  '=>': '=>',
+  '>': '>',
+  'bool': None,
+  'else': None,
+  'endif': None,
+  'false': None,
+  'get': None,
+  'if': None,
+  'integer': None,
+  'put': None,
+  'real': None,
+  'ret': None,
+  'true': None,
+  'while': None,
+  '{': None,
+  '}': None},
+ {'EOF': None,
+  'identifier': None,
+  'integer': None,
+  'invalid': None,
+  'keyword': None,
+  'operator': None,
+  'real': None,
+  'separator': None})
+
+# <Expression Prime>
+EXPRESSION_PRIME = ({'!': 'empty',
+  '!=': 'empty',
+  '#': 'empty',
+  '(': 'empty',
+  ')': 'empty',
+  '*': 'empty',
+  '+': '+',
+  '+-': 'empty',
+  ',': 'empty',
+  '-': '-',
+  '/': 'empty',
+  ';': 'empty',
+  '<': 'empty',
+  '<=': 'empty',
+  '=': 'empty',
+  '==': 'empty',
+  '=>': 'empty',
+  '>': 'empty',
+  'bool': 'empty',
+  'else': 'empty',
+  'endif': 'empty',
+  'false': 'empty',
+  'get': 'empty',
+  'if': 'empty',
+  'integer': 'empty',
+  'put': 'empty',
+  'real': 'empty',
+  'ret': 'empty',
+  'true': 'empty',
+  'while': 'empty',
+  '{': 'empty',
+  '}': 'empty'},
+ {'EOF': 'empty',
+  'identifier': 'empty',
+  'integer': 'empty',
+  'invalid': 'empty',
+  'keyword': None,
+  'operator': None,
+  'real': 'empty',
+  'separator': None})
+
+# <Term Prime>
+TERM_PRIME = ({'!': 'empty',
+  '!=': 'empty',
+  '#': 'empty',
+  '(': 'empty',
+  ')': 'empty',
+  '*': '*',
+  '+': 'empty',
+  '+-': 'empty',
+  ',': 'empty',
+  '-': 'empty',
+  '/': '/',
+  ';': 'empty',
+  '<': 'empty',
+  '<=': 'empty',
+  '=': 'empty',
+  '==': 'empty',
+  '=>': 'empty',
+  '>': 'empty',
+  'bool': 'empty',
+  'else': 'empty',
+  'endif': 'empty',
+  'false': 'empty',
+  'get': 'empty',
+  'if': 'empty',
+  'integer': 'empty',
+  'put': 'empty',
+  'real': 'empty',
+  'ret': 'empty',
+  'true': 'empty',
+  'while': 'empty',
+  '{': 'empty',
+  '}': 'empty'},
+ {'EOF': 'empty',
+  'identifier': 'empty',
+  'integer': 'empty',
+  'invalid': 'empty',
+  'keyword': None,
+  'operator': None,
+  'real': 'empty',
+  'separator': None})
+
+# <Factor>
+FACTOR = ({'!': 'primary',
+  '!=': 'primary',
+  '#': 'primary',
+  '(': 'primary',
+  ')': 'primary',
+  '*': 'primary',
+  '+': 'primary',
+  '+-': 'primary',
+  ',': 'primary',
+  '-': 'negate',
+  '/': 'primary',
+  ';': 'primary',
+  '<': 'primary',
+  '<=': 'primary',
+  '=': 'primary',
+  '==': 'primary',
+  '=>': 'primary',
+  '>': 'primary',
+  'bool': 'primary',
+  'else': 'primary',
+  'endif': 'primary',
+  'false': 'primary',
+  'get': 'primary',
+  'if': 'primary',
+  'integer': 'primary',
+  'put': 'primary',
+  'real': 'primary',
+  'ret': 'primary',
+  'true': 'primary',
+  'while': 'primary',
+  '{': 'primary',
+  '}': 'primary'},
+ {'EOF': 'primary',
+  'identifier': 'primary',
+  'integer': 'primary',
+  'invalid': 'primary',
+  'keyword': None,
+  'operator': None,
+  'real': 'primary',
+  'separator': None})
+
+# <Primary>
+PRIMARY = ({'!': None,
+  '!=': None,
+  '#': None,
+  '(': 'parenthesized',
+  ')': None,
+  '*': None,
+  '+': None,
+  '+-': None,
+  ',': None,
+  '-': None,
+  '/': None,
+  ';': None,
+  '<': None,
+  '<=': None,
+  '=': None,
+  '==': None,
+  '=>': None,
+  '>': None,
+  'bool': None,
+  'else': None,
+  'endif': None,
+  'false': 'false',
+  'get': None,
+  'if': None,
+  'integer': None,
+  'put': None,
+  'real': None,
+  'ret': None,
+  'true': 'true',
+  'while': None,
+  '{': None,
+  '}': None},
+ {'EOF': None,
+  'identifier': 'identifier',
+  'integer': 'integer',
+  'invalid': None,
+  'keyword': None,
+  'operator': None,
+  'real': None,
+  'separator': None})
+
+# <Primary Tail>
+PRIMARY_TAIL = ({'!': 'empty',
+  '!=': 'empty',
+  '#': 'empty',
+  '(': 'call',
+  ')': 'empty',
+  '*': 'empty',
+  '+': 'empty',
+  '+-': 'empty',
+  ',': 'empty',
+  '-': 'empty',
+  '/': 'empty',
+  ';': 'empty',
+  '<': 'empty',
+  '<=': 'empty',
+  '=': 'empty',
+  '==': 'empty',
+  '=>': 'empty',
+  '>': 'empty',
+  'bool': 'empty',
+  'else': 'empty',
+  'endif': 'empty',
+  'false': 'empty',
+  'get': 'empty',
+  'if': 'empty',
+  'integer': 'empty',
+  'put': 'empty',
+  'real': 'empty',
+  'ret': 'empty',
+  'true': 'empty',
+  'while': 'empty',
+  '{': 'empty',
+  '}': 'empty'},
+ {'EOF': 'empty',
+  'identifier': 'empty',
+  'integer': 'empty',
+  'invalid': 'empty',
+  'keyword': None,
+  'operator': None,
+  'real': 'empty',
+  'separator': None})
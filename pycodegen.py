@@ -0,0 +1,485 @@
+# Execution backend that translates a program into a Python function.
+#
+# The VM pays for a dispatch on every instruction. Here each basic block
+# becomes straight-line Python instead: the stack depth at every instruction
+# is worked out ahead of time, so stack slots turn into the locals s0, s1, ...
+# and memory into the locals m0, m1, ..., and within a block the pushes
+# build up a Python expression that is only stored when a side effect, a
+# jump or the end of the block needs it. Jumps are turned back into the
+# while and if statements the parser generated them from.
+#
+# Programs that cannot be structured that way (code the optimizer threaded
+# across loops, a stack depth that differs between paths, calls the parser
+# did not inline, too deep a nesting for compile()) are run on the VM, which
+# CompiledVM subclasses. The code of functions nothing calls is skipped.
+
+import hashlib
+from array import array
+
+from assembly import MEMORY_BASE, Op, stack_effects
+from vm import VM, VMError, divide
+
+arithmetic_operators = {Op.ADD: '+', Op.SUB: '-', Op.MUL: '*'}
+relational_operators = {Op.GRT: '>', Op.LES: '<', Op.EQU: '==', Op.NEQ: '!=', Op.GEQ: '>=', Op.LEQ: '<='}
+
+# An expression nested deeper than this is stored in its stack slot, well
+# before compile() would refuse it
+MAX_EXPRESSION_NESTING = 32
+# Translated programs kept by CompiledVM, most recently used last
+CACHE_LIMIT = 256
+
+function_cache = {}
+cache_stats = {'hits': 0, 'misses': 0}
+
+
+class Unsupported(Exception):
+    # The program is left to the VM
+    pass
+
+
+class Value:
+    # A value on the symbolic stack: Python source for it, how deeply it
+    # nests, whether it is a constant and whether it is a bare comparison,
+    # which has to become 1 or 0 before it is used as a number
+    __slots__ = ('text', 'nesting', 'constant', 'comparison')
+
+    def __init__(self, text, nesting=0, constant=False, comparison=False):
+        self.text = text
+        self.nesting = nesting
+        self.constant = constant
+        self.comparison = comparison
+
+    def number(self):
+        return f"(1 if {self.text} else 0)" if self.comparison else self.text
+
+
+def stack_depths(instructions):
+    # The stack depth before each instruction, None where it is unreachable.
+    # Raises Unsupported where the depth depends on the path taken or the
+    # stack could underflow.
+    end = len(instructions)
+    depths = [None] * (end + 1)
+    depths[0] = 0
+    work = [0]
+    while work:
+        pc = work.pop()
+        if pc == end:
+            continue
+        opcode, operand = instructions[pc]
+        pops, pushes = stack_effects[opcode]
+        if depths[pc] < pops:
+            raise Unsupported(f"Stack may underflow at instruction {pc}")
+        depth = depths[pc] - pops + pushes
+        if opcode == Op.JUMP:
+            successors = (operand,)
+        elif opcode == Op.JUMPZ:
+            successors = (pc + 1, operand)
+        elif opcode == Op.RET:
+            successors = ()
+        else:
+            successors = (pc + 1,)
+        for successor in successors:
+            if depths[successor] is None:
+                depths[successor] = depth
+                work.append(successor)
+            elif depths[successor] != depth:
+                raise Unsupported(f"Stack depth differs between paths into instruction {successor}")
+    return depths
+
+
+def lands(instructions, pc):
+    # Where control ends up from pc through labels and unconditional jumps,
+    # which the optimizer may have threaded other jumps past
+    seen = set()
+    while pc < len(instructions) and pc not in seen:
+        seen.add(pc)
+        opcode, operand = instructions[pc]
+        if opcode == Op.LABEL:
+            pc += 1
+        elif opcode == Op.JUMP:
+            pc = operand
+        else:
+            break
+    return pc
+
+
+def unthread(instructions):
+    # The optimizer threads jumps out of a loop, or out of the then part of an
+    # if/else, past the jump that ends it and straight to where that jump
+    # goes. Pointing them back at that jump lets them become a break, or the
+    # end of the then part, again.
+    instructions = list(instructions)
+    spans = []  # (first, last) of the code whose jumps may go through last
+    for pc, (opcode, operand) in enumerate(instructions):
+        if opcode == Op.JUMP and operand <= pc and pc + 1 < len(instructions) and instructions[pc + 1][0] == Op.JUMP:
+            spans.append((operand, pc + 1))
+        elif opcode == Op.JUMPZ and pc + 1 < operand and instructions[operand - 1][0] == Op.JUMP:
+            spans.append((pc + 1, operand - 1))
+    # Outer spans first, so inner ones get the last word on their own exits
+    for first, last in sorted(spans, key=lambda span: span[0] - span[1]):
+        destination = lands(instructions, last)
+        for pc in range(first, last):
+            opcode, operand = instructions[pc]
+            if (opcode in (Op.JUMP, Op.JUMPZ) and not first <= operand <= last
+                    and lands(instructions, operand) == destination):
+                instructions[pc] = (opcode, last)
+    return instructions
+
+
+class Translator:
+    def __init__(self, instructions, memory_size):
+        instructions = unthread(instructions)
+        self.instructions = instructions
+        self.memory_size = memory_size
+        self.end = len(instructions)
+        self.depths = stack_depths(instructions)
+        # Basic block leaders, and the backward jumps into each loop header
+        self.leaders = {0}
+        self.back_jumps = {}
+        for pc, (opcode, operand) in enumerate(instructions):
+            if opcode in (Op.JUMP, Op.JUMPZ):
+                self.leaders.add(operand)
+                self.leaders.add(pc + 1)
+                if operand <= pc:
+                    self.back_jumps.setdefault(operand, []).append(pc)
+        self.lines = []
+        self.indent = 2
+        self.stack = []
+
+    def line(self, text):
+        self.lines.append('    ' * self.indent + text)
+
+    def reset(self, pc):
+        # Everything on the stack is in its slot at the start of a block
+        self.stack = [Value(f"s{slot}") for slot in range(self.depths[pc])]
+
+    def store(self, slot):
+        value = self.stack[slot]
+        if value.text != f"s{slot}":
+            self.line(f"s{slot} = {value.number()}")
+            self.stack[slot] = Value(f"s{slot}")
+
+    def flush(self, constants=True):
+        # Slots are stored lowest first: a value only refers to slots at or
+        # above its own, so none is overwritten before it is read
+        for slot in range(len(self.stack)):
+            if constants or not self.stack[slot].constant:
+                self.store(slot)
+
+    def push(self, value):
+        self.stack.append(value)
+        if value.nesting > MAX_EXPRESSION_NESTING:
+            self.store(len(self.stack) - 1)
+
+    def translate(self):
+        self.region(0, self.end, self.end, None)
+        lines = ["def run_program(read, write, memory, divide):"]
+        names = ', '.join(f"m{address}" for address in range(self.memory_size))
+        if names:
+            lines.append(f"    {names}, = memory")
+        lines.append("    try:")
+        lines.extend(self.lines or ["        pass"])
+        lines.append("    finally:")
+        lines.append(f"        memory[:] = ({names},)" if names else "        pass")
+        return '\n'.join(lines) + '\n'
+
+    def region(self, lo, hi, follow, loop, loop_entered=None):
+        # Instructions lo up to hi, after which control goes on at follow;
+        # loop is the (header, exit) of the innermost enclosing loop
+        start = len(self.lines)
+        if self.depths[lo] is not None:
+            self.reset(lo)
+        pc = lo
+        while pc < hi:
+            if self.depths[pc] is None:
+                pc += 1
+                continue
+            if pc in self.leaders and pc != lo:
+                self.flush()
+                self.reset(pc)
+            if pc != loop_entered and any(pc < back < hi for back in self.back_jumps.get(pc, ())):
+                pc = self.loop(pc, max(back for back in self.back_jumps[pc] if back < hi), hi, follow)
+                continue
+            pc = self.instruction(pc, hi, follow, loop)
+        self.flush()
+        if len(self.lines) == start:
+            self.line("pass")
+
+    def loop(self, header, back, hi, follow):
+        # while loop from header to the backward jump at back; returns where
+        # the code after it starts. Leaving the loop goes on there, or at
+        # follow if the loop ends the region, which it can once -O2 has
+        # removed a jump after it that nothing runs
+        exit = back + 1 if back + 1 < hi else follow
+        if self.instructions[back][0] == Op.JUMPZ:
+            # Goes round again while a condition is 0, as when -O2 has
+            # removed the JUMP back that a threaded JUMPZ skipped
+            self.line("while True:")
+            self.indent += 1
+            self.region(header, back + 1, exit, (header, exit), header)
+            self.line("break")
+            self.indent -= 1
+            return back + 1
+        test = self.loop_test(header, back, exit)
+        if test is not None:
+            condition, body = test
+            self.line(f"while {condition}:")
+            self.indent += 1
+            self.region(body, back, header, (header, exit))
+        else:
+            self.line("while True:")
+            self.indent += 1
+            self.region(header, back, header, (header, exit), header)
+        self.indent -= 1
+        return back + 1
+
+    def loop_test(self, header, back, exit):
+        # (condition, first body instruction) when the loop starts by
+        # computing a condition without side effects and leaving the loop if
+        # it is false; None otherwise
+        saved = self.stack
+        lines = len(self.lines)
+        self.reset(header)
+        depth = len(self.stack)
+        try:
+            for pc in range(header, back):
+                opcode, operand = self.instructions[pc]
+                if pc != header and pc in self.leaders:
+                    return None
+                if opcode == Op.JUMPZ:
+                    condition = self.stack.pop()
+                    if not self.same_place(operand, exit) or len(self.stack) != depth or any(
+                            value.text != f"s{slot}" for slot, value in enumerate(self.stack)):
+                        return None
+                    return condition.text, pc + 1
+                if (opcode in (Op.POPM, Op.STDOUT, Op.STDIN, Op.JUMP, Op.CALL, Op.RET)
+                        or stack_effects[opcode][0] > len(self.stack)):
+                    return None
+                self.operation(opcode, operand)
+                if len(self.lines) != lines:
+                    return None  # Too deep to test inline
+            return None
+        finally:
+            del self.lines[lines:]
+            self.stack = saved
+
+    def lands(self, pc):
+        return lands(self.instructions, pc)
+
+    def same_place(self, target, place):
+        # Whether jumping to target is the same as going on at place. Past
+        # the loop or region that place follows, Python goes on with the code
+        # at place, which is only there if place is reachable.
+        return target == place or (self.depths[place] is not None and self.lands(target) == self.lands(place))
+
+    def if_else(self, pc, else_start, hi, follow, loop):
+        # (end of the then part, end of the else part, where both go on) if
+        # the JUMPZ at pc to else_start begins an if/else, or None. The then
+        # part either ends by jumping over the else part, or cannot run into
+        # it at all, ending with a loop or a ret as it does once -O2 has
+        # removed the jump after those, and leaves for one place. The else
+        # part ends there, or at hi if that place is where follow is.
+        last, target = self.instructions[else_start - 1]
+        if else_start - 1 <= pc:
+            return None
+        if last == Op.JUMP and not pc < target < else_start:
+            if self.jump_statement(target, loop) is not None:
+                return None
+            then_end = else_start - 1
+            places = {target}
+        elif last == Op.RET or last == Op.JUMP:
+            then_end = else_start
+            places = set()
+            for source in range(pc + 1, else_start):
+                opcode, operand = self.instructions[source]
+                if (opcode in (Op.JUMP, Op.JUMPZ) and self.depths[source] is not None
+                        and not pc < operand < else_start and self.jump_statement(operand, loop) is None):
+                    places.add(operand)
+        else:
+            return None
+        if len(places) != 1:
+            return None
+        place = places.pop()
+        if else_start < place <= hi:
+            return then_end, place, place
+        if self.same_place(place, follow):
+            return then_end, hi, follow
+        return None
+
+    def jump_statement(self, target, loop):
+        # The statement that jumps to target, or None if it cannot be one
+        if loop is not None and self.same_place(target, loop[0]):
+            return "continue"
+        if loop is not None and self.same_place(target, loop[1]):
+            return "break"
+        if self.lands(target) == self.end:
+            return "return"
+        return None
+
+    def instruction(self, pc, hi, follow, loop):
+        # Translates the instruction at pc; returns the next one to translate
+        opcode, operand = self.instructions[pc]
+        if opcode == Op.JUMPZ:
+            condition = self.stack.pop()
+            self.flush()
+            statement = self.jump_statement(operand, loop)
+            if statement is not None:
+                self.line(f"if not {condition.text}:")
+                self.indent += 1
+                self.line(statement)
+                self.indent -= 1
+                return pc + 1
+            after = operand
+            if not pc < operand <= hi:
+                if not self.same_place(operand, follow):
+                    raise Unsupported(f"Unstructured jump at instruction {pc}")
+                # Past the end of the region to where it goes on anyway, so
+                # the if runs to the end of the region
+                operand = hi
+                after = follow
+            self.line(f"if {condition.text}:")
+            self.indent += 1
+            parts = self.if_else(pc, operand, hi, follow, loop) if after == operand else None
+            if parts is not None:
+                then_end, else_end, after = parts
+                self.region(pc + 1, then_end, after, loop)
+                self.indent -= 1
+                self.line("else:")
+                self.indent += 1
+                self.region(operand, else_end, after, loop)
+                self.indent -= 1
+                return else_end
+            self.region(pc + 1, operand, after, loop)
+            self.indent -= 1
+            return operand
+        if opcode == Op.JUMP:
+            self.flush()
+            if pc < operand <= hi and all(depth is None for depth in self.depths[pc + 1:operand]):
+                return operand  # Over code nothing runs, such as the functions before the main section
+            statement = self.jump_statement(operand, loop)
+            if statement is not None:
+                self.line(statement)
+            elif not self.same_place(operand, follow) or pc != hi - 1:
+                raise Unsupported(f"Unstructured jump at instruction {pc}")
+            return pc + 1
+        if opcode == Op.CALL:
+            raise Unsupported(f"Call at instruction {pc}")
+        if opcode == Op.RET:
+            # Only the main section's, since no call is translated
+            self.flush()
+            self.line("return")
+            return pc + 1
+        if opcode in (Op.POPM, Op.STDOUT, Op.STDIN):
+            # Anything still pending is evaluated first, as the VM would have
+            value = self.stack.pop() if opcode != Op.STDIN else None
+            self.flush(constants=False)
+            if opcode == Op.POPM:
+                self.line(f"m{operand} = {value.number()}")
+            elif opcode == Op.STDOUT:
+                self.line(f"write({value.number()})")
+            else:
+                slot = len(self.stack)
+                self.line(f"s{slot} = read()")
+                self.stack.append(Value(f"s{slot}"))
+            return pc + 1
+        self.operation(opcode, operand)
+        return pc + 1
+
+    def operation(self, opcode, operand):
+        # Instructions without side effects, on the symbolic stack
+        if opcode == Op.PUSHI:
+            self.push(Value(str(operand) if operand >= 0 else f"({operand})", 0, True))
+        elif opcode == Op.PUSHM:
+            self.push(Value(f"m{operand}"))
+        elif opcode != Op.LABEL:
+            right = self.stack.pop()
+            left = self.stack.pop()
+            nesting = max(left.nesting, right.nesting) + 1
+            if opcode == Op.DIV:
+                self.push(Value(f"divide({left.number()}, {right.number()})", nesting))
+            elif opcode in arithmetic_operators:
+                self.push(Value(f"({left.number()} {arithmetic_operators[opcode]} {right.number()})", nesting))
+            else:
+                self.push(Value(f"({left.number()} {relational_operators[opcode]} {right.number()})", nesting,
+                                comparison=True))
+
+
+def program_key(instructions):
+    opcodes = array('B', (opcode for opcode, _ in instructions))
+    operands = array('q', (operand for _, operand in instructions))
+    return hashlib.sha256(opcodes.tobytes() + operands.tobytes()).hexdigest()
+
+
+def translate(instructions, memory_size):
+    # Python source of run_program(read, write, memory, divide) for decoded
+    # instructions whose memory operands are offsets into memory
+    return Translator(instructions, memory_size).translate()
+
+
+def compile_instructions(instructions, memory_size):
+    # run_program for the instructions, or None if they are left to the VM.
+    # Results are cached on the program's hash.
+    key = program_key(instructions)
+    if key in function_cache:
+        cache_stats['hits'] += 1
+        function_cache[key] = function_cache.pop(key)
+        return function_cache[key]
+    cache_stats['misses'] += 1
+    try:
+        code = compile(translate(instructions, memory_size), '<rat23f>', 'exec')
+        namespace = {}
+        exec(code, namespace)
+        function = namespace['run_program']
+    except (Unsupported, SyntaxError, RecursionError, MemoryError):
+        function = None
+    function_cache[key] = function
+    if len(function_cache) > CACHE_LIMIT:
+        del function_cache[next(iter(function_cache))]
+    return function
+
+
+class CompiledVM(VM):
+    # A VM that runs the program as translated Python where it can
+    def __init__(self, program, read=None, write=None, memory_base=MEMORY_BASE):
+        super().__init__(program, read, write, memory_base)
+        self.function = compile_instructions(self.instructions, len(self.memory))
+
+    def run(self):
+        # Returns the number of instructions executed when the VM ran the
+        # program, None when the translation did
+        if self.function is None:
+            return super().run()
+        try:
+            self.function(self.read, self.write, self.memory, divide)
+        except StopIteration:
+            raise VMError("Out of input") from None
+        return None
+
+
+def run(program, inputs=(), check=False):
+    # Runs a program on a list of inputs and returns the list of outputs. With
+    # check the VM runs it too, and any difference in the outputs, the final
+    # memory or the error raised is an error.
+    inputs = list(inputs)
+    feed = iter(inputs)
+    outputs = []
+    machine = CompiledVM(program, lambda: next(feed), outputs.append)
+    error = None
+    try:
+        machine.run()
+    except VMError as e:
+        error = str(e)
+    if check:
+        feed = iter(inputs)
+        expected = []
+        reference = VM(program, lambda: next(feed), expected.append)
+        expected_error = None
+        try:
+            reference.run()
+        except VMError as e:
+            expected_error = str(e)
+        if expected != outputs or reference.memory != machine.memory or (expected_error is None) != (error is None):
+            raise VMError("Translated program does not match the VM")
+    if error is not None:
+        raise VMError(error)
+    return outputs
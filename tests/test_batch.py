@@ -0,0 +1,80 @@
+# Batch mode on the command line: the listings it writes against compiling
+# each file on its own, and the options it does not take.
+#
+#   python -m pytest tests
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import assembly
+from generate import generate_program
+
+SAMPLES = [os.path.join(ROOT, name) for name in ('test1.txt', 'test2.txt', 'test3.txt')]
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.inputs = []
+        for path in SAMPLES:
+            self.inputs.append(shutil.copy(path, self.directory))
+        for seed in range(3):
+            path = os.path.join(self.directory, f'generated{seed}.txt')
+            with open(path, 'w', encoding='utf-8') as source_f:
+                source_f.write(generate_program(seed, 300))
+            self.inputs.append(path)
+        self.output_dir = os.path.join(self.directory, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def compile_batch(self, *options):
+        return subprocess.run([sys.executable, os.path.join(ROOT, 'assembly.py'), '-o', self.output_dir, *options,
+                               *self.inputs], capture_output=True, text=True, cwd=self.directory)
+
+    def assertSameListings(self, optimization_level):
+        expected_path = os.path.join(self.directory, 'expected.asm.txt')
+        for input_path in self.inputs:
+            with open(input_path, encoding='utf-8-sig') as input_f:
+                code, symbols = assembly.compile_source(input_f.read(), optimization_level)
+            assembly.write_listing(expected_path, code, symbols)
+            with open(expected_path, 'rb') as expected_f, \
+                    open(assembly.batch_output_path(input_path, self.output_dir), 'rb') as output_f:
+                self.assertEqual(output_f.read(), expected_f.read(), input_path)
+
+    def test_batch_matches_single_files(self):
+        for optimization_level in (0, 2):
+            result = self.compile_batch('-j', '2', f'-O{optimization_level}')
+            self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+            self.assertIn(f"Compiled {len(self.inputs)} of {len(self.inputs)} files", result.stdout)
+            self.assertSameListings(optimization_level)
+
+    def test_cached_batch_matches_single_files(self):
+        cache_dir = os.path.join(self.directory, 'cache')
+        for hits in (0, len(self.inputs)):
+            shutil.rmtree(self.output_dir, ignore_errors=True)
+            result = self.compile_batch('-j', '2', '--cache-dir', cache_dir)
+            self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+            self.assertIn(f"Cache: {hits} hits", result.stdout)
+            self.assertSameListings(0)
+
+    def test_run_and_trace_are_rejected(self):
+        for options, rejected in ((['--run'], "--run"), (['--run', '--backend', 'python'], "--run, --backend"),
+                                  (['--trace', 'rules'], "--trace"),
+                                  (['--trace', 'tokens', '--trace-file', 'trace.txt'], "--trace, --trace-file")):
+            result = self.compile_batch(*options)
+            self.assertEqual(result.returncode, 2, options)
+            self.assertIn(f"error: {rejected} cannot be combined with batch inputs", result.stderr)
+            self.assertFalse(os.path.exists(self.output_dir))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+# The on-disk compile cache: hits and misses, least recently used eviction,
+# damaged entries and several writers sharing a directory.
+#
+#   python -m pytest tests
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import assembly
+import cache
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test3.txt')
+
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = cache.CompileCache(self.directory)
+        with open(SAMPLE, 'rb') as input_f:
+            self.source_bytes = input_f.read()
+        self.code, self.symbols = assembly.compile_source(self.source_bytes.decode('utf-8-sig'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertEntry(self, entry):
+        code, symbols = entry
+        self.assertEqual(list(code.opcodes), list(self.code.opcodes))
+        self.assertEqual(list(code.operands), list(self.code.operands))
+        self.assertEqual(symbols, list(self.symbols))
+
+    def test_hits_and_misses(self):
+        key = cache.cache_key(self.source_bytes, {'optimize': 0})
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, self.code, self.symbols)
+        self.assertEntry(self.cache.get(key))
+        self.assertEntry(self.cache.get(key))
+        self.assertEqual(self.cache.stats, {'hits': 2, 'misses': 1, 'stores': 1, 'evictions': 0})
+
+    def test_key_covers_source_and_options(self):
+        key = cache.cache_key(self.source_bytes, {'optimize': 0, 'inline': 8})
+        self.assertEqual(key, cache.cache_key(self.source_bytes, {'inline': 8, 'optimize': 0}))
+        self.assertNotEqual(key, cache.cache_key(self.source_bytes, {'optimize': 1, 'inline': 8}))
+        self.assertNotEqual(key, cache.cache_key(self.source_bytes + b'\n', {'optimize': 0, 'inline': 8}))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        self.cache.put('a', self.code, self.symbols)
+        size = self.cache.size()
+        # Room for three entries and a half; eviction goes down to 80% of that
+        self.cache.max_bytes = size * 7 // 2
+        for key in ('b', 'c'):
+            self.cache.put(key, self.code, self.symbols)
+        for when, key in enumerate('abc'):
+            os.utime(self.cache.path(key), (1000 + when, 1000 + when))
+        self.assertIsNotNone(self.cache.get('a'))
+        self.cache.put('d', self.code, self.symbols)
+        self.assertEqual(sorted(os.listdir(self.directory)), ['a.rc', 'd.rc'])
+        self.assertEqual(self.cache.stats['evictions'], 2)
+        self.assertLessEqual(self.cache.size(), self.cache.max_bytes * cache.EVICTION_TARGET)
+
+    def test_damaged_entries_are_misses(self):
+        data = cache.encode_entry(self.code, self.symbols)
+        damaged = {
+            'garbage': b'not a cache entry',
+            'truncated': data[:len(data) // 2],
+            'short': zlib.compress(zlib.decompress(data)[:-3]),
+            'magic': zlib.compress(b'XXXX' + zlib.decompress(data)[4:]),
+            'empty': b'',
+        }
+        for key, contents in damaged.items():
+            with open(self.cache.path(key), 'wb') as entry_file:
+                entry_file.write(contents)
+            self.assertIsNone(self.cache.get(key), key)
+            self.assertFalse(os.path.exists(self.cache.path(key)), key)
+        self.assertEqual(self.cache.stats['misses'], len(damaged))
+        self.assertEqual(self.cache.stats['hits'], 0)
+        # A damaged entry is replaced by the next store
+        self.cache.put('short', self.code, self.symbols)
+        self.assertEntry(self.cache.get('short'))
+
+    def test_concurrent_writers(self):
+        # Writers with their own CompileCache store the same key and keys of
+        # their own while readers read the shared one; every read is whole
+        self.cache.put('shared', self.code, self.symbols)
+
+        def write(number):
+            writer = cache.CompileCache(self.directory)
+            for count in range(20):
+                writer.put('shared', self.code, self.symbols)
+                writer.put(f'{number}-{count}', self.code, self.symbols)
+            return writer.stats
+
+        def read(number):
+            reader = cache.CompileCache(self.directory)
+            for _ in range(40):
+                self.assertEntry(reader.get('shared'))
+            return reader.stats
+
+        with ThreadPoolExecutor(8) as executor:
+            writes = [executor.submit(write, number) for number in range(4)]
+            reads = [executor.submit(read, number) for number in range(4)]
+            for future in reads:
+                self.assertEqual(future.result()['misses'], 0)
+            for future in writes:
+                self.assertEqual(future.result()['stores'], 40)
+        self.assertEqual(len(os.listdir(self.directory)), 1 + 4 * 20)
+        for key in ['shared'] + [f'{number}-{count}' for number in range(4) for count in range(20)]:
+            self.assertEntry(self.cache.get(key))
+
+
+if __name__ == "__main__":
+    unittest.main()
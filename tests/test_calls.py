@@ -0,0 +1,113 @@
+# Function calls and returns, and functions inlined at their calls.
+#
+#   python -m pytest tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import assembly
+import vm
+from assembly import Op
+
+FUNCTIONS = """function sub (x integer, y integer)
+{
+    ret x - y;
+}
+function clamp (x integer)
+{
+    if (x > 10) ret 10; endif
+    if (x < 0) ret 0; endif
+    ret x;
+}
+function show (x integer)
+{
+    put (x);
+    ret;
+}
+function nothing (x integer)
+{
+    x = x + 1;
+}
+function fact (n integer)
+integer m;
+{
+    if (n <= 1) ret 1; endif
+    m = n - 1;
+    ret n * fact(m);
+}
+function twice (x integer)
+integer t;
+{
+    t = sub(x, x);
+    ret x + x + t;
+}
+"""
+
+PROGRAM = FUNCTIONS + """#
+integer a, b, i;
+get (a, b);
+put (sub(a, b));
+put (sub(b, a));
+i = 0 - 3;
+while (i < 14) {
+    put (clamp(i));
+    i = i + 4;
+}
+put (show(a));
+put (nothing(a));
+put (fact(a));
+put (twice(b));
+put (a);
+#
+"""
+
+
+def compile_program(source, inline_threshold=assembly.DEFAULT_INLINE_THRESHOLD):
+    lexer = assembly.Lexer()
+    lexer.tokenize(source)
+    parser = assembly.Parser(lexer, None, inline_threshold=inline_threshold)
+    parser.parse(source)
+    return parser
+
+
+class CallTest(unittest.TestCase):
+    def test_calls(self):
+        parser = compile_program(PROGRAM, 0)
+        self.assertTrue(all(function.template is None for function in parser.functions.values()))
+        # sub(a, b) and sub(b, a): the arguments go to the parameters in order;
+        # show's bare ret and running off the end of nothing both return 0
+        self.assertEqual(vm.run(parser.code, [5, 3]), [2, -2, 0, 1, 5, 9, 10, 5, 0, 0, 120, 6, 5])
+
+    def test_recursion_is_not_inlined(self):
+        parser = compile_program(PROGRAM)
+        functions = parser.functions
+        self.assertIsNone(functions['fact'].template)
+        # twice's call to sub is inlined, so twice calls nothing and is inlined too
+        for name in ('sub', 'clamp', 'show', 'nothing', 'twice'):
+            self.assertIsNotNone(functions[name].template, name)
+        calls = {operand for opcode, operand in zip(parser.code.opcodes, parser.code.operands) if opcode == Op.CALL}
+        self.assertEqual(calls, {functions['fact'].label.address})
+
+    def test_inlined_and_called_agree(self):
+        called = compile_program(PROGRAM, 0).code
+        for inline_threshold in (4, 16, assembly.DEFAULT_INLINE_THRESHOLD, 1000):
+            inlined = compile_program(PROGRAM, inline_threshold).code
+            for inputs in ([5, 3], [1, 12], [7, -4]):
+                self.assertEqual(vm.run(inlined, inputs), vm.run(called, inputs), (inline_threshold, inputs))
+
+    def test_ret_in_main_ends_the_program(self):
+        code, _ = assembly.compile_source("#\ninteger a;\nput (1);\nret;\nput (2);\n#")
+        self.assertEqual(vm.run(code), [1])
+
+    def test_call_errors(self):
+        with self.assertRaisesRegex(assembly.SymbolError, "Function sub takes 2 arguments, got 1"):
+            assembly.compile_source(FUNCTIONS + "#\ninteger a;\nput (sub(a));\n#")
+        with self.assertRaisesRegex(assembly.SymbolError, "Undeclared function called: add"):
+            assembly.compile_source(FUNCTIONS + "#\ninteger a;\nput (add(a, a));\n#")
+
+
+if __name__ == "__main__":
+    unittest.main()
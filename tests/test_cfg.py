@@ -0,0 +1,135 @@
+# The control-flow graph and the passes of cfg.py, on hand-written code and
+# on compiled programs, checked against the VM.
+#
+#   python -m pytest tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import assembly
+import cfg
+import optimizer
+import vm
+from assembly import Op
+from bench_vm import PROGRAMS
+
+# Constant conditions, code after a ret and a function nothing calls
+DEAD_CODE = """function unused (x integer)
+{
+    ret x * 2;
+}
+#
+integer a;
+get (a);
+if (1 < 2) put (a); else put (0 - a); endif
+while (1 == 0) {
+    put (a);
+}
+if (a > 3) put (a * 10); endif
+put (a + 1);
+ret;
+put (a);
+#
+"""
+
+
+def make_code(*instructions):
+    code = assembly.Code()
+    for instruction in instructions:
+        code.emit(*instruction)
+    return code
+
+
+def copy(code):
+    return make_code(*zip(code.opcodes, code.operands))
+
+
+def run_pass(code, function):
+    # Runs one pass that marks instructions in live and arranges the code
+    stats = {'branches': 0, 'unreachable': 0, 'laid_out': 0}
+    live = bytearray(b'\x01') * len(code)
+    order = function(code, live, stats)
+    cfg.arrange(code, live, order if isinstance(order, list) else None)
+    return stats
+
+
+class CFGTest(unittest.TestCase):
+    def test_blocks_and_edges(self):
+        code = make_code((Op.PUSHI, 1), (Op.JUMPZ, 4), (Op.PUSHI, 5), (Op.STDOUT,), (Op.PUSHI, 6), (Op.STDOUT,))
+        blocks = cfg.build(code)
+        self.assertEqual([(block.start, block.end) for block in blocks], [(0, 2), (2, 4), (4, 6)])
+        self.assertEqual([[successor.index for successor in block.successors] for block in blocks], [[1, 2], [2], []])
+        self.assertEqual(cfg.count_edges(blocks), 3)
+
+    def test_fold_constant_branch(self):
+        for condition, outputs in ((0, [6]), (1, [5, 6])):
+            code = make_code((Op.PUSHI, condition), (Op.JUMPZ, 4), (Op.PUSHI, 5), (Op.STDOUT,),
+                             (Op.PUSHI, 6), (Op.STDOUT,))
+            self.assertEqual(run_pass(code, cfg.fold_branches)['branches'], 1)
+            self.assertNotIn(Op.JUMPZ, code.opcodes)
+            self.assertEqual(vm.run(code), outputs)
+
+    def test_branch_that_is_jumped_to_is_not_folded(self):
+        # The JUMP at 1 lands on the JUMPZ with the input on the stack
+        code = make_code((Op.STDIN,), (Op.JUMP, 3), (Op.PUSHI, 0), (Op.JUMPZ, 6), (Op.PUSHI, 5), (Op.STDOUT,),
+                         (Op.PUSHI, 6), (Op.STDOUT,))
+        expected = {value: vm.run(code, [value]) for value in (0, 1)}
+        self.assertEqual(run_pass(code, cfg.fold_branches)['branches'], 0)
+        for value, outputs in expected.items():
+            self.assertEqual(vm.run(code, [value]), outputs)
+
+    def test_remove_dead_blocks(self):
+        # A block after a RET and a function no CALL reaches
+        code = make_code((Op.PUSHI, 1), (Op.STDOUT,), (Op.RET,), (Op.PUSHI, 2), (Op.STDOUT,),
+                         (Op.PUSHI, 3), (Op.RET,))
+        stats = run_pass(code, cfg.remove_unreachable)
+        self.assertEqual(stats['unreachable'], 1)
+        self.assertEqual(list(code.opcodes), [Op.PUSHI, Op.STDOUT, Op.RET])
+        self.assertEqual(vm.run(code), [1])
+
+        # A called function stays
+        code = make_code((Op.CALL, 4), (Op.STDOUT,), (Op.RET,), (Op.RET,), (Op.PUSHI, 3), (Op.RET,))
+        self.assertEqual(run_pass(code, cfg.remove_unreachable)['unreachable'], 1)
+        self.assertEqual(vm.run(code), [3])
+
+    def test_layout_preserves_behaviour(self):
+        # Three blocks in reverse order, each jumping to the next
+        code = make_code((Op.STDIN,), (Op.POPM, 7000), (Op.JUMP, 6),
+                         (Op.PUSHI, 2), (Op.STDOUT,), (Op.RET,),
+                         (Op.PUSHM, 7000), (Op.STDOUT,), (Op.JUMP, 3))
+        expected = {value: vm.run(code, [value]) for value in (0, 4)}
+        self.assertEqual(run_pass(code, cfg.layout)['laid_out'], 2)
+        self.assertNotIn(Op.JUMP, code.opcodes)
+        for value, outputs in expected.items():
+            self.assertEqual(vm.run(code, [value]), outputs)
+
+    def test_simplify_compiled_program(self):
+        lexer = assembly.Lexer()
+        lexer.tokenize(DEAD_CODE)
+        parser = assembly.Parser(lexer, None, inline_threshold=0)
+        parser.parse(DEAD_CODE)
+        original = copy(parser.code)
+        stats = optimizer.optimize(parser.code, 2, parser.symbol_table)
+        self.assertGreaterEqual(stats['branches'], 2)
+        self.assertGreaterEqual(stats['unreachable'], 3)
+        self.assertLess(len(parser.code), len(original))
+        for value in (1, 5, -2):
+            self.assertEqual(vm.run(parser.code, [value]), vm.run(original, [value]))
+
+    def test_simplify_benchmark_programs(self):
+        # The CFG passes alone, without the peephole and expression passes
+        laid_out = 0
+        for name, source in PROGRAMS.items():
+            code, _ = assembly.compile_source(source)
+            original = copy(code)
+            laid_out += cfg.simplify(code)['laid_out']
+            self.assertEqual(vm.run(code, [20] * 4), vm.run(original, [20] * 4), name)
+        self.assertGreater(laid_out, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+# The compile daemon's request handling and directory scanning, without a
+# socket.
+#
+#   python -m pytest tests
+
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from daemon import CompileDaemon
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test3.txt')
+
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.daemon = CompileDaemon(os.path.join(self.directory, 'socket'), watch_dir=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def handle(self, request):
+        async def run():
+            self.daemon.executor = ThreadPoolExecutor(1)
+            try:
+                return await self.daemon.handle(request)
+            finally:
+                self.daemon.executor.shutdown()
+        return asyncio.run(run())
+
+    def test_requests_that_are_not_objects_get_an_error(self):
+        for request in ([], 1, "x", None):
+            response = self.handle(request)
+            self.assertFalse(response['ok'])
+            self.assertIn("Bad request", response['error'])
+
+    def test_fields_of_the_wrong_type_get_an_error(self):
+        source = os.path.join(self.directory, 'test3.txt')
+        shutil.copy(SAMPLE, source)
+        for request in ({'input': ['a']}, {'input': 5}, {'input': source, 'output': ['b']},
+                        {'input': source, 'optimize': '1'}, {'input': source, 'optimize': 3},
+                        {'input': source, 'optimize': True}, {'input': source, 'all_errors': 'yes'}):
+            response = self.handle(dict(request, command='compile'))
+            self.assertFalse(response['ok'])
+            self.assertIn("Bad request", response['error'])
+        self.assertEqual(self.daemon.stats['compiles'], 0)
+
+    def test_compile_then_unchanged(self):
+        source = os.path.join(self.directory, 'test3.txt')
+        shutil.copy(SAMPLE, source)
+        response = self.handle({'command': 'compile', 'input': source})
+        self.assertTrue(response['ok'], response)
+        self.assertTrue(os.path.exists(response['output']))
+        self.assertTrue(self.handle({'command': 'compile', 'input': source}).get('unchanged'))
+
+    def test_scan_skips_compiled_output(self):
+        shutil.copy(SAMPLE, os.path.join(self.directory, 'test3.txt'))
+        shutil.copy(SAMPLE, os.path.join(self.directory, 'test3.asm.txt'))
+        names = [os.path.basename(path) for path, _, _ in self.daemon.scan()]
+        self.assertEqual(names, ['test3.txt'])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+# The LL(1) check on the grammar, and parse_tables.py against the tables
+# grammar.py builds.
+#
+#   python -m pytest tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import grammar
+import parse_tables
+from assembly import IDENTIFIER, OPERATOR
+
+
+def grammar_conflicts(rules, start):
+    first = grammar.first_sets(rules)
+    return grammar.conflicts(grammar.predict_sets(rules, first, grammar.follow_sets(rules, first, start)))
+
+
+class GrammarTest(unittest.TestCase):
+    def test_tables_are_up_to_date(self):
+        with open(grammar.TABLES_PATH, encoding='utf-8') as tables_file:
+            self.assertEqual(tables_file.read(), grammar.render_tables(grammar.build_tables()))
+        self.assertEqual(parse_tables.GRAMMAR_DIGEST, grammar.grammar_digest())
+        for table_name, table in grammar.build_tables().items():
+            self.assertEqual(getattr(parse_tables, table_name), table, table_name)
+
+    def test_grammar_is_ll1(self):
+        self.assertEqual(grammar_conflicts(grammar.GRAMMAR, grammar.START), [])
+
+    def test_ambiguous_grammar_is_reported(self):
+        # Two alternatives starting with the same token class
+        rules = {'<S>': [('assign', ['<Identifier>', "'='"]), ('call', ['<Identifier>', "'('"])]}
+        self.assertEqual(grammar_conflicts(rules, '<S>'), [('<S>', IDENTIFIER, ['assign', 'call'])])
+
+        # An <Empty> alternative whose FOLLOW overlaps the other alternative
+        rules = {'<S>': [('s', ['<A>', "'+'"])], '<A>': [('plus', ["'+'"]), ('empty', [])]}
+        self.assertEqual(grammar_conflicts(rules, '<S>'), [('<A>', (OPERATOR, '+'), ['empty', 'plus'])])
+
+        # 'function' is lexed as an identifier
+        rules = {'<S>': [('function', ["'function'"]), ('identifier', ['<Identifier>'])]}
+        self.assertEqual(grammar_conflicts(rules, '<S>'),
+                         [('<S>', (IDENTIFIER, 'function'), ['function', 'identifier'])])
+
+    def test_build_tables_rejects_conflicts(self):
+        rules = dict(grammar.GRAMMAR)
+        rules['<Primary Tail>'] = rules['<Primary Tail>'] + [('index', ["'('", '<Expression>', "')'"])]
+        with self.assertRaisesRegex(Exception, r"not LL\(1\): <Primary Tail> on \('separator', '\('\) "
+                                               r"could be call or index"):
+            grammar.build_tables(rules)
+
+
+if __name__ == "__main__":
+    unittest.main()
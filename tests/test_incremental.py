@@ -0,0 +1,87 @@
+# Incremental recompiles after editing one function against compiling the
+# edited program from scratch.
+#
+#   python -m pytest tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import assembly
+import incremental
+
+SOURCE = """function scale (x integer)
+integer t;
+{
+    t = x * 3;
+    ret t + 1;
+}
+function offset (x integer)
+{
+    ret x - 4;
+}
+function both (x integer)
+integer t;
+{
+    t = scale(x);
+    ret offset(t);
+}
+#
+integer a, s;
+get (a);
+s = scale(a) + both(a);
+put (s);
+#
+"""
+
+
+class IncrementalTest(unittest.TestCase):
+    def assertSameCode(self, actual, expected):
+        self.assertEqual(list(actual[0].opcodes), list(expected[0].opcodes))
+        self.assertEqual(list(actual[0].operands), list(expected[0].operands))
+        self.assertEqual(actual[1], expected[1])
+
+    def check_edits(self, inline_threshold):
+        compiler = incremental.IncrementalCompiler(inline_threshold)
+        self.assertSameCode(compiler.compile(SOURCE), assembly.compile_source(SOURCE, inline_threshold=inline_threshold))
+        self.assertTrue(compiler.stats['full'])
+
+        # Unchanged: nothing is compiled again
+        compiler.compile(SOURCE)
+        self.assertEqual(compiler.stats['compiled'], 0)
+
+        # One function's body: only it and what inlined it are compiled again
+        edited = SOURCE.replace("ret x - 4;", "ret x - 40;")
+        self.assertSameCode(compiler.compile(edited), assembly.compile_source(edited, inline_threshold=inline_threshold))
+        self.assertFalse(compiler.stats['full'])
+        self.assertLess(compiler.stats['compiled'], compiler.stats['fragments'])
+        if not inline_threshold:
+            self.assertEqual(compiler.stats['compiled'], 1)
+        self.assertLess(compiler.stats['lexed'], len(edited))
+
+        # A new local moves the function's frame, so the globals move too
+        edited = edited.replace("function offset (x integer)\n", "function offset (x integer)\ninteger u;\n")
+        edited = edited.replace("ret x - 40;", "u = x;\n    ret u - 40;")
+        self.assertSameCode(compiler.compile(edited), assembly.compile_source(edited, inline_threshold=inline_threshold))
+        self.assertFalse(compiler.stats['full'])
+
+    def test_edit_one_function(self):
+        for inline_threshold in (0, assembly.DEFAULT_INLINE_THRESHOLD):
+            self.check_edits(inline_threshold)
+
+    def test_error_then_fix(self):
+        compiler = incremental.IncrementalCompiler()
+        compiler.compile(SOURCE)
+        broken = SOURCE.replace("ret x - 4;", "ret x - ;")
+        with self.assertRaises(Exception) as expected:
+            assembly.compile_source(broken)
+        with self.assertRaises(Exception) as raised:
+            compiler.compile(broken)
+        self.assertEqual(str(raised.exception), str(expected.exception))
+        self.assertSameCode(compiler.compile(SOURCE), assembly.compile_source(SOURCE))
+
+
+if __name__ == "__main__":
+    unittest.main()
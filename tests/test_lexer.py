@@ -0,0 +1,101 @@
+# The lexer engines against each other, and compiling with each of them.
+#
+#   python -m pytest tests
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import assembly
+from generate import generate_program
+
+SAMPLES = [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), f'test{n}.txt') for n in (1, 2, 3)]
+
+
+def tokens(source, engine):
+    lexer = assembly.Lexer(engine)
+    lexer.tokenize(source)
+    return list(lexer.tokens)
+
+
+class LexerTest(unittest.TestCase):
+    def test_engines_agree(self):
+        sources = [generate_program(seed, 500) for seed in range(3)]
+        for path in SAMPLES:
+            with open(path, encoding='utf-8-sig') as input_f:
+                sources.append(input_f.read())
+        for source in sources:
+            for engine in ('compact', 'fsm'):
+                self.assertEqual(tokens(source, engine), tokens(source, 'regex'))
+
+    def test_compile_file_with_each_engine(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            listings = {}
+            for engine in assembly.LEXER_ENGINES:
+                output_path = os.path.join(output_dir, engine + '.txt')
+                for path in SAMPLES:
+                    result = assembly.compile_file(path, output_path, 2, lexer_engine=engine)
+                    self.assertIsNone(result[3])
+                    with open(output_path, encoding='utf-8') as output_f:
+                        listings[engine, path] = output_f.read()
+            for path in SAMPLES:
+                for engine in ('compact', 'fsm'):
+                    self.assertEqual(listings[engine, path], listings['regex', path])
+
+    def test_compact_positions_and_recovery(self):
+        source = "#\ninteger a;\na = a + ;\nput (b);\n#"
+        offsets = {}
+        errors = {}
+        for engine in ('compact', 'regex'):
+            lexer = assembly.Lexer(engine, positions=True)
+            lexer.tokenize(source)
+            offsets[engine] = list(lexer.offsets)
+            with self.assertRaises(assembly.CompileErrors) as raised:
+                assembly.compile_source(source, recover=True, lexer_engine=engine)
+            errors[engine] = str(raised.exception)
+        self.assertEqual(offsets['compact'], offsets['regex'])
+        self.assertEqual(errors['compact'], errors['regex'])
+
+    def test_compact_lexeme_table_is_bounded(self):
+        names = ' '.join(f"v{chr(97 + n % 26)}{chr(97 + n // 26 % 26)}{chr(97 + n // 676 % 26)}" for n in range(3000))
+        size = assembly.STREAM_LEXEME_CACHE_SIZE
+        try:
+            assembly.STREAM_LEXEME_CACHE_SIZE = 100
+            self.assertEqual(tokens(names, 'compact'), tokens(names, 'regex'))
+        finally:
+            assembly.STREAM_LEXEME_CACHE_SIZE = size
+
+    def test_non_ascii_digits_are_invalid(self):
+        # str.isdigit accepts them but int() does not read all of them
+        for number in ('\u00b2', '3\u00b2', '\u0661\u0662', '1.\u00b2'):
+            source = f"#\ninteger x;\nx = {number};\nput (x);\n#"
+            for engine in assembly.LEXER_ENGINES:
+                self.assertIn((assembly.INVALID, number), tokens(source, engine))
+            with self.assertRaisesRegex(Exception, 'Invalid primary token'):
+                assembly.compile_source(source)
+            with self.assertRaises(assembly.CompileErrors):
+                assembly.compile_source(source, recover=True)
+
+    def test_integer_literal_range(self):
+        largest = f"#\ninteger x;\nx = {assembly.MAX_OPERAND};\nput (x);\n#"
+        code, _ = assembly.compile_source(largest)
+        self.assertIn(assembly.MAX_OPERAND, code.operands)
+        too_large = largest.replace(str(assembly.MAX_OPERAND), str(assembly.MAX_OPERAND + 1))
+        for level in (0, 1, 2):
+            with self.assertRaisesRegex(Exception, 'Integer literal out of range'):
+                assembly.compile_source(too_large, level)
+        with self.assertRaises(assembly.CompileErrors) as raised:
+            assembly.compile_source(too_large, recover=True)
+        self.assertEqual([(error.line, error.column) for error in raised.exception.errors], [(3, 5)])
+
+    def test_fsm_cannot_stream(self):
+        with self.assertRaises(Exception):
+            assembly.Lexer('fsm').tokenize_stream(iter(()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+# Linking separately compiled fragments against compiling the whole program
+# at once.
+#
+#   python -m pytest tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import assembly
+import linker
+import vm
+from generate import identifier_names
+
+
+def program(count):
+    # count functions, each but the first calling the one before it, and a
+    # main section printing what each returns
+    names = identifier_names(count)
+    lines = []
+    for index, name in enumerate(names):
+        lines.append(f"function {name} (x integer)")
+        lines.append("integer t;")
+        lines.append("{")
+        if index:
+            lines.append(f"    t = {names[index - 1]}(x);")
+            lines.append(f"    ret t * {index % 5 + 2} - x;")
+        else:
+            lines.append("    t = x * 3;")
+            lines.append("    while (t > 100) t = t / 2;")
+            lines.append("    ret t + 1;")
+        lines.append("}")
+    lines.append("#")
+    lines.append("integer a, s;")
+    lines.append("get (a);")
+    lines.append("s = 0;")
+    for name in names:
+        lines.append(f"s = s + {name}(a);")
+        lines.append("put (s);")
+    lines.append("#")
+    return '\n'.join(lines) + '\n'
+
+
+class LinkerTest(unittest.TestCase):
+    def assertSameCode(self, actual, expected):
+        self.assertEqual(list(actual[0].opcodes), list(expected[0].opcodes))
+        self.assertEqual(list(actual[0].operands), list(expected[0].operands))
+        self.assertEqual(actual[1], expected[1])
+
+    def test_link_matches_whole_compile(self):
+        for count in (1, 4, 12):
+            for inline_threshold in (0, assembly.DEFAULT_INLINE_THRESHOLD):
+                source = program(count)
+                fragments = linker.split(source, 0, linker.PREFIX)
+                self.assertEqual(len(fragments), count + 2)
+                linker.compile_fragments(fragments, inline_threshold)
+                linked = linker.link(fragments, linker.globals_base(fragments))
+                expected = assembly.compile_source(source, inline_threshold=inline_threshold)
+                self.assertSameCode(linked, expected)
+                self.assertEqual(vm.run(linked[0], [7]), vm.run(expected[0], [7]))
+
+    def test_compile_parallel_matches_whole_compile(self):
+        source = program(8)
+        for level in (0, 2):
+            self.assertSameCode(linker.compile_parallel(source, 2, level, min_functions=1),
+                                assembly.compile_source(source, level))
+
+    def test_errors_are_reported_as_whole_compile_does(self):
+        source = program(3).replace("ret t + 1;", "ret t + ;")
+        with self.assertRaises(Exception) as expected:
+            assembly.compile_source(source)
+        with self.assertRaises(Exception) as linked:
+            linker.compile_parallel(source, 2, min_functions=1)
+        self.assertEqual(str(linked.exception), str(expected.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+# Object files written and read back through mmap.
+#
+#   python -m pytest tests
+
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import assembly
+import objfile
+from generate import generate_program
+
+SAMPLES = [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), f'test{n}.txt') for n in (1, 2, 3)]
+
+
+class ObjectFileTest(unittest.TestCase):
+    def setUp(self):
+        handle, self.object_path = tempfile.mkstemp(suffix=objfile.OBJECT_SUFFIX)
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.object_path)
+
+    def sources(self):
+        for path in SAMPLES:
+            with open(path, encoding='utf-8-sig') as input_f:
+                yield input_f.read()
+        yield generate_program(2, 2000)
+
+    def test_round_trip(self):
+        for source in self.sources():
+            code, symbols = assembly.compile_source(source, 2)
+            objfile.write_object(self.object_path, code, symbols)
+            with objfile.ObjectFile(self.object_path) as object_file:
+                self.assertEqual(object_file.instruction_count, len(code))
+                self.assertEqual(bytes(object_file.opcodes), bytes(code.opcodes))
+                self.assertEqual(list(object_file.operands), list(code.operands))
+                self.assertEqual(object_file.symbols(), symbols)
+                self.assertEqual(object_file.listing(), '\n'.join(assembly.listing_lines(code, symbols)) + '\n')
+                read_code = object_file.code()
+            # The copy outlives the map
+            self.assertEqual(list(read_code.opcodes), list(code.opcodes))
+            self.assertEqual(list(read_code.operands), list(code.operands))
+
+    def test_write_output_object_format(self):
+        code, symbols = assembly.compile_source(generate_program(4, 300))
+        assembly.write_output(self.object_path, code, symbols, 'object')
+        read_code, read_symbols = objfile.read_object(self.object_path)
+        self.assertEqual(list(read_code.opcodes), list(code.opcodes))
+        self.assertEqual(list(read_code.operands), list(code.operands))
+        self.assertEqual(read_symbols, symbols)
+
+    def test_truncated_or_foreign_file(self):
+        with open(self.object_path, 'wb') as object_f:
+            object_f.write(objfile.encode_object(*assembly.compile_source(generate_program(5, 50)))[:-8])
+        with self.assertRaises(objfile.ObjectFileError):
+            objfile.ObjectFile(self.object_path)
+        with open(self.object_path, 'wb') as object_f:
+            object_f.write(b'not an object file at all, only text' * 4)
+        with self.assertRaises(objfile.ObjectFileError):
+            objfile.ObjectFile(self.object_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
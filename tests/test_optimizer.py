@@ -0,0 +1,227 @@
+# Programs compiled at -O0 and -O2 against each other on the VM and on the
+# Python translation, and what -O2 moves out of loops and reuses.
+#
+#   python -m pytest tests
+
+import itertools
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import assembly
+import optimizer
+import pycodegen
+import vm
+from bench_vm import PROGRAMS
+
+SAMPLES = [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), f'test{n}.txt') for n in (1, 2, 3)]
+
+# a * b is the same on every pass
+INVARIANT = """
+#
+integer a, b, i, s;
+get (a, b);
+i = 0;
+s = 0;
+while (i < 10) {
+    s = s + a * b;
+    i = i + 1;
+}
+put (s);
+#
+"""
+
+# a * b changes with b, which the loop assigns after using it
+ASSIGNED_IN_LOOP = """
+#
+integer a, b, i, s;
+get (a, b);
+i = 0;
+s = 0;
+while (i < 10) {
+    s = s + a * b;
+    b = b + i;
+    i = i + 1;
+}
+put (s);
+put (b);
+#
+"""
+
+# a * i only stays the same inside the inner loop
+NESTED = """
+#
+integer a, i, j, s;
+get (a);
+i = 0;
+s = 0;
+while (i < 4) {
+    j = 0;
+    while (j < 5) {
+        s = s + a * i;
+        j = j + 1;
+    }
+    i = i + 1;
+}
+put (s);
+#
+"""
+
+# a / b is only worked out when b is not zero, and the second loop never runs
+GUARDED_DIVISION = """
+#
+integer a, b, i, s;
+get (a, b);
+i = 0;
+s = 0;
+while (i < 3) {
+    if (b != 0) s = s + a / b; endif
+    i = i + 1;
+}
+while (i < 0) {
+    s = a / b;
+}
+put (s);
+#
+"""
+
+# a * b is computed three times before a changes, and once after
+REPEATED = """
+#
+integer a, b, x, y, z;
+get (a, b);
+x = a * b + a * b;
+y = a * b;
+a = a + 1;
+z = a * b;
+put (x);
+put (y);
+put (z);
+#
+"""
+
+# x and y come out beyond what an operand holds, so their expressions cannot
+# be folded; the last product fits and is
+OVERFLOWING = """
+#
+integer x, y;
+x = 3037000500 * 3037000500;
+y = 0 - 9223372036854775807 - 2;
+put (x);
+put (y);
+put (3037000499 * 3037000499);
+#
+"""
+
+# show(i) is inlined between a and the +, and has to run on every pass
+INLINED_IN_LOOP = """
+function show (x integer)
+{
+    put (x);
+    ret 7;
+}
+#
+integer a, i, s;
+get (a);
+i = 0;
+s = 0;
+while (i < 3) {
+    s = s + (a + show(i)) * i;
+    i = i + 1;
+}
+put (s);
+#
+"""
+
+# Both a + show(b) print b, so neither can stand in for the other
+INLINED_TWICE = """
+function show (x integer)
+{
+    put (x);
+    ret 7;
+}
+#
+integer a, b, x, y;
+get (a, b);
+x = (a + show(b)) * 2;
+y = (a + show(b)) * 3;
+put (x + y);
+#
+"""
+
+
+def compile_program(source, level):
+    lexer = assembly.Lexer()
+    lexer.tokenize(source)
+    parser = assembly.Parser(lexer, None)
+    parser.parse(source)
+    stats = optimizer.optimize(parser.code, level, parser.symbol_table) if level else None
+    return parser.code, stats
+
+
+def run(code, inputs, backend=vm.VM):
+    inputs = iter(inputs)
+    outputs = []
+    backend(code, lambda: next(inputs), outputs.append).run()
+    return outputs
+
+
+class OptimizerTest(unittest.TestCase):
+    def assertSameOutputs(self, source, inputs):
+        # Returns the -O2 optimizer stats
+        expected = run(compile_program(source, 0)[0], inputs)
+        code, stats = compile_program(source, 2)
+        self.assertEqual(run(code, inputs), expected)
+        self.assertEqual(run(code, inputs, pycodegen.CompiledVM), expected)
+        return stats
+
+    def test_samples(self):
+        for path in SAMPLES:
+            with open(path, encoding='utf-8-sig') as input_f:
+                self.assertSameOutputs(input_f.read(), itertools.repeat(12))
+
+    def test_benchmark_programs(self):
+        for name, source in PROGRAMS.items():
+            with self.subTest(name):
+                self.assertSameOutputs(source, itertools.repeat(20))
+
+    def test_invariant_is_hoisted(self):
+        stats = self.assertSameOutputs(INVARIANT, [6, 7])
+        self.assertGreater(stats['hoisted'], 0)
+
+    def test_value_assigned_in_loop_is_not_hoisted(self):
+        stats = self.assertSameOutputs(ASSIGNED_IN_LOOP, [6, 7])
+        self.assertEqual(stats['hoisted'], 0)
+
+    def test_nested_loop_invariant(self):
+        stats = self.assertSameOutputs(NESTED, [3])
+        self.assertGreater(stats['hoisted'], 0)
+
+    def test_division_by_variable_is_not_hoisted(self):
+        for b in (0, 4):
+            self.assertSameOutputs(GUARDED_DIVISION, [9, b])
+
+    def test_inlined_body_is_not_hoisted(self):
+        self.assertEqual(self.assertSameOutputs(INLINED_IN_LOOP, [5])['hoisted'], 0)
+
+    def test_inlined_body_is_not_reused(self):
+        self.assertEqual(self.assertSameOutputs(INLINED_TWICE, [5, 2])['reused'], 0)
+
+    def test_fold_skips_results_too_large_for_an_operand(self):
+        for level in (1, 2):
+            code, stats = compile_program(OVERFLOWING, level)
+            self.assertEqual(run(code, []), [3037000500 * 3037000500, -9223372036854775809, 3037000499 * 3037000499])
+            self.assertIn(3037000499 * 3037000499, code.operands)
+            self.assertGreater(stats['folded'], 0)
+
+    def test_repeated_expression_is_reused(self):
+        stats = self.assertSameOutputs(REPEATED, [6, 7])
+        self.assertGreater(stats['reused'], 0)
+        self.assertEqual(run(compile_program(REPEATED, 2)[0], [6, 7]), [84, 42, 49])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+# The untraced parser's precedence-climbing expressions against the traced
+# recursive-descent ones.
+#
+#   python -m pytest tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import assembly
+import vm
+from generate import generate_program
+
+EXPRESSIONS = [
+    "a + b * c - d / e",
+    "a - b - c - d",
+    "a / b / c * d",
+    "a * b + c * d - e * a",
+    "-a + -b * -c",
+    "-(a + b) * c",
+    "((((a))))",
+    "(a + (b - (c * (d / (e + 1)))))",
+    "a * (b + c) / (d - e) + (a)",
+    "1 + 2 * 3 - 4 / 5",
+    "true + false * a",
+    "add(a, b) * add(c, d) - add(e, a)",
+    "(add(a, b) + c) * -add(d, e)",
+    "add(a, b) / (a - add(b, c)) + 7",
+]
+
+FUNCTION = """function add (x integer, y integer)
+{
+    ret x + y;
+}
+"""
+
+
+def compile_traced(source, trace_level, inline_threshold=assembly.DEFAULT_INLINE_THRESHOLD):
+    lexer = assembly.Lexer()
+    lexer.tokenize(source)
+    sink = assembly.RuleCountSink() if trace_level != assembly.TRACE_OFF else None
+    parser = assembly.Parser(lexer, None, trace_level, sink, inline_threshold=inline_threshold)
+    parser.parse(source)
+    return parser.code
+
+
+class ExpressionTest(unittest.TestCase):
+    def assertSameCode(self, source, inline_threshold=assembly.DEFAULT_INLINE_THRESHOLD):
+        untraced = compile_traced(source, assembly.TRACE_OFF, inline_threshold)
+        for trace_level in (assembly.TRACE_RULES, assembly.TRACE_TOKENS):
+            traced = compile_traced(source, trace_level, inline_threshold)
+            self.assertEqual(list(traced.opcodes), list(untraced.opcodes), source)
+            self.assertEqual(list(traced.operands), list(untraced.operands), source)
+
+    def test_expressions(self):
+        for expression in EXPRESSIONS:
+            source = f"{FUNCTION}#\ninteger a, b, c, d, e;\na = {expression};\nput ({expression});\n" \
+                     f"while ({expression} < {expression}) a = {expression};\n#"
+            for inline_threshold in (0, assembly.DEFAULT_INLINE_THRESHOLD):
+                self.assertSameCode(source, inline_threshold)
+
+    def test_values(self):
+        cases = [("2 + 3 * 4 - 6 / 2", 11), ("20 - 5 - 3", 12), ("64 / 4 / 2", 8), ("(2 + 3) * (4 - 1)", 15),
+                 ("2 * (3 + (4 - (1 + 1))) * 2", 20), ("add(a, b) * add(a, a) - a", 39)]
+        for expression, value in cases:
+            source = f"{FUNCTION}#\ninteger a, b;\na = 3;\nb = 4;\nput ({expression});\n#"
+            for trace_level in (assembly.TRACE_OFF, assembly.TRACE_RULES):
+                self.assertEqual(vm.run(compile_traced(source, trace_level)), [value], expression)
+
+    def test_generated_programs(self):
+        for seed in range(4):
+            self.assertSameCode(generate_program(seed, 400, expression_length=6))
+
+
+if __name__ == "__main__":
+    unittest.main()
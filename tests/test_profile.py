@@ -0,0 +1,36 @@
+# What a profiled compile times and counts.
+#
+#   python -m pytest tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import assembly
+from generate import generate_program
+
+
+class ProfileTest(unittest.TestCase):
+    def test_rule_counting_is_timed_apart_from_parse(self):
+        source = generate_program(1, 300)
+        profile = assembly.Profile()
+        code, symbols = assembly.compile_source(source, profile=profile)
+        expected_code, expected_symbols = assembly.compile_source(source)
+        self.assertEqual(list(code.opcodes), list(expected_code.opcodes))
+        self.assertEqual(symbols, expected_symbols)
+        phases = profile.as_dict()['phases']
+        for phase in ('tokenize', 'parse', 'count_rules'):
+            self.assertEqual(phases[phase]['calls'], 1)
+
+        lexer = assembly.Lexer()
+        lexer.tokenize(source)
+        rule_counter = assembly.RuleCountSink()
+        assembly.Parser(lexer, None, assembly.TRACE_RULES, rule_counter).parse(source)
+        self.assertEqual(profile.as_dict()['counters']['rules'], dict(rule_counter.counts))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,136 @@
+# Programs translated to Python against the VM: the same outputs, final
+# memory and errors, and the VM taking over for code the translation leaves
+# to it.
+#
+#   python -m pytest tests
+
+import itertools
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import assembly
+import pycodegen
+import vm
+from bench_vm import PROGRAMS
+from generate import generate_program
+
+SAMPLES = [os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), name)
+           for name in ('test1.txt', 'test2.txt', 'test3.txt')]
+
+STRUCTURED = """#
+integer a, b, i;
+get (a, b);
+i = 0;
+while (i < a) {
+    if (i / 2 * 2 == i) put (i * b); else put (0 - i); endif
+    if (i > b) { b = b + i; } endif
+    i = i + 1;
+}
+put (b / (a - 3));
+#
+"""
+
+# fact calls itself, so the call is not inlined
+RECURSIVE = """function fact (n integer)
+integer m;
+{
+    if (n <= 1) ret 1; endif
+    m = n - 1;
+    ret n * fact(m);
+}
+#
+integer a;
+get (a);
+while (a > 0) {
+    put (fact(a));
+    a = a - 1;
+}
+#
+"""
+
+
+def program(*lines):
+    return list(enumerate(lines))
+
+
+# Stack depths that differ between the paths into an instruction
+UNEVEN_STACK = program("STDIN", "JUMPZ 4", "PUSHI 7", "PUSHI 8", "PUSHI 9", "STDOUT", "RET")
+
+# A loop entered both at its top and in its middle, which no while reads as
+IRREDUCIBLE = program("STDIN", "POPM 7000", "PUSHM 7000", "JUMPZ 9", "JUMP 5",
+                      "PUSHM 7000", "PUSHI 1", "SUB", "POPM 7000",
+                      "PUSHM 7000", "STDOUT", "PUSHM 7000", "PUSHI 0", "GRT", "JUMPZ 16", "JUMP 5", "RET")
+
+
+def execute(backend, code, inputs):
+    # (outputs, final memory, error message or None)
+    inputs = iter(inputs)
+    outputs = []
+    machine = backend(code, lambda: next(inputs), outputs.append)
+    try:
+        machine.run()
+    except vm.VMError as e:
+        return outputs, machine.memory, str(e)
+    return outputs, machine.memory, None
+
+
+class TranslationTest(unittest.TestCase):
+    def assertSameRun(self, code, inputs, translated=None):
+        # translated: whether the program has to be translated, or has to be
+        # left to the VM; None for either
+        inputs = list(inputs)
+        if translated is not None:
+            self.assertEqual(pycodegen.CompiledVM(code).function is not None, translated)
+        outputs, memory, error = execute(pycodegen.CompiledVM, code, inputs)
+        expected_outputs, expected_memory, expected_error = execute(vm.VM, code, inputs)
+        self.assertEqual(outputs, expected_outputs)
+        self.assertEqual(memory, expected_memory)
+        # The translation does not know the instruction an error happened at
+        self.assertEqual(error is None, expected_error is None, (error, expected_error))
+        return expected_error
+
+    def test_structured_programs(self):
+        for level in (0, 1, 2):
+            code, _ = assembly.compile_source(STRUCTURED, level)
+            for inputs in ([6, 1], [9, -4], [0, 0]):
+                self.assertSameRun(code, inputs, translated=True)
+            self.assertRegex(self.assertSameRun(code, [3, 5]), "Division by zero")
+            self.assertRegex(self.assertSameRun(code, [4]), "Out of input")
+
+    def test_samples_and_benchmarks(self):
+        sources = []
+        for path in SAMPLES:
+            with open(path, encoding='utf-8-sig') as input_f:
+                sources.append(input_f.read())
+        sources.extend(PROGRAMS.values())
+        for source, level in itertools.product(sources, (0, 2)):
+            code, _ = assembly.compile_source(source, level)
+            # Unoptimized code without calls is always structured
+            translated = True if level == 0 and assembly.Op.CALL not in code.opcodes else None
+            self.assertSameRun(code, [12] * 4, translated)
+
+    def test_generated_programs(self):
+        for seed, level in itertools.product(range(4), (0, 2)):
+            code, _ = assembly.compile_source(generate_program(seed, 200), level)
+            self.assertSameRun(code, range(-8, 100), True if level == 0 else None)
+
+    def test_calls_fall_back_to_the_vm(self):
+        code, _ = assembly.compile_source(RECURSIVE)
+        self.assertIn(assembly.Op.CALL, code.opcodes)
+        for inputs in ([0], [1], [6]):
+            self.assertSameRun(code, inputs, translated=False)
+        self.assertEqual(pycodegen.run(code, [4], check=True), [24, 6, 2, 1])
+
+    def test_unstructured_code_falls_back_to_the_vm(self):
+        for code in (UNEVEN_STACK, IRREDUCIBLE):
+            for inputs in ([0], [3]):
+                self.assertSameRun(code, inputs, translated=False)
+        self.assertEqual(vm.run(IRREDUCIBLE, [3]), [2, 1, 0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+# Compiling with recover: every error in a file reported with its line and
+# column, and parsing picking up again after each one.
+#
+#   python -m pytest tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import assembly
+
+# Seven errors; the ';' missing from line 10 is reported where line 11 starts
+SEVERAL_ERRORS = """function f (x integer)
+{
+    x = x + ;
+    ret x;
+}
+#
+integer a, b;
+a = 99999999999999999999;
+b = a * ;
+put (a)
+b = 3;
+while (a < 3) { a = a + ; b = 1; }
+put (c);
+a = 1.5;
+put (b);
+#
+"""
+
+
+def errors(source):
+    try:
+        assembly.compile_source(source, recover=True)
+    except assembly.CompileErrors as e:
+        return [(error.line, error.column, error.message) for error in e.errors]
+    return []
+
+
+class RecoveryTest(unittest.TestCase):
+    def test_every_error_is_reported(self):
+        self.assertEqual(errors(SEVERAL_ERRORS), [
+            (3, 13, "Invalid primary token: ('separator', ';')"),
+            (8, 5, "Integer literal out of range: 99999999999999999999"),
+            (9, 9, "Invalid primary token: ('separator', ';')"),
+            (11, 1, "Expected ;, got b"),
+            (12, 25, "Invalid primary token: ('separator', ';')"),
+            (13, 7, "Undeclared identifier used: c"),
+            (14, 5, "Invalid primary token: ('real', '1.5')"),
+        ])
+
+    def test_first_error_without_recover(self):
+        with self.assertRaisesRegex(Exception, r"Invalid primary token: \('separator', ';'\)"):
+            assembly.compile_source(SEVERAL_ERRORS)
+
+    def test_resynchronizes_at_semicolon(self):
+        source = "#\ninteger a, b;\na = a + ; b = c;\nput (d);\n#"
+        self.assertEqual(errors(source), [
+            (3, 9, "Invalid primary token: ('separator', ';')"),
+            (3, 16, "Undeclared identifier used: c"),
+            (4, 7, "Undeclared identifier used: d"),
+        ])
+
+    def test_resynchronizes_at_closing_brace(self):
+        source = "#\ninteger a;\nwhile (a < 3) { a = a + 1 }\nput (c);\n#"
+        self.assertEqual(errors(source), [
+            (3, 27, "Expected ;, got }"),
+            (4, 7, "Undeclared identifier used: c"),
+        ])
+        source = "function f (x integer)\n{\n    x = x + ;\n}\n#\ninteger a;\nput (b);\n#"
+        self.assertEqual(errors(source), [
+            (3, 13, "Invalid primary token: ('separator', ';')"),
+            (7, 7, "Undeclared identifier used: b"),
+        ])
+
+    def test_no_errors_compiles_the_same(self):
+        source = SEVERAL_ERRORS.replace(" + ;", " + 1;").replace(" * ;", " * 2;").replace("put (a)\n", "put (a);\n")
+        source = source.replace("99999999999999999999", "9").replace("put (c)", "put (b)").replace("1.5", "15")
+        self.assertEqual(errors(source), [])
+        code, symbols = assembly.compile_source(source, recover=True)
+        expected_code, expected_symbols = assembly.compile_source(source)
+        self.assertEqual(list(code.opcodes), list(expected_code.opcodes))
+        self.assertEqual(list(code.operands), list(expected_code.operands))
+        self.assertEqual(symbols, expected_symbols)
+
+
+if __name__ == "__main__":
+    unittest.main()
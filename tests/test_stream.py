@@ -0,0 +1,73 @@
+# compile_stream against compiling the whole program first, for both output
+# formats, and how much of the program it holds at once.
+#
+#   python -m pytest tests
+
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import assembly
+import objfile
+from generate import generate_program
+
+
+class StreamTest(unittest.TestCase):
+    def setUp(self):
+        self.flush_instructions = assembly.STREAM_FLUSH_INSTRUCTIONS
+        handle, self.output_path = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        assembly.STREAM_FLUSH_INSTRUCTIONS = self.flush_instructions
+        os.remove(self.output_path)
+
+    def stream(self, source, output_format='text'):
+        return assembly.compile_stream(io.StringIO(source), self.output_path, output_format)
+
+    def test_text_matches_listing(self):
+        source = generate_program(3, 2000)
+        code, symbols = assembly.compile_source(source)
+        expected = [line + "\n" for line in assembly.listing_lines(code, symbols)]
+        for size in (1, 7, 4096):
+            assembly.STREAM_FLUSH_INSTRUCTIONS = size
+            self.assertEqual(self.stream(source), (len(code), symbols))
+            with open(self.output_path, encoding='utf-8') as output_f:
+                lines = output_f.readlines()
+            # Jumps written before their target differ only by trailing spaces
+            self.assertEqual([line.rstrip(' \n') + "\n" for line in lines], expected)
+
+    def test_object_matches_encoded(self):
+        source = generate_program(4, 2000)
+        code, symbols = assembly.compile_source(source)
+        assembly.STREAM_FLUSH_INSTRUCTIONS = 5
+        self.stream(source, 'object')
+        with open(self.output_path, 'rb') as output_f:
+            self.assertEqual(output_f.read(), objfile.encode_object(code, symbols))
+
+    def test_held_instructions_bounded_inside_long_statement(self):
+        # Everything is inside one while, whose exit jump stays open to the end
+        body = ''.join(f"x = x + {index};\n" for index in range(5000))
+        source = f"#\ninteger x;\nwhile (x < 10) {{\n{body}}}\nput (x);\n#\n"
+        assembly.STREAM_FLUSH_INSTRUCTIONS = 64
+        held = []
+        flush = assembly.StreamingCode.flush
+
+        def record(code):
+            held.append(len(code.opcodes))
+            flush(code)
+        assembly.StreamingCode.flush = record
+        try:
+            self.stream(source)
+        finally:
+            assembly.StreamingCode.flush = flush
+        self.assertLessEqual(max(held), 64)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+# Scoped lookup in the symbol table: function frames, globals shadowed by
+# locals, and addresses handed out again once a function ends.
+#
+#   python -m pytest tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import assembly
+import vm
+from assembly import MEMORY_BASE, SymbolError, SymbolTable
+
+# Two functions with a parameter x, one calling the other, and a global x
+SAME_NAMES = """function double (x integer)
+{
+    x = x * 2;
+    ret x;
+}
+function triple (x integer)
+integer t;
+{
+    t = double(x);
+    ret t + x;
+}
+#
+integer x, y;
+get (x);
+y = 1;
+put (triple(x));
+put (double(x));
+put (x);
+put (y);
+#
+"""
+
+
+def compile_program(source, inline_threshold):
+    lexer = assembly.Lexer()
+    lexer.tokenize(source)
+    parser = assembly.Parser(lexer, None, inline_threshold=inline_threshold)
+    parser.parse(source)
+    return parser
+
+
+class SymbolTableTest(unittest.TestCase):
+    def test_same_name_in_two_functions(self):
+        symbols = SymbolTable()
+        symbols.enter_function()
+        first = symbols.add_identifier('x', 'integer')
+        self.assertIs(symbols.lookup('x'), first)
+        symbols.exit_function()
+        with self.assertRaisesRegex(SymbolError, "Undeclared identifier used: x"):
+            symbols.lookup('x')
+        symbols.enter_function()
+        second = symbols.add_identifier('x', 'integer')
+        self.assertIsNot(second, first)
+        self.assertIs(symbols.lookup('x'), second)
+        symbols.exit_function()
+        self.assertEqual([entry.lexeme for entry in symbols.entries], ['x', 'x'])
+
+    def test_local_shadows_global(self):
+        symbols = SymbolTable()
+        symbols.add_identifier('a', 'integer')
+        symbols.enter_function()
+        self.assertEqual(symbols.address_of('a'), MEMORY_BASE)
+        local = symbols.add_identifier('a', 'bool')
+        self.assertEqual(symbols.address_of('a'), MEMORY_BASE + 1)
+        self.assertIs(symbols.table['a'], local)
+        with self.assertRaisesRegex(SymbolError, "Duplicate identifier declared: a"):
+            symbols.add_identifier('a')
+        symbols.exit_function()
+        self.assertEqual(symbols.address_of('a'), MEMORY_BASE)
+        self.assertEqual(symbols.lookup('a').type, 'integer')
+        with self.assertRaisesRegex(SymbolError, "Duplicate identifier declared: a"):
+            symbols.add_identifier('a')
+
+    def test_frames_and_temporaries_are_reused(self):
+        symbols = SymbolTable()
+        symbols.enter_function()
+        self.assertEqual(symbols.add_identifier('x').memory_address, MEMORY_BASE)
+        self.assertEqual(symbols.temporary(2), MEMORY_BASE + 1)
+        symbols.exit_function()
+        # The next frame starts where the last one did
+        symbols.enter_function()
+        self.assertEqual(symbols.add_identifier('y').memory_address, MEMORY_BASE)
+        self.assertEqual(symbols.temporary(), MEMORY_BASE + 1)
+        symbols.exit_function()
+        # Globals and temporaries outside a function go above every frame
+        self.assertEqual(symbols.add_identifier('x').memory_address, MEMORY_BASE + 3)
+        self.assertEqual(symbols.temporary(), MEMORY_BASE + 4)
+        self.assertEqual(symbols.add_identifier('y').memory_address, MEMORY_BASE + 5)
+
+    def test_compiled_program(self):
+        for inline_threshold in (0, assembly.DEFAULT_INLINE_THRESHOLD):
+            parser = compile_program(SAME_NAMES, inline_threshold)
+            addresses = [(entry.lexeme, entry.memory_address) for entry in parser.symbol_table.entries]
+            self.assertEqual(addresses[:3], [('x', MEMORY_BASE), ('x', MEMORY_BASE), ('t', MEMORY_BASE + 1)])
+            frame_end = max(address for _, address in addresses[:3])
+            self.assertTrue(all(address > frame_end for _, address in addresses[3:]), addresses)
+            # triple's x survives the call to double, and the global x both
+            self.assertEqual(vm.run(parser.code, [5]), [15, 10, 5, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# The stack machine on hand-written programs and on compiled ones.
+#
+#   python -m pytest tests
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import assembly
+import vm
+
+SAMPLE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'test1.txt')
+
+
+def program(*lines):
+    # (index, text) pairs, as Parser.assembly_code lists them
+    return list(enumerate(lines))
+
+
+def binary(opcode, left, right):
+    return vm.run(program(f"PUSHI {left}", f"PUSHI {right}", opcode, "STDOUT"))[0]
+
+
+class VMTest(unittest.TestCase):
+    def test_arithmetic(self):
+        self.assertEqual(binary("ADD", 7, -2), 5)
+        self.assertEqual(binary("SUB", 7, 9), -2)
+        self.assertEqual(binary("MUL", -7, 6), -42)
+        self.assertEqual(binary("MUL", 1 << 40, 1 << 40), 1 << 80)
+
+    def test_division_truncates_toward_zero(self):
+        for left, right, quotient in ((7, 2, 3), (-7, 2, -3), (7, -2, -3), (-7, -2, 3), (0, 5, 0)):
+            self.assertEqual(binary("DIV", left, right), quotient)
+        with self.assertRaisesRegex(vm.VMError, "Division by zero"):
+            binary("DIV", 1, 0)
+
+    def test_comparisons(self):
+        expected = {"GRT": (0, 0, 1), "LES": (1, 0, 0), "EQU": (0, 1, 0),
+                    "NEQ": (1, 0, 1), "GEQ": (0, 1, 1), "LEQ": (1, 1, 0)}
+        for opcode, results in expected.items():
+            self.assertEqual(tuple(binary(opcode, 3, right) for right in (4, 3, 2)), results, opcode)
+
+    def test_memory_and_jumps(self):
+        # Counts down from the input, printing each value above zero
+        code = program("STDIN", "POPM 7000",
+                       "LABEL", "PUSHM 7000", "PUSHI 0", "GRT", "JUMPZ 14",
+                       "PUSHM 7000", "STDOUT",
+                       "PUSHM 7000", "PUSHI 1", "SUB", "POPM 7000", "JUMP 2",
+                       "PUSHI 99", "STDOUT")
+        self.assertEqual(vm.run(code, [4]), [4, 3, 2, 1, 99])
+        machine = vm.VM(code, iter([2]).__next__, lambda value: None)
+        steps = machine.run()
+        self.assertEqual(machine.load(7000), 0)
+        self.assertEqual(steps, machine.steps)
+        self.assertGreater(steps, len(code))
+
+    def test_input_and_output(self):
+        written = []
+        inputs = iter([5, 6])
+        vm.VM(program("STDIN", "STDIN", "MUL", "STDOUT"), lambda: next(inputs), written.append).run()
+        self.assertEqual(written, [30])
+        with self.assertRaisesRegex(vm.VMError, "Out of input at instruction 1"):
+            vm.run(program("STDIN", "STDIN", "ADD", "STDOUT"), [1])
+
+    def test_call_and_return(self):
+        # A RET with no call in progress ends the program
+        code = program("CALL 4", "CALL 4", "PUSHI 3", "RET",
+                       "PUSHI 1", "STDOUT", "RET")
+        self.assertEqual(vm.run(code), [1, 1])
+
+    def test_call_depth_limit(self):
+        with self.assertRaisesRegex(vm.VMError, "Call stack overflow at instruction 0"):
+            vm.run(program("CALL 0"))
+        # As many calls in progress as the limit allows is fine
+        depth = vm.CALL_DEPTH_LIMIT
+        code = program("PUSHI 0", "POPM 7000", "CALL 4", "RET",
+                       "PUSHM 7000", "PUSHI 1", "ADD", "POPM 7000",
+                       "PUSHM 7000", f"PUSHI {depth}", "LES", "JUMPZ 14", "CALL 4", "RET",
+                       "PUSHM 7000", "STDOUT", "RET")
+        self.assertEqual(vm.run(code), [depth])
+
+    def test_bad_programs(self):
+        with self.assertRaisesRegex(vm.VMError, "Stack underflow at instruction 1"):
+            vm.run(program("PUSHI 1", "ADD"))
+        with self.assertRaisesRegex(vm.VMError, "Address 6999 below 7000 at instruction 0"):
+            vm.VM(program("PUSHM 6999"))
+        with self.assertRaisesRegex(vm.VMError, "Jump target 3 out of range at instruction 0"):
+            vm.VM(program("JUMP 3", "RET"))
+        with self.assertRaisesRegex(vm.VMError, "Unknown instruction at 0: PUSH 1"):
+            vm.VM(program("PUSH 1"))
+
+    def test_compiled_program(self):
+        with open(SAMPLE, encoding='utf-8-sig') as input_f:
+            code, _ = assembly.compile_source(input_f.read())
+        self.assertEqual(vm.run(code), [5, 10, 15])
+
+
+if __name__ == "__main__":
+    unittest.main()
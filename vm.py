@@ -0,0 +1,174 @@
+# Stack machine that runs the code generated by assembly.Parser.
+#
+# A program is decoded once into (opcode, operand) pairs with memory operands
+# already turned into offsets into a flat memory list starting at the first
+# address SymbolTable hands out, then executed by a single dispatch loop.
+# CALL keeps its return address on a stack of its own, and a RET with nothing
+# on that stack ends the program.
+
+import sys
+
+from assembly import MEMORY_BASE, Op, jump_opcodes, memory_opcodes, opcode_names, operand_opcodes
+
+# Calls that can be in progress at once
+CALL_DEPTH_LIMIT = 1 << 16
+
+opcodes_by_name = {name: opcode for opcode, name in opcode_names.items()}
+
+
+class VMError(Exception):
+    pass
+
+
+def divide(left, right):
+    # Integer division truncating toward zero
+    if right == 0:
+        raise VMError("Division by zero")
+    quotient = abs(left) // abs(right)
+    return quotient if (left < 0) == (right < 0) else -quotient
+
+
+def decode(program):
+    # Accepts a Code object or Parser.assembly_code style (index, text) pairs
+    if hasattr(program, 'opcodes'):
+        return list(zip(program.opcodes, program.operands))
+    instructions = []
+    for index, text in program:
+        name, _, operand = text.partition(' ')
+        if name not in opcodes_by_name:
+            raise VMError(f"Unknown instruction at {index}: {text}")
+        opcode = opcodes_by_name[name]
+        instructions.append((opcode, int(operand) if opcode in operand_opcodes and operand else 0))
+    return instructions
+
+
+def read_stdin():
+    # Integers separated by whitespace, read a line at a time as they are needed
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            return
+        for word in line.split():
+            yield int(word)
+
+
+class VM:
+    def __init__(self, program, read=None, write=None, memory_base=MEMORY_BASE):
+        # read() returns the next input integer, write(value) outputs one
+        instructions = decode(program)
+        self.memory_base = memory_base
+        highest = memory_base - 1
+        for index, (opcode, operand) in enumerate(instructions):
+            if opcode in memory_opcodes:
+                if operand < memory_base:
+                    raise VMError(f"Address {operand} below {memory_base} at instruction {index}")
+                highest = max(highest, operand)
+                instructions[index] = (opcode, operand - memory_base)
+            elif opcode in jump_opcodes and not 0 <= operand <= len(instructions):
+                raise VMError(f"Jump target {operand} out of range at instruction {index}")
+        self.instructions = instructions
+        self.memory = [0] * (highest - memory_base + 1)
+        if read is None:
+            inputs = read_stdin()
+            read = lambda: next(inputs)
+        self.read = read
+        self.write = write if write is not None else print
+        self.steps = 0
+
+    def load(self, address):
+        return self.memory[address - self.memory_base]
+
+    def run(self):
+        # Returns the number of instructions executed
+        instructions = self.instructions
+        memory = self.memory
+        read = self.read
+        write = self.write
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        calls = []
+        end = len(instructions)
+
+        PUSHI, PUSHM, POPM, STDOUT, STDIN = Op.PUSHI.value, Op.PUSHM.value, Op.POPM.value, Op.STDOUT.value, Op.STDIN.value
+        ADD, SUB, MUL, DIV = Op.ADD.value, Op.SUB.value, Op.MUL.value, Op.DIV.value
+        GRT, LES, EQU, NEQ, GEQ, LEQ = Op.GRT.value, Op.LES.value, Op.EQU.value, Op.NEQ.value, Op.GEQ.value, Op.LEQ.value
+        JUMPZ, JUMP, CALL, RET = Op.JUMPZ.value, Op.JUMP.value, Op.CALL.value, Op.RET.value
+
+        pc = 0
+        steps = 0
+        try:
+            while pc < end:
+                opcode, operand = instructions[pc]
+                pc += 1
+                steps += 1
+                if opcode == PUSHM:
+                    push(memory[operand])
+                elif opcode == PUSHI:
+                    push(operand)
+                elif opcode == POPM:
+                    memory[operand] = pop()
+                elif opcode == JUMPZ:
+                    if pop() == 0:
+                        pc = operand
+                elif opcode == JUMP:
+                    pc = operand
+                elif opcode == ADD:
+                    right = pop()
+                    stack[-1] += right
+                elif opcode == SUB:
+                    right = pop()
+                    stack[-1] -= right
+                elif opcode == MUL:
+                    right = pop()
+                    stack[-1] *= right
+                elif opcode == DIV:
+                    right = pop()
+                    stack[-1] = divide(stack[-1], right)
+                elif opcode == LES:
+                    right = pop()
+                    stack[-1] = 1 if stack[-1] < right else 0
+                elif opcode == GRT:
+                    right = pop()
+                    stack[-1] = 1 if stack[-1] > right else 0
+                elif opcode == EQU:
+                    right = pop()
+                    stack[-1] = 1 if stack[-1] == right else 0
+                elif opcode == NEQ:
+                    right = pop()
+                    stack[-1] = 1 if stack[-1] != right else 0
+                elif opcode == LEQ:
+                    right = pop()
+                    stack[-1] = 1 if stack[-1] <= right else 0
+                elif opcode == GEQ:
+                    right = pop()
+                    stack[-1] = 1 if stack[-1] >= right else 0
+                elif opcode == CALL:
+                    if len(calls) == CALL_DEPTH_LIMIT:
+                        raise VMError(f"Call stack overflow at instruction {pc - 1}")
+                    calls.append(pc)
+                    pc = operand
+                elif opcode == RET:
+                    if not calls:
+                        break
+                    pc = calls.pop()
+                elif opcode == STDOUT:
+                    write(pop())
+                elif opcode == STDIN:
+                    push(read())
+                # LABEL is a no-op
+        except IndexError:
+            raise VMError(f"Stack underflow at instruction {pc - 1}") from None
+        except StopIteration:
+            raise VMError(f"Out of input at instruction {pc - 1}") from None
+        finally:
+            self.steps += steps
+        return steps
+
+
+def run(program, inputs=()):
+    # Runs a program on a list of inputs and returns the list of outputs
+    inputs = iter(inputs)
+    outputs = []
+    VM(program, lambda: next(inputs), outputs.append).run()
+    return outputs